@@ -1,127 +1,91 @@
 import streamlit as st
 
 import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
+from processData import access, connections, engine, queries, regimes, snapshot, store
+from processData.arrayFigures import buildArrayFigures, buildArrayPanel
+from processData.derived import addDerivedColumns, derivedMetrics
+from processData.figures import figureCache
+from processData.outliers import groupings, methods, outlierMask, sdWidth
+from processData.towers import towerIndex
+from processData.widgets import dateRangeInput, loadingProgress, pageControls, refreshControls, rerunTimer, timingPanel
 
 
 # Set Page Con
 st.set_page_config(page_title="General Analysis Dashboard", layout="wide")
 
+# Named timing spans for this rerun, shown in the sidebar "Timing Debug" panel
+timer = rerunTimer("Array Tracking")
+
 # Display text if data is not loaded
-if 'df' not in st.session_state:
+if 'dataKey' not in st.session_state:
     st.error("Error: Please Load Data")
 
 
 
-# For Setting up Graph Color Values: 
-
-# Complementary color pairs dictionary (limited to 6)
-colorPairs = {
-    "red": "#8B0000",       # Dark Red
-    "green": "#006400",     # Dark Green
-    "blue": "#00008B",      # Dark Blue
-    "orange": "#FF8C00",    # Dark Orange
-    "purple": "#4B0082",    # Indigo (dark purple)
-    "yellow": "#CCCC00",    # Dark Yellow
-}
-
-# Function to convert hex to RGBA
-def hex_to_rgba(hex_code, opacity):
-    hex_code = hex_code.lstrip('#')
-    rgb = tuple(int(hex_code[i:i+2], 16) for i in (0, 2, 4))
-    return f'rgba({rgb[0]}, {rgb[1]}, {rgb[2]}, {opacity})'
-
-
-# Initial Color List
-colorList = [
-    "#DC143C",  # Crimson
-    "#32CD32",  # Lime Green
-    "#4169E1",  # Royal Blue
-    "#FF7F50",  # Coral
-    "#DA70D6",  # Orchid
-    "#FFD700",  # Gold
-    "#FF4500",  # Orange Red
-    "#8A2BE2",  # Blue Violet
-    "#00CED1",  # Dark Turquoise
-    "#ADFF2F"   # Green Yellow
-]
-
-# Opposite color for all
-oppositeColor = "#008080"  # Teal
-
-
-# Function to get the complementary color
-def get_complementary_color(color):
-    return colorPairs.get(color, "black")
-
-
-def noOutliers(df, cols):
-    for i in cols:
-        tempmean = np.mean(df[i])
-        tempsd = np.std(df[i])
-
-        tempUpper = tempmean + (3 * tempsd)
-        tempLower = tempmean - (3 * tempsd)
-        
-        #Potentially df[df[xValue] < xUpperLim & df[xValue] >= max(xLowerLim, 0)]
-        df = df[(df[i] < tempUpper) & (df[i] >= max(tempLower, 0))]
+# Check if Df exists, then we can start running code.
+if "dataKey" in st.session_state:
 
-    return df
+    # Connection from the shared pool (None when running offline from the local snapshot)
+    conn = connections.acquire()
 
-# Check if Df exists, then we can start running code.
-if "fullDf" in st.session_state:
+    # Pull new cycles into the loaded data (manually or on an interval)
+    refreshControls(conn, st.session_state.tableColumns)
     
-    fullDf = st.session_state.fullDf
+    # Version read before the frame, so a refresh in between makes the next rerun catch up instead of being missed
+    dataKey = st.session_state.dataKey
+    dataVersion = access.dataVersion(dataKey)
+
+    # Shared frame from the process-wide cache (read only, the session only holds its key)
+    with timer.span("SQL fetch") as span:
+        fullDf = access.getFrame(conn, dataKey, st.session_state.tableColumns)
+        span["rows"] = len(fullDf)
 
     outliers = st.sidebar.checkbox("Include Outliers (+/-3 SD)?", value = False)
+    outlierMethod = st.sidebar.selectbox("Outlier Method", list(methods), help = "\n\n".join(f"{name}: {text}" for name, text in methods.items()))
+    outlierGroups = st.sidebar.selectbox("Outlier Limits", list(groupings))
 
+    # Cached mask (until the data changes), the tower index below only holds the rows it keeps
+    keep = None
     if not outliers:
-        fullDf = noOutliers(fullDf, ["CO2_Fox_g"])
+        with timer.span("filtering", rows=len(fullDf)):
+            keep = outlierMask(fullDf, ["CO2_Fox_g"], outlierMethod, groupings[outlierGroups], cacheKey=(dataKey, dataVersion))
+
+    # Rows sorted by tower and time with their New_CycleNum counters, built once per data version
+    # (a refresh only merges in the new rows of the towers that got some)
+    with timer.span("tower index", rows=len(fullDf)):
+        towerIdx = towerIndex((dataKey, dataVersion), fullDf, keep, filterKey=(outliers, outlierMethod, outlierGroups),
+                              appendOnly=access.changedTowers(dataKey) is not None)
+
+    # Only the cycles of a date range (each tower's rows are in time order, so it is a binary search per tower)
+    dateWindow = None
+    if towerIdx.span is not None:
+        dateWindow = dateRangeInput("Date Range", towerIdx.span, key = "arrayDateWindow")
+        if dateWindow == towerIdx.span:
+            dateWindow = None
 
     purityVals = st.sidebar.checkbox("Purity Corrected Arrays", value = True)
 
     # Setting up array-specific (Select if we want only purity-corrected Arrays)
     if purityVals:
-        arrayList = fullDf.query("DAC_CO2_Percent > 1")["DAC_TowerName"].unique()
-        CO2Col = st.sidebar.selectbox("Specify CO2 Data Type", ["CO2 Production Purity-Corrected (kg/hr)", "CO2 Production Purity-Corrected (T/Y)", "CO2 Production (kg/hr)", "CO2 Production (T/Y)"])
+        arrayList = [tower for tower in towerIdx.towers if tower in towerIdx.purityTowers]
+        co2Cols = ["CO2 Production Purity-Corrected (kg/hr)", "CO2 Production Purity-Corrected (T/Y)", "CO2 Production (kg/hr)", "CO2 Production (T/Y)"]
     else:
-        arrayList = fullDf["DAC_TowerName"].unique()
-        CO2Col = st.sidebar.selectbox("Specify CO2 Data Type", ["CO2 Production (kg/hr)", "CO2 Production (T/Y)"])
-
+        arrayList = towerIdx.towers
+        co2Cols = ["CO2 Production (kg/hr)", "CO2 Production (T/Y)"]
+    CO2Col = st.sidebar.selectbox("Specify CO2 Data Type", co2Cols)
 
-    # Editing dataframe so it has newly created values 
-    byArrayDf = fullDf.sort_values(["DAC_TowerName", "ProdDate", "ProdTime"])
-
-    # Updating the dataframe such that a counter resets everytime dac_towername changes
-    byArrayDf = byArrayDf.assign(count=byArrayDf.groupby(byArrayDf.DAC_TowerName.ne(byArrayDf.DAC_TowerName.shift()).cumsum()).cumcount().add(1)).rename(columns={"count":"New_CycleNum"})
 
     # Selecting multiple arrays for graphing
     currentArray = st.sidebar.multiselect("Select Array Names", arrayList)
 
-    currentArrayDf = byArrayDf[byArrayDf["DAC_TowerName"].isin(currentArray)]
-    
-    # Change Facet Wrap depending on amount of arrays chosen
-    facWrap = 1
-    if len(currentArray) > 5:
-        facWrap = 2
+    # Panels/figures are only built for one page of the picked towers (the rest aren't sent to the browser)
+    # Towers keep their color when paging, it comes from their place in the whole selection
+    currentArray = sorted(currentArray)
+    pageArrays = pageControls(currentArray, "Arrays", 2, "arrayPanels")
 
     # Make condition so we don't get no currentArray error
-    if len(currentArray) > 0:
-        # Change subplot number based on length of array
-        specs = []
-        titles = []
-
-        for i in currentArray:
-            specs.append([{"secondary_y": True}])
-            titles.append(i)
-        figScatter = make_subplots(rows = len(currentArray), cols = 1, specs=specs, subplot_titles = titles)
-        figBar = make_subplots(rows = len(currentArray), cols = 1, specs=specs, subplot_titles = titles)
-        rhBar = make_subplots(rows = len(currentArray), cols = 1, specs=specs, subplot_titles = titles)
-    else:
+    if len(currentArray) == 0:
         st.write("Please Specify Array(s)")
 
 
@@ -131,114 +95,138 @@ if "fullDf" in st.session_state:
     # Specifying third line to have running through graph
     secondAxis = st.sidebar.selectbox("Specify second y-axis value:", index = list(st.session_state.colNames).index("AirRelHumid_In"), options = st.session_state.colNames)
 
-    rowIdx = 0
-
-    # Getting list of RH Regimes
-    rhRegimes = np.arange(0, 101, 5)
-    rhPairs = pd.IntervalIndex.from_breaks(rhRegimes, closed='left')
-
-    if len(currentArray) > 0:
-        for tower_name, singleArrayDf in currentArrayDf.groupby('DAC_TowerName'):
-
-            #rowIdx, if 10+, set back to 0
-            colorIdx = rowIdx % 10
-
-            rowIdx += 1
-
-            # Setting up RH Regime table
-            singleArrayDf["AirRelBins"] = pd.cut(singleArrayDf["AirRelHumid_In"], bins=rhRegimes, labels = rhPairs).astype(str)
-
-            regimeTbl = singleArrayDf[["AirRelBins", CO2Col]].groupby("AirRelBins").agg("mean")
-            regimeTbl = regimeTbl.rename(columns = {"AirRelBins" : "RH Regime", CO2Col : "Average " + CO2Col}).reset_index()
-
-            # Get units for column name
-            unitVal = CO2Col.split(" ")[-1]
-
-            regimeTbl.columns = ["RH Regime",  "Average " + CO2Col]
-
-            regimeVisual = go.Figure(data=[go.Table(
-                header=dict(values=["<b>RH Regime</b>",  f"<b>Average  CO2 {unitVal}</b>"],
-                            fill_color=hex_to_rgba(colorList[colorIdx], .9),
-                            align='center',
-                            font=dict(size=13, color='black')),
-                cells=dict(values=[regimeTbl["RH Regime"], np.round(regimeTbl["Average " + CO2Col], 2)],
-                        fill_color=[[hex_to_rgba(colorList[colorIdx], .3) if i%2 == 0 else 'white' for i in range(len(regimeTbl["RH Regime"]))]],
-                        align='center',
-                        font=dict(size=12, color='black'))
-            )])
-
-            regimeVisual.update_layout(height = 400, width = 400)
-            with col1:
-                st.plotly_chart(regimeVisual)
-
-
-            # Adding RH Regime Bar Traces
-            rhBar.add_trace(go.Bar(x = regimeTbl["RH Regime"], y = regimeTbl["Average " + CO2Col], marker=dict(color = colorList[colorIdx]), name = tower_name + " CO2", legendgroup = rowIdx), row = rowIdx, col = 1, secondary_y = False)
-            rhBar.update_yaxes(title_text=CO2Col, row=rowIdx, col=1, titlefont=dict(color="black"),tickfont=dict(color="black"))
-            rhBar.update_xaxes(title_text=f"RH Regime", row=rowIdx, col=1)
-
-
-
-            
+    # Column and width of the regimes the CO2 averages are split into (5% RH regimes by default)
+    regimeCol = st.sidebar.selectbox("Regime Column", index = list(st.session_state.colNames).index(regimes.defaultBinColumn), options = st.session_state.colNames)
+    regimeWidth = st.sidebar.number_input("Regime Width", min_value = 0.001, value = float(regimes.defaultBinWidth))
+    regimeTitle = "RH Regime" if regimeCol == regimes.defaultBinColumn else regimeCol + " Regime"
+
+    # Main page only selects the columns it needs, so pull the second axis/regime column from SQL the first time it is picked
+    # (derived columns are calculated from what is loaded instead)
+    missingCols = [col for col in [secondAxis, regimeCol] if col not in fullDf.columns and col not in derivedMetrics]
+    if missingCols:
+        with loadingProgress() as progress, timer.span("SQL fetch"):
+            customers, columns = st.session_state.dataKey[:2]
+            st.session_state.dataKey = access.loadData(conn, customers, list(columns) + missingCols, st.session_state.tableColumns, progress=progress,
+                                                       window=access.keyWindow(st.session_state.dataKey))
+        st.rerun()
+
+    if regimeCol in fullDf.columns and not pd.api.types.is_numeric_dtype(fullDf[regimeCol]):
+        st.sidebar.error("Regime Column has to be numeric, using " + regimes.defaultBinColumn)
+        regimeCol, regimeTitle = regimes.defaultBinColumn, "RH Regime"
+
+    # Widths that would split the loaded rows into more than regimes.maxBins regimes are widened (the SQL and worker
+    # pool summaries get the same width)
+    # (min/max of the column is worked out once per data version)
+    regimeSpan = regimes.cachedSpan((dataKey, dataVersion, regimeCol),
+                                    lambda: access.getFrame(conn, dataKey, st.session_state.tableColumns, columns = [regimeCol])[regimeCol].to_numpy())
+    cappedWidth = regimes.spanWidth(regimeSpan, regimeWidth)
+    if cappedWidth != regimeWidth:
+        st.sidebar.warning(f"A Regime Width of {regimeWidth:g} gives more than {regimes.maxBins} regimes, using {cappedWidth:g}")
+        regimeWidth = cappedWidth
+
+    # Summary tables/regime bars straight from SQL Server GROUP BY queries (raw rows are then only used for the per-cycle chart)
+    # SQL only has the mean/std based outlier filter
+    sqlSummaries = st.sidebar.checkbox("Summaries from SQL", value = False, disabled = conn is None)
+    if sqlSummaries and not outliers and outlierMethod != "3 SD":
+        st.sidebar.caption("Summaries from SQL only support the 3 SD outlier method, using the loaded rows")
+        sqlSummaries = False
+
+    # Shown towers' rows, outlier limits and regime cube worked out by the worker pool from the local snapshot
+    # (the snapshot can be behind the loaded rows until its next sync)
+    customers = list(dataKey[0])
+    poolAggregation = st.sidebar.checkbox("Aggregate in Worker Pool", value = False, disabled = sqlSummaries or not set(customers) <= set(snapshot.customers()),
+                                          help = "Reads the local snapshot of the loaded customers in separate processes")
+
+    poolRun = None
+    poolVersion = None
+    if poolAggregation and pageArrays:
+        poolVersion = snapshot.partsVersion(customers)
+        with timer.span("aggregation (worker pool)"):
+            poolRun = engine.cachedArrayPipeline((dataKey, poolVersion, outliers, outlierMethod, outlierGroups, tuple(pageArrays), dateWindow,
+                                                  tuple(co2Cols), secondAxis, regimeCol, regimeWidth),
+                                                 customers = customers, towers = pageArrays, co2Cols = co2Cols, regimeCol = regimeCol, regimeWidth = regimeWidth,
+                                                 limitColumns = () if outliers else ("CO2_Fox_g",), method = outlierMethod, groupBy = groupings[outlierGroups],
+                                                 extraColumns = [secondAxis], loadWindow = access.keyWindow(dataKey), dateWindow = dateWindow)
+        if poolRun.cube is None:
+            st.sidebar.caption("The snapshot has no rows of these arrays, using the loaded rows")
+            poolRun = poolVersion = None
+
+    # Only the shown towers' rows and the columns the panels read are copied out of the shared frame
+    arrayColumns = set(queries.neededColumns(co2Cols + [secondAxis, regimeCol], fullDf.columns)) | set(co2Cols + [secondAxis, regimeCol])
+    with timer.span("tower select") as span:
+        if poolRun is not None:
+            currentArrayDf = poolRun.towerFrame(pageArrays)
+        else:
+            currentArrayDf = towerIdx.select(fullDf, pageArrays, dateWindow, columns=[col for col in fullDf.columns if col in arrayColumns])
+        span["rows"] = len(currentArrayDf)
+
+    # CO2/second axis/regime derived columns, only for the shown arrays' rows
+    with timer.span("derivation", rows=len(currentArrayDf)):
+        currentArrayDf = addDerivedColumns(currentArrayDf, co2Cols + [secondAxis, regimeCol])
+
+    towerSummary = None
+    if sqlSummaries and pageArrays:
+        with timer.span("aggregation (SQL)"):
+            towerSummary, regimeCube = access.arraySummaries(conn, dataKey, pageArrays, co2Cols, regimeCol, regimeWidth,
+                                                             limitColumn = None if outliers else "CO2_Fox_g", sdWidth = sdWidth, limitGroupBy = groupings[outlierGroups], window = dateWindow)
+    elif poolRun is not None:
+        regimeCube = poolRun.cube
+    else:
+        # Mean/count/std of every CO2 column per (tower, regime) in one pass, so switching CO2Col doesn't recompute it
+        with timer.span("aggregation", rows=len(currentArrayDf)):
+            regimeCube = regimes.cachedRegimeCube((dataKey, dataVersion, outliers, outlierMethod, outlierGroups, tuple(pageArrays), dateWindow),
+                                                  currentArrayDf, co2Cols, regimeCol, regimeWidth)
 
-            cycNum = singleArrayDf["New_CycleNum"]
-            co2Prod = singleArrayDf[CO2Col]
-            seconAxVal = singleArrayDf[secondAxis]
+    # Cycle count/date range per customer of one tower (None works it out from the tower's rows)
+    def towerCustomers(tower_name):
+        if towerSummary is None:
+            return None
+        return towerSummary[towerSummary["DAC_TowerName"] == tower_name].set_index("CustomerName")[['Total Cycles', 'Start Date', 'End Date']]
 
+    # Everything the tower panels are built from: panels/figures are only rebuilt when one of these changes
+    # (the snapshot's parts when they come from the worker pool, a background sync changes those)
+    dataInputs = (dataKey, dataVersion, outliers, outlierMethod, outlierGroups, dateWindow, CO2Col, secondAxis, regimeCol, regimeWidth, sqlSummaries, poolVersion)
 
-            # Testing a specific by-
-            groupedTbl = singleArrayDf.groupby("CustomerName").agg({"CycleNumber": "count", "ProdDate": ["min","max"]})
+    if len(currentArray) > 0:
+        panels = []
 
-            groupedTbl.columns = ['Total Cycles', 'Start Date', 'End Date']
-            groupedVisual = go.Figure(data=[go.Table(
-                header=dict(values=["<b>Customer Name<b>", "<b>Total Cycles</b>",  f"<b>Start Date</b>", f"<b>End Date</b>"],
-                            fill_color=hex_to_rgba(colorList[colorIdx], .9),
-                            align='center',
-                            font=dict(size=13, color='black')),
-                cells=dict(values=[groupedTbl.index, groupedTbl["Total Cycles"], groupedTbl["Start Date"], groupedTbl["End Date"]],
-                        fill_color=[['#f5f5f5' if i%2 == 0 else 'white' for i in range(len(regimeTbl["RH Regime"]))]],
-                        align='center',
-                        font=dict(size=12, color='black'))
-            )])
-            groupedVisual.update_layout(height = 400, width = 400)
-            with col2:
-                st.plotly_chart(groupedVisual)
+        # Rows come out grouped by tower, each panel gets a slice of them
+        towerRows = store.groupSlices(currentArrayDf, "DAC_TowerName")
 
+        with timer.span("figure build", rows=len(currentArrayDf)):
+            # Same order the towers come out of a groupby
+            for rowIdx, tower_name in enumerate(pageArrays, start = 1):
 
-            # Add the Bar Graph Traces
-            figBar.add_trace(go.Bar(x = cycNum, y = co2Prod, name = tower_name + " CO2", marker=dict(color = colorList[colorIdx]), legendgroup = rowIdx), row = rowIdx, col = 1, secondary_y = False)
-            figBar.add_trace(go.Scatter(x = cycNum, y = seconAxVal, line = dict(color = oppositeColor), name = tower_name + " " + secondAxis, legendgroup = rowIdx), row = rowIdx, col = 1, secondary_y = True)
-            
-            # Give each a yaxis title
-            figBar.update_yaxes(title_text=CO2Col, row=rowIdx, col=1, titlefont=dict(color="black"),tickfont=dict(color="black"))
-            figBar.update_yaxes(title_text=secondAxis, row=rowIdx, col=1, secondary_y=True, titlefont=dict(color=oppositeColor),tickfont=dict(color=oppositeColor))
+                #Position in the whole selection, if 10+, set back to 0
+                colorIdx = currentArray.index(tower_name) % 10
 
-            # Give Each an xaxis title 
-            figScatter.update_xaxes(title_text=f"CycleNumber", row=rowIdx, col=1, titlefont=dict(color="black"),tickfont=dict(color="black"))
+                panel = figureCache.get("Array Panel", dataInputs + (tower_name, colorIdx, rowIdx),
+                    lambda: buildArrayPanel(currentArrayDf.iloc[towerRows.get(tower_name, slice(0, 0))], regimes.towerRegimes(regimeCube, tower_name, CO2Col), towerCustomers(tower_name),
+                                            tower_name, CO2Col, secondAxis, regimeTitle, colorIdx, rowIdx))
+                panels.append(panel)
 
-            figBar.update_xaxes(title_text=f"CycleNumber", row=rowIdx, col=1, titlefont=dict(color="black"),tickfont=dict(color="black"))
+            rhBar, figBar = figureCache.get("Array Figures", dataInputs + (tuple(pageArrays), tuple(currentArray.index(tower) % 10 for tower in pageArrays)),
+                lambda: buildArrayFigures(panels, pageArrays, CO2Col, secondAxis, regimeTitle))
 
-        
+        with timer.span("chart serialization"):
+            for panel in panels:
+                with col1:
+                    st.plotly_chart(panel["regimeVisual"])
+                with col2:
+                    st.plotly_chart(panel["groupedVisual"])
 
-        rhBar.update_layout(height = 400 * len(currentArray),
-        legend_tracegroupgap = 350,
-        legend_groupclick = "toggleitem")
+            # Separating charts into different columns
+            with col3:
+                st.plotly_chart(rhBar, autoscale = True)
+            with col4:
+                st.plotly_chart(figBar, autoscale = True)
 
-        figBar.update_layout(height = 400 * len(currentArray), yaxis2=dict(
-            title=secondAxis,
-            overlaying='y',
-            side='right',
-            titlefont=dict(color = "black"),
-            tickfont=dict(color = "black")
-        ),
-        legend_tracegroupgap = 350,
-        legend_groupclick = "toggleitem")
+    # How often each figure was rebuilt vs. reused across reruns (same numbers for every session on this server)
+    with st.sidebar.expander("Figure Cache Stats"):
+        st.json(figureCache.stats())
 
-        # Separating charts into different columns
-        with col3:
-            st.plotly_chart(rhBar, autoscale = True)
-        with col4:
-            st.plotly_chart(figBar, autoscale = True)
+# Span table/profile for this rerun in the sidebar
+timingPanel(timer)
 
 
 
@@ -0,0 +1 @@
+# Shared data access helpers for the dashboard pages (standardApp.py and pages/)
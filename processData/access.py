@@ -0,0 +1,340 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from processData import connections, ingest, queries, snapshot, store, timeindex
+from processData.cache import FrameCache
+from processData.derived import addDerivedColumns, derivedMetrics
+
+
+# Shared data access for both pages
+# Sessions only keep a key (customers, columns) in st.session_state, the frame itself lives once in sharedCache.
+
+# Cache limits: entries older than 30 min are re-queried, total cached frames are kept under 4 GB
+cacheTtlSeconds = 30 * 60
+cacheMaxBytes = 4 * 1024 ** 3
+
+# One lock per key so two sessions asking for the same data only run the query once
+_keyLocks = {}
+_keyLocksLock = threading.Lock()
+
+# Per key: data version (a new one every time rows are loaded or appended), towers touched by the last change
+# and the (ProdDate, ProdTime, CycleNumber) high-water mark per tower for incremental refreshes
+# Versions come from one process-wide counter, so a key that is evicted and loaded again never reuses an old version
+_versions = {}
+_changedTowers = {}
+_highWater = {}
+_versionCounter = itertools.count(1)
+
+
+# Per-key state goes with the key's frame once sharedCache drops it (locks still held or waited on are kept)
+def _forgetKey(key):
+    _versions.pop(key, None)
+    _changedTowers.pop(key, None)
+    _highWater.pop(key, None)
+
+    with _keyLocksLock:
+        lock = _keyLocks.get(key)
+        if lock is not None and lock.acquire(blocking=False):
+            del _keyLocks[key]
+            lock.release()
+
+
+sharedCache = FrameCache(maxBytes=cacheMaxBytes, ttl=cacheTtlSeconds, onEvict=_forgetKey)
+
+# Catalog lookups (customer names, table columns) barely change, so they are only re-queried after 10 min
+metadataTtlSeconds = 10 * 60
+
+# name -> (value, storedAt)
+_metadata = {}
+_metadataLock = threading.Lock()
+
+# SQL computed Array Tracking summaries kept (least recently used dropped first), inputs -> summaries
+maxSummaries = 64
+_summaries = OrderedDict()
+_summariesLock = threading.Lock()
+
+
+def _lockFor(key):
+    with _keyLocksLock:
+        return _keyLocks.setdefault(key, threading.RLock())
+
+
+def _cachedMetadata(name, load):
+    with _metadataLock:
+        entry = _metadata.get(name)
+        if entry is not None and time.monotonic() - entry[1] < metadataTtlSeconds:
+            return entry[0]
+
+    value = load()
+
+    with _metadataLock:
+        _metadata[name] = (value, time.monotonic())
+    return value
+
+
+# Customer names to choose from (from the local snapshot when SQL Server can't be reached)
+@connections.discardOnError
+def customerNames(conn):
+    if conn is None:
+        return snapshot.customers()
+    return _cachedMetadata("customerNames", lambda: list(pd.read_sql(sql=queries.customerNamesQuery, con=conn)["CustomerName"]))
+
+
+# Column names of ProcessDataPerIndex (from the local snapshot when SQL Server can't be reached)
+@connections.discardOnError
+def columnNames(conn):
+    if conn is None:
+        return snapshot.tableColumns()
+    return _cachedMetadata("columnNames", lambda: list(pd.read_sql(sql=queries.columnNamesQuery, con=conn)["COLUMN_NAME"]))
+
+
+# (first date, last date) of the ProdDates customers have (from the local snapshot when SQL Server can't be reached),
+# None when there are none
+@connections.discardOnError
+def dateSpan(conn, customers):
+    customers = tuple(sorted(set(customers)))
+    if not customers:
+        return None
+
+    def load():
+        if conn is None:
+            frame, _ = snapshot.readCustomers(list(customers), ["ProdDate", "ProdTime"])
+            return None if frame is None else timeindex.dateSpan(frame[ingest.timestampColumn].to_numpy(dtype="datetime64[ns]"))
+
+        sql, params = queries.buildDateSpanQuery(list(customers))
+        first, last = pd.read_sql(sql=sql, con=conn, params=params).iloc[0]
+        if pd.isna(first) or pd.isna(last):
+            return None
+        return pd.Timestamp(first).date(), pd.Timestamp(last).date()
+
+    return _cachedMetadata(("dateSpan", customers), load)
+
+
+# Array Tracking summaries computed by SQL Server (GROUP BY instead of aggregating fetched rows), kept per data version
+# Returns (tower/customer summary, regime cube), see queries.loadArraySummaries. With limitColumn the rows outside
+# its mean +/- sdWidth standard deviations (per limitGroupBy) are left out, like the pages' 3 SD outlier filter.
+@connections.discardOnError
+def arraySummaries(conn, key, towers, valueColumns, binColumn, binWidth, limitColumn=None, sdWidth=3, limitGroupBy=None, window=None):
+    inputs = (key, dataVersion(key), tuple(towers), tuple(valueColumns), binColumn, binWidth, limitColumn, sdWidth, limitGroupBy, window)
+
+    with _summariesLock:
+        if inputs in _summaries:
+            _summaries.move_to_end(inputs)
+            return _summaries[inputs]
+
+    # Limits come from every loaded ProdDate (like the in-memory filter), the summaries only from window
+    limits = queries.loadSdLimits(conn, list(key[0]), limitColumn, sdWidth, limitGroupBy, keyWindow(key)) if limitColumn else None
+    summaries = queries.loadArraySummaries(conn, list(key[0]), list(towers), list(valueColumns), binColumn, binWidth,
+                                           limitColumn, limits, limitGroupBy, window or keyWindow(key))
+
+    with _summariesLock:
+        _summaries[inputs] = summaries
+        while len(_summaries) > maxSummaries:
+            _summaries.popitem(last=False)
+
+    return summaries
+
+
+# Key for a customer set / requested column set (order doesn't matter for either)
+# window (first date, last date) is added as a third part for data that only holds those ProdDates
+def makeKey(customers, requested, tableColumns, window=None):
+    columns = queries.neededColumns(requested, tableColumns)
+    key = (tuple(sorted(set(customers))), tuple(sorted(columns)))
+    return key if window is None else key + (tuple(window),)
+
+
+# ProdDate window of the data behind key (None when it holds every date)
+def keyWindow(key):
+    return key[2] if len(key) > 2 else None
+
+
+# Whether the data behind key already holds exactly these customers (and date window) and at least these columns
+def covers(key, customers, requested, tableColumns, window=None):
+    if key is None:
+        return False
+    wanted = makeKey(customers, requested, tableColumns, window)
+    return key[0] == wanted[0] and set(wanted[1]).issubset(key[1]) and keyWindow(key) == keyWindow(wanted)
+
+
+# Best starting point for building key from what is already cached: the entry sharing the most customers
+# (entries that hold every needed column win ties), cut down to the wanted customers
+def _cachedBase(key):
+    customers, columns = set(key[0]), set(key[1])
+    best, bestScore = None, (0, False)
+
+    for cachedKey, frame in sharedCache.items():
+        if keyWindow(cachedKey) != keyWindow(key):
+            continue
+        overlap = len(customers.intersection(cachedKey[0]))
+        score = (overlap, columns.issubset(cachedKey[1]))
+        if overlap and score > bestScore:
+            best, bestScore = (cachedKey, frame), score
+
+    if best is None:
+        return None
+
+    cachedKey, frame = best
+    if set(cachedKey[0]).issubset(customers):
+        return frame
+    return frame[frame["CustomerName"].isin(customers)]
+
+
+# Make sure the data for customers/requested columns is cached and return its key
+# currentKey (the session's key) is kept as long as it still covers what is asked for
+# progress(rowsRead, totalRows) is called while rows stream in from SQL
+@connections.discardOnError
+def loadData(conn, customers, requested, tableColumns, currentKey=None, progress=None, window=None):
+    if covers(currentKey, customers, requested, tableColumns, window) and sharedCache.peek(currentKey) is not None:
+        return currentKey
+
+    key = makeKey(customers, requested, tableColumns, window)
+    getFrame(conn, key, tableColumns, progress)
+
+    return key
+
+
+# Frame behind key, shared between sessions (treat it as read only), loading it if it was evicted
+# Derived columns in columns are calculated the first time they are asked for and kept on the cached frame
+@connections.discardOnError
+def getFrame(conn, key, tableColumns, progress=None, columns=()):
+    frame = sharedCache.get(key)
+    if frame is None:
+        frame = _loadFrame(conn, key, tableColumns, progress)
+
+    return _withDerived(key, frame, columns)
+
+
+def _withDerived(key, frame, columns):
+    if all(col in frame.columns or col not in derivedMetrics for col in columns):
+        return frame
+
+    with _lockFor(key):
+        # A refresh or another session's derived columns may have replaced the cached frame while we waited
+        cached = sharedCache.peek(key)
+        if cached is not None:
+            frame = cached
+
+        newFrame = addDerivedColumns(frame, list(columns))
+        if newFrame is not frame:
+            sharedCache.put(key, newFrame)
+
+    return newFrame
+
+
+# Load the raw columns for key (from the cache, the snapshot and SQL) into the shared cache
+def _loadFrame(conn, key, tableColumns, progress):
+    with _lockFor(key):
+        # Another session may have loaded it while we waited
+        frame = sharedCache.peek(key)
+        if frame is not None:
+            return frame
+
+        # Rows for customers another session already loaded come out of the cache, then the local snapshot,
+        # only the rest is queried
+        base = _cachedBase(key)
+        cachedCustomers = set(base["CustomerName"].unique()) if base is not None else set()
+
+        snapDf, snapCustomers = snapshot.readCustomers([customer for customer in key[0] if customer not in cachedCustomers], list(key[1]))
+        if snapDf is not None:
+            if keyWindow(key) is not None:
+                snapDf = snapDf[windowMask(snapDf, keyWindow(key))].reset_index(drop=True)
+            base = ingest.concatFrames([base, snapDf])
+
+        # Background sync keeps these customers in the snapshot from now on
+        snapshot.trackCustomers(key[0])
+
+        if conn is None:
+            # Offline: whatever the cache/snapshot holds is all we get
+            if base is None:
+                raise ValueError("SQL Server unreachable and no local snapshot for " + ", ".join(key[0]))
+            frame = base[[col for col in base.columns if col in set(tableColumns) or col == ingest.timestampColumn]]
+        else:
+            frame = queries.loadProcessData(conn, list(key[0]), list(key[1]), tableColumns, existingDf=base, progress=progress, window=keyWindow(key))
+
+        # Customers' rows back to back in time order, so selecting one is a slice of the frame
+        frame = store.arrange(frame)
+        sharedCache.put(key, frame)
+        _highWater.pop(key, None)
+
+        # Snapshot can be up to a sync interval behind SQL, catch up the same way a refresh does
+        if snapCustomers and conn is not None:
+            refreshData(conn, key, tableColumns)
+            frame = sharedCache.peek(key)
+
+        _versions[key] = next(_versionCounter)
+        _changedTowers[key] = None
+
+    return frame
+
+
+# Rows of frame whose timestamp falls on the dates of window (first date, last date)
+def windowMask(frame, window):
+    low, high = timeindex.windowBounds(window)
+    stamps = frame[ingest.timestampColumn].to_numpy()
+    return (stamps >= low) & (stamps < high)
+
+
+# Cache frame as a fresh load of key (for frames put together outside getFrame, like a background load)
+def storeFrame(key, frame):
+    with _lockFor(key):
+        sharedCache.put(key, store.arrange(frame))
+        _highWater.pop(key, None)
+        _versions[key] = next(_versionCounter)
+        _changedTowers[key] = None
+
+
+# Version of the data behind key, anything cached off the frame (figures, indexes, ...) is stale once it changes
+def dataVersion(key):
+    return _versions.get(key, 0)
+
+
+# Towers that got new rows in the last refresh of key, when the rows were only appended (None means everything was
+# (re)loaded or the rows moved)
+def changedTowers(key):
+    return _changedTowers.get(key)
+
+
+# Append rows newer than each tower's high-water mark to the cached frame, returns the towers that got new rows
+# Derived columns the frame already has are only calculated for the new rows, the rest of the frame is reused as is
+@connections.discardOnError
+def refreshData(conn, key, tableColumns, progress=None):
+    if conn is None:
+        # Offline, nothing newer to get
+        return []
+
+    with _lockFor(key):
+        frame = sharedCache.peek(key)
+        if frame is None:
+            # Expired/evicted, a normal load already gets everything
+            getFrame(conn, key, tableColumns, progress)
+            return None
+
+        marks = _highWater.get(key)
+        if marks is None:
+            marks = queries.highWaterMarks(frame)
+
+        newDf = queries.loadNewRows(conn, list(key[0]), list(key[1]), marks, progress, keyWindow(key))
+        if newDf.empty:
+            _highWater[key] = marks
+            return []
+
+        newDf = addDerivedColumns(newDf, [col for col in frame.columns if col in derivedMetrics])
+        appended = ingest.concatFrames([frame, newDf[frame.columns]])
+
+        # Customers' rows stay back to back in time order, new rows of any customer but the last one move rows around
+        frame = store.arrange(appended)
+        sharedCache.put(key, frame)
+
+        # New rows are past the old marks, so their own last rows are the new marks for those towers
+        newMarks = queries.highWaterMarks(newDf)
+        _highWater[key] = pd.concat([marks.drop(newMarks.index, errors="ignore"), newMarks])
+
+        towers = list(newMarks.index)
+        _versions[key] = next(_versionCounter)
+        _changedTowers[key] = towers if frame is appended else None
+
+    return towers
@@ -0,0 +1,158 @@
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+
+# Array Tracking figures: per tower tables/traces and the subplot figures they are put in
+# Shared by the Array Tracking page and the batch reports (processData.reports), so both draw the same charts.
+
+# For Setting up Graph Color Values: 
+
+# Complementary color pairs dictionary (limited to 6)
+colorPairs = {
+    "red": "#8B0000",       # Dark Red
+    "green": "#006400",     # Dark Green
+    "blue": "#00008B",      # Dark Blue
+    "orange": "#FF8C00",    # Dark Orange
+    "purple": "#4B0082",    # Indigo (dark purple)
+    "yellow": "#CCCC00",    # Dark Yellow
+}
+
+# Function to convert hex to RGBA
+def hex_to_rgba(hex_code, opacity):
+    hex_code = hex_code.lstrip('#')
+    rgb = tuple(int(hex_code[i:i+2], 16) for i in (0, 2, 4))
+    return f'rgba({rgb[0]}, {rgb[1]}, {rgb[2]}, {opacity})'
+
+
+# Initial Color List
+colorList = [
+    "#DC143C",  # Crimson
+    "#32CD32",  # Lime Green
+    "#4169E1",  # Royal Blue
+    "#FF7F50",  # Coral
+    "#DA70D6",  # Orchid
+    "#FFD700",  # Gold
+    "#FF4500",  # Orange Red
+    "#8A2BE2",  # Blue Violet
+    "#00CED1",  # Dark Turquoise
+    "#ADFF2F"   # Green Yellow
+]
+
+# Opposite color for all
+oppositeColor = "#008080"  # Teal
+
+
+# Function to get the complementary color
+def get_complementary_color(color):
+    return colorPairs.get(color, "black")
+
+
+# Cycle count/date range per customer of one tower's rows
+def customerTable(singleArrayDf):
+    groupedTbl = singleArrayDf.groupby("CustomerName", observed=True).agg({"CycleNumber": "count", "ProdDate": ["min","max"]})
+
+    groupedTbl.columns = ['Total Cycles', 'Start Date', 'End Date']
+    return groupedTbl
+
+
+# Tables and traces for one tower (rowIdx is its subplot row), cached per tower so adding an array only builds that one
+# regimeTbl is the tower's slice of the regime cube for CO2Col (mean/count/std per regime), groupedTbl its cycle
+# count/date range per customer (worked out from singleArrayDf when it is None)
+def buildArrayPanel(singleArrayDf, regimeTbl, groupedTbl, tower_name, CO2Col, secondAxis, regimeTitle, colorIdx, rowIdx):
+
+    # Get units for column name
+    unitVal = CO2Col.split(" ")[-1]
+
+    regimeVisual = go.Figure(data=[go.Table(
+        header=dict(values=[f"<b>{regimeTitle}</b>",  f"<b>Average  CO2 {unitVal}</b>", "<b>Cycles</b>"],
+                    fill_color=hex_to_rgba(colorList[colorIdx], .9),
+                    align='center',
+                    font=dict(size=13, color='black')),
+        cells=dict(values=[regimeTbl.index, np.round(regimeTbl["mean"], 2), regimeTbl["count"]],
+                fill_color=[[hex_to_rgba(colorList[colorIdx], .3) if i%2 == 0 else 'white' for i in range(len(regimeTbl))]],
+                align='center',
+                font=dict(size=12, color='black'))
+    )])
+
+    regimeVisual.update_layout(height = 400, width = 400)
+
+
+    # RH Regime Bar Trace
+    rhTrace = go.Bar(x = regimeTbl.index, y = regimeTbl["mean"], error_y = dict(type = "data", array = regimeTbl["std"], visible = False), marker=dict(color = colorList[colorIdx]), name = tower_name + " CO2", legendgroup = rowIdx)
+
+
+    cycNum = singleArrayDf["New_CycleNum"]
+    co2Prod = singleArrayDf[CO2Col]
+    seconAxVal = singleArrayDf[secondAxis]
+
+
+    # Testing a specific by-
+    if groupedTbl is None:
+        groupedTbl = customerTable(singleArrayDf)
+    groupedVisual = go.Figure(data=[go.Table(
+        header=dict(values=["<b>Customer Name<b>", "<b>Total Cycles</b>",  f"<b>Start Date</b>", f"<b>End Date</b>"],
+                    fill_color=hex_to_rgba(colorList[colorIdx], .9),
+                    align='center',
+                    font=dict(size=13, color='black')),
+        cells=dict(values=[groupedTbl.index, groupedTbl["Total Cycles"], groupedTbl["Start Date"], groupedTbl["End Date"]],
+                fill_color=[['#f5f5f5' if i%2 == 0 else 'white' for i in range(len(regimeTbl))]],
+                align='center',
+                font=dict(size=12, color='black'))
+    )])
+    groupedVisual.update_layout(height = 400, width = 400)
+
+
+    # The Bar Graph Traces
+    co2Trace = go.Bar(x = cycNum, y = co2Prod, name = tower_name + " CO2", marker=dict(color = colorList[colorIdx]), legendgroup = rowIdx)
+    secondTrace = go.Scatter(x = cycNum, y = seconAxVal, line = dict(color = oppositeColor), name = tower_name + " " + secondAxis, legendgroup = rowIdx)
+
+    return {"regimeVisual": regimeVisual, "groupedVisual": groupedVisual, "rhTrace": rhTrace, "co2Trace": co2Trace, "secondTrace": secondTrace}
+
+
+# Regime bars and CO2/second axis bars with one subplot row per tower panel
+def buildArrayFigures(panels, currentArray, CO2Col, secondAxis, regimeTitle):
+    # Change subplot number based on length of array
+    specs = []
+    titles = []
+
+    for i in currentArray:
+        specs.append([{"secondary_y": True}])
+        titles.append(i)
+    figBar = make_subplots(rows = len(currentArray), cols = 1, specs=specs, subplot_titles = titles)
+    rhBar = make_subplots(rows = len(currentArray), cols = 1, specs=specs, subplot_titles = titles)
+
+    for rowIdx, panel in enumerate(panels, start = 1):
+
+        # Adding RH Regime Bar Traces
+        rhBar.add_trace(panel["rhTrace"], row = rowIdx, col = 1, secondary_y = False)
+        rhBar.update_yaxes(title_text=CO2Col, row=rowIdx, col=1, titlefont=dict(color="black"),tickfont=dict(color="black"))
+        rhBar.update_xaxes(title_text=regimeTitle, row=rowIdx, col=1)
+
+        # Add the Bar Graph Traces
+        figBar.add_trace(panel["co2Trace"], row = rowIdx, col = 1, secondary_y = False)
+        figBar.add_trace(panel["secondTrace"], row = rowIdx, col = 1, secondary_y = True)
+
+        # Give each a yaxis title
+        figBar.update_yaxes(title_text=CO2Col, row=rowIdx, col=1, titlefont=dict(color="black"),tickfont=dict(color="black"))
+        figBar.update_yaxes(title_text=secondAxis, row=rowIdx, col=1, secondary_y=True, titlefont=dict(color=oppositeColor),tickfont=dict(color=oppositeColor))
+
+        # Give Each an xaxis title
+        figBar.update_xaxes(title_text=f"CycleNumber", row=rowIdx, col=1, titlefont=dict(color="black"),tickfont=dict(color="black"))
+
+
+    rhBar.update_layout(height = 400 * len(currentArray),
+    legend_tracegroupgap = 350,
+    legend_groupclick = "toggleitem")
+
+    figBar.update_layout(height = 400 * len(currentArray), yaxis2=dict(
+        title=secondAxis,
+        overlaying='y',
+        side='right',
+        titlefont=dict(color = "black"),
+        tickfont=dict(color = "black")
+    ),
+    legend_tracegroupgap = 350,
+    legend_groupclick = "toggleitem")
+
+    return rhBar, figBar
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from processData import downsample, engine, histogram, queries, regimes, snapshot, synthetic
+from processData.derived import addDerivedColumns, derivedMetrics
+from processData.outliers import outlierMask
+from processData.towers import TowerIndex
+
+
+# End-to-end benchmark of both pages' pipelines on synthetic data
+#   python -m processData.benchmark --rows 100000 1000000 10000000 --source parquet
+# Each scale is generated, written to a local stand-in (SQLite file or Parquet snapshot) and run through the same
+# steps the pages take: load, derived columns, outlier mask, tower index, regime cube, figure building and the size
+# of the figures' JSON (what Streamlit ships to the browser). Every step reports wall time and its peak traced
+# memory (tracemalloc, numpy/pandas buffers included), so runs before/after a change can be compared.
+#   python -m processData.benchmark --rows 10000000 --customers 16 --engine-workers 1 2 4 8
+# times the Array Tracking pipeline through the process pool engine instead (one in-memory run as the reference),
+# with the speedup over one worker for every worker count.
+# With --source sqlite the chunked load is also compared with one plain pd.read_sql of the same SELECT (its peak
+# memory and the size of the frame it builds).
+
+defaultRows = [100_000, 1_000_000, 10_000_000]
+
+# Main page axes and the Array Tracking page's CO2 column
+xValue = "AirRelHumid_In"
+yValue = "CO2 Production Purity-Corrected (kg/hr)"
+co2Cols = list(derivedMetrics)
+
+# Towers on one Array Tracking page
+arraysPerPage = 2
+
+
+class StepTimer:
+
+    def __init__(self, traceMemory=True):
+        self.traceMemory = traceMemory
+        self.results = []
+
+    # Run step(), record its time/peak memory under name and return what it returns
+    def run(self, name, step):
+        if self.traceMemory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = step()
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.traceMemory else None
+            if self.traceMemory:
+                tracemalloc.stop()
+
+        self.results.append({"step": name, "seconds": seconds, "peakBytes": peak})
+        return result
+
+    def record(self, name, **values):
+        self.results.append({"step": name, **values})
+
+
+def _payload(fig):
+    return len(fig.to_json())
+
+
+def _mainPageFigures(frame, keep, maxPoints):
+    kept = frame if keep is None else frame[keep]
+    customers = sorted(kept["CustomerName"].unique())
+
+    scatter = go.Figure()
+    for customer in customers:
+        xPoints, yPoints, counts = downsample.scatterPoints(kept[kept["CustomerName"] == customer], xValue, yValue, maxPoints // len(customers))
+        scatter.add_trace(go.Scattergl(x=xPoints, y=yPoints, mode="markers", name=str(customer), customdata=counts))
+
+    x, widths, groups, counts, means = histogram.binnedStats(kept, xValue, yValue)
+    hist = go.Figure([go.Bar(x=x, y=means[i], width=widths, name=str(group)) for i, group in enumerate(groups)])
+
+    return scatter, hist
+
+
+def _arrayFigures(towerDf, cube, towers):
+    regimeBars = go.Figure()
+    cycleBars = go.Figure()
+
+    for tower in towers:
+        regimeTbl = regimes.towerRegimes(cube, tower, co2Cols[0])
+        regimeBars.add_trace(go.Bar(x=regimeTbl.index, y=regimeTbl["mean"], error_y=dict(type="data", array=regimeTbl["std"]), name=str(tower)))
+
+        rows = towerDf[towerDf["DAC_TowerName"] == tower]
+        cycleBars.add_trace(go.Bar(x=rows["New_CycleNum"], y=rows[co2Cols[0]], name=str(tower)))
+        cycleBars.add_trace(go.Scatter(x=rows["New_CycleNum"], y=rows[xValue], name=str(tower) + " " + xValue))
+
+    return regimeBars, cycleBars
+
+
+# Write the synthetic frame to the stand-in and return a loader that reads it back the way the app does, and one that
+# reads the same rows with a single plain pd.read_sql (None for the Parquet snapshot)
+def _prepareSource(frame, source, workDir):
+    customers = sorted(frame["CustomerName"].unique())
+    tableColumns = list(frame.columns)
+    requested = [xValue, yValue] + list(queries.derivedColumnSources) + queries.arrayTrackingColumns
+
+    if source == "sqlite":
+        path = os.path.join(workDir, "ProcessDataPerIndex.sqlite")
+        synthetic.writeSqlite(frame, path)
+
+        def load():
+            conn = sqlite3.connect(path)
+            try:
+                return queries.loadProcessData(conn, customers, requested, tableColumns)
+            finally:
+                conn.close()
+
+        def plainLoad():
+            conn = sqlite3.connect(path)
+            try:
+                sql, params = queries.buildSelectQuery(customers, queries.neededColumns(requested, tableColumns))
+                return pd.read_sql(sql=sql, con=conn, params=params)
+            finally:
+                conn.close()
+
+        return load, plainLoad
+
+    else:
+        snapshot.snapshotDir = os.path.join(workDir, "snapshot")
+        shutil.rmtree(snapshot.snapshotDir, ignore_errors=True)
+        synthetic.writeSnapshot(frame)
+
+        def load():
+            return snapshot.readCustomers(customers, queries.neededColumns(requested, tableColumns))[0]
+
+    return load, None
+
+
+def runScale(rows, source, workDir, customers=3, towersPerCustomer=8, extraColumns=10, maxPoints=downsample.defaultMaxPoints, traceMemory=True):
+    timer = StepTimer(traceMemory)
+    cyclesPerTower = max(1, rows // (customers * towersPerCustomer))
+
+    frame = timer.run("generate", lambda: synthetic.generateFrame(customers, towersPerCustomer, cyclesPerTower, extraColumns))
+    load, plainLoad = timer.run("write " + source, lambda: _prepareSource(frame, source, workDir))
+    del frame
+
+    if plainLoad is not None:
+        plainFrame = timer.run("load (plain read_sql)", plainLoad)
+        timer.record("frame size (plain)", rows=len(plainFrame), bytes=int(plainFrame.memory_usage(deep=True).sum()))
+        del plainFrame
+
+    frame = timer.run("load", load)
+    timer.record("frame size", rows=len(frame), bytes=int(frame.memory_usage(deep=True).sum()))
+
+    frame = timer.run("derived columns", lambda: addDerivedColumns(frame, co2Cols))
+
+    # Main page
+    mainKeep = timer.run("outlier mask (main)", lambda: outlierMask(frame, [xValue, yValue]))
+    scatter, hist = timer.run("figures (main)", lambda: _mainPageFigures(frame, mainKeep, maxPoints))
+    timer.record("payload (main)", bytes=_payload(scatter) + _payload(hist))
+
+    # Array Tracking page (one page of purity-corrected towers)
+    arrayKeep = timer.run("outlier mask (array)", lambda: outlierMask(frame, ["CO2_Fox_g"], groupBy="DAC_TowerName"))
+    towerIdx = timer.run("tower index", lambda: TowerIndex(frame, arrayKeep))
+    towers = [tower for tower in towerIdx.towers if tower in towerIdx.purityTowers][:arraysPerPage]
+    towerDf = timer.run("tower select", lambda: towerIdx.select(frame, towers))
+    cube = timer.run("regime cube", lambda: regimes.regimeCube(towerDf, co2Cols))
+    regimeBars, cycleBars = timer.run("figures (array)", lambda: _arrayFigures(towerDf, cube, towers))
+    timer.record("payload (array)", bytes=_payload(regimeBars) + _payload(cycleBars))
+
+    return timer.results
+
+
+# Array Tracking pipeline over the snapshot in one process and through the engine with each worker count
+def runEngineScale(rows, workDir, workerCounts, customers=16, towersPerCustomer=8, extraColumns=10, memoryBudget=engine.defaultMemoryBudget):
+    timer = StepTimer(traceMemory=False)
+    cyclesPerTower = max(1, rows // (customers * towersPerCustomer))
+
+    frame = timer.run("generate", lambda: synthetic.generateFrame(customers, towersPerCustomer, cyclesPerTower, extraColumns))
+    timer.run("write parquet", lambda: _prepareSource(frame, "parquet", workDir))
+    del frame
+
+    def inMemory():
+        frame, _ = snapshot.readCustomers(snapshot.customers(), engine.baseColumns + ["CO2_Fox_g", "CycleSecs", regimes.defaultBinColumn])
+        frame = addDerivedColumns(frame, co2Cols)
+        towerIdx = TowerIndex(frame, outlierMask(frame, ["CO2_Fox_g"]))
+        return regimes.regimeCube(towerIdx.select(frame, towerIdx.towers), co2Cols), len(towerIdx.rows)
+
+    cube, keptRows = timer.run("in memory", inMemory)
+    timer.record("kept rows", rows=keptRows)
+
+    baseline = None
+    for workers in workerCounts:
+        pool = engine.newPool(workers)
+        try:
+            # Workers are spawned (and import pandas) on first use, keep that out of the timing
+            list(pool.map(abs, range(workers)))
+            result = timer.run(f"engine x{workers}", lambda: engine.runArrayPipeline(co2Cols=co2Cols, workers=workers, memoryBudget=memoryBudget, pool=pool))
+        finally:
+            pool.shutdown()
+
+        seconds = timer.results[-1]["seconds"]
+        # Relative to the first worker count (1 for the usual --engine-workers 1 2 4 8)
+        if baseline is None:
+            baseline = seconds
+        timer.record(f"speedup x{workers}", speedup=baseline / seconds, spilled=result.spilled, matches=bool(result.rowCount == keptRows and np.allclose(
+            result.cube.reindex(cube.index).to_numpy(float), cube.to_numpy(float), equal_nan=True)))
+        result.close()
+
+    return timer.results
+
+
+def _formatResults(rows, results):
+    lines = [f"{rows:,} rows"]
+    for result in results:
+        parts = []
+        if "seconds" in result:
+            parts.append(f"{result['seconds']:9.3f} s")
+        if result.get("peakBytes") is not None:
+            parts.append(f"peak {result['peakBytes'] / 1024 ** 2:9.1f} MB")
+        if "bytes" in result:
+            parts.append(f"{result['bytes'] / 1024 ** 2:9.2f} MB")
+        if "rows" in result:
+            parts.append(f"{result['rows']:,} rows")
+        if "speedup" in result:
+            parts.append(f"{result['speedup']:6.2f}x  spilled {result['spilled']}  {'matches' if result['matches'] else 'DIFFERS from'} in memory")
+        lines.append(f"  {result['step']:<22}" + "  ".join(parts))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time both pages' pipelines on synthetic ProcessDataPerIndex data")
+    parser.add_argument("--rows", type=int, nargs="+", default=defaultRows)
+    parser.add_argument("--source", choices=["parquet", "sqlite"], default="parquet")
+    parser.add_argument("--customers", type=int, default=3)
+    parser.add_argument("--towers", type=int, default=8, help="towers per customer")
+    parser.add_argument("--extra-columns", type=int, default=10)
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (it slows the steps down)")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--engine-workers", type=int, nargs="+", help="time the process pool engine with these worker counts instead")
+    parser.add_argument("--memory-budget", type=int, default=engine.defaultMemoryBudget, help="engine memory budget in bytes")
+    args = parser.parse_args(argv)
+
+    report = {}
+    workDir = tempfile.mkdtemp(prefix="processBenchmark-")
+    try:
+        for rows in args.rows:
+            if args.engine_workers:
+                results = runEngineScale(rows, workDir, args.engine_workers, args.customers, args.towers, args.extra_columns, args.memory_budget)
+            else:
+                results = runScale(rows, args.source, workDir, args.customers, args.towers, args.extra_columns, traceMemory=not args.no_memory)
+            report[rows] = results
+            print(_formatResults(rows, results), flush=True)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    # ru_maxrss is KB on Linux
+    print(f"process peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
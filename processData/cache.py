@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Process-wide LRU cache of loaded dataframes
+# Streamlit imports this module once per server process, so every browser session sees the same entries.
+# Entries expire after ttl seconds and the least recently used ones are dropped once maxBytes is exceeded.
+# onEvict(key) is called for every entry that expires, is evicted or popped (so state kept per key can go with it).
+class FrameCache:
+
+    def __init__(self, maxBytes, ttl, onEvict=None):
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self.onEvict = onEvict
+
+        # key -> (frame, storedAt, nbytes), ordered oldest use -> newest use
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Size of a frame in bytes (deep so object/string columns are counted properly)
+    @staticmethod
+    def frameBytes(frame):
+        return int(frame.memory_usage(deep=True).sum())
+
+    def _expired(self, storedAt):
+        return self.ttl is not None and time.monotonic() - storedAt > self.ttl
+
+    # Returns the cached frame or None, counting the hit/miss
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                self.evictions += 1
+                self._evicted(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # Returns the cached frame or None without touching the stats or the LRU order
+    def peek(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1]):
+                return None
+            return entry[0]
+
+    def put(self, key, frame):
+        nbytes = self.frameBytes(frame)
+
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+            self._entries[key] = (frame, time.monotonic(), nbytes)
+            self._evict()
+
+    # Remove key (if cached) and return its frame
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._evicted(key)
+            return entry[0]
+
+    # Drop expired entries, then least recently used ones until we are under maxBytes (the newest entry always stays)
+    def _evict(self):
+        for key in [key for key, entry in self._entries.items() if self._expired(entry[1])]:
+            del self._entries[key]
+            self.evictions += 1
+            self._evicted(key)
+
+        while len(self._entries) > 1 and self.totalBytes() > self.maxBytes:
+            key, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            self._evicted(key)
+
+    def _evicted(self, key):
+        if self.onEvict is not None:
+            self.onEvict(key)
+
+    # Live (non-expired) entries as (key, frame) pairs, most recently used first
+    def items(self):
+        with self._lock:
+            return [(key, entry[0]) for key, entry in reversed(self._entries.items()) if not self._expired(entry[1])]
+
+    def totalBytes(self):
+        with self._lock:
+            return sum(entry[2] for entry in self._entries.values())
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            for key in keys:
+                self._evicted(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "totalMB": self.totalBytes() / 1024 ** 2,
+                "maxMB": self.maxBytes / 1024 ** 2,
+            }
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+# Configuration change cycles
+# The cycle numbers where a customer's (or one tower's) configuration changed are kept in a small local SQLite file, so
+# they survive reloads and are shared by every session instead of living in a sidebar text box. The rows between two
+# changes are a segment: each row's segment is a binary search of its group's change cycles (np.searchsorted) and the
+# mean/count/std of every segment comes out of one bincount pass.
+
+registryPath = os.environ.get("PROCESS_CONFIG_CHANGES", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".configChanges", "configChanges.sqlite"))
+
+# DAC_TowerName of changes that apply to every tower of the customer
+allTowers = ""
+
+_registryLock = threading.Lock()
+
+
+def _connect():
+    os.makedirs(os.path.dirname(registryPath), exist_ok=True)
+    conn = sqlite3.connect(registryPath)
+    conn.execute("CREATE TABLE IF NOT EXISTS ConfigChanges (CustomerName TEXT NOT NULL, DAC_TowerName TEXT NOT NULL, CycleNumber INTEGER NOT NULL, "
+                 "PRIMARY KEY (CustomerName, DAC_TowerName, CycleNumber))")
+    return conn
+
+
+# "1200, 3500,x" -> ([1200, 3500], ["x"]): sorted distinct cycle numbers and the entries that aren't one
+def parseCycles(text):
+    cycles, bad = set(), []
+    for entry in text.replace("\n", ",").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            cycles.add(int(float(entry)))
+        except ValueError:
+            bad.append(entry)
+    return sorted(cycles), bad
+
+
+def formatCycles(cycles):
+    return ", ".join(str(cycle) for cycle in cycles)
+
+
+# {customer: [change cycles]} of one tower (allTowers for the customer wide changes), customers without any get []
+def changeCycles(customers, tower=allTowers):
+    customers = list(customers)
+    changes = {customer: [] for customer in customers}
+    if not customers:
+        return changes
+
+    with _registryLock:
+        conn = _connect()
+        try:
+            rows = conn.execute(f"SELECT CustomerName, CycleNumber FROM ConfigChanges WHERE DAC_TowerName = ? AND CustomerName IN ({', '.join('?' * len(customers))}) "
+                                "ORDER BY CustomerName, CycleNumber", [tower] + [str(customer) for customer in customers]).fetchall()
+        finally:
+            conn.close()
+
+    names = {str(customer): customer for customer in customers}
+    for customer, cycle in rows:
+        changes[names[customer]].append(cycle)
+    return changes
+
+
+# Replace the change cycles of a customer (one tower of it when given)
+def setChanges(customer, cycles, tower=allTowers):
+    with _registryLock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM ConfigChanges WHERE CustomerName = ? AND DAC_TowerName = ?", (str(customer), tower))
+                conn.executemany("INSERT INTO ConfigChanges VALUES (?, ?, ?)", [(str(customer), tower, int(cycle)) for cycle in sorted(set(cycles))])
+        finally:
+            conn.close()
+
+
+def segmentLabels(cycles):
+    if not cycles:
+        return ["All Cycles"]
+    bounds = [f"{low} - {high - 1}" for low, high in zip(cycles[:-1], cycles[1:])]
+    return [f"Before {cycles[0]}"] + bounds + [f"{cycles[-1]}+"]
+
+
+# mean/count/std of valueColumn per segment between the change cycles of each group ({group: [cycles]})
+# A change at cycle c starts a new segment at c. Rows of groups that aren't in changes are left out. Every segment
+# gets a row (count 0 when no rows fall in it), "Change" is the difference to the group's previous segment mean.
+def segmentStats(frame, valueColumn, changes, groupColumn="CustomerName", cycleColumn="CycleNumber"):
+    groups = sorted(changes, key=str)
+    cycleLists = [sorted(set(int(cycle) for cycle in changes[group])) for group in groups]
+
+    groupCodes = pd.Categorical(frame[groupColumn], categories=groups).codes.astype(np.int64)
+    cycleValues = frame[cycleColumn].to_numpy(dtype=np.float64)
+    values = frame[valueColumn].to_numpy(dtype=np.float64)
+    valid = (groupCodes >= 0) & np.isfinite(cycleValues) & ~np.isnan(values)
+
+    # (group, cycle) as one sorted key, so every row is placed with a single searchsorted: group g's rows land after
+    # the changes of groups < g, adding g turns that into the row's segment counted over every group's segments
+    allCycles = [cycle for cycles in cycleLists for cycle in cycles]
+    scale = max(0.0, np.max(cycleValues[valid], initial=0.0), max(allCycles, default=0.0)) + 1
+    changeKeys = np.array([code * scale + cycle for code, cycles in enumerate(cycleLists) for cycle in cycles], dtype=np.float64)
+
+    rowCodes = groupCodes[valid]
+    segments = np.searchsorted(changeKeys, rowCodes * scale + cycleValues[valid], side="right") + rowCodes
+    segmentCount = len(changeKeys) + len(groups)
+    rowValues = values[valid]
+
+    counts = np.bincount(segments, minlength=segmentCount)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.bincount(segments, weights=rowValues, minlength=segmentCount) / counts
+        squares = np.bincount(segments, weights=(rowValues - means[segments]) ** 2, minlength=segmentCount)
+        stds = np.where(counts > 1, np.sqrt(squares / (counts - 1)), np.nan)
+
+    firstSegment = np.zeros(segmentCount, dtype=bool)
+    firstSegment[np.cumsum([0] + [len(cycles) + 1 for cycles in cycleLists])[:-1]] = True
+    change = np.where(firstSegment, np.nan, means - np.r_[np.nan, means[:-1]])
+
+    return pd.DataFrame({
+        groupColumn: [group for group, cycles in zip(groups, cycleLists) for _ in range(len(cycles) + 1)],
+        "Segment": [label for cycles in cycleLists for label in segmentLabels(cycles)],
+        "count": counts,
+        "mean": means,
+        "std": stds,
+        "Change": change,
+    })
@@ -0,0 +1,179 @@
+import functools
+import threading
+import time
+
+
+# Process-wide pool of SQL Server connections
+# Every Streamlit rerun runs the page script in a new thread, so a connection is leased to the thread that asked
+# for it and goes back to the idle list once that thread has finished (pyodbc connections can't be shared between
+# threads at the same time). Reruns then reuse an open connection instead of doing an ODBC handshake each time.
+
+# Idle connections are checked with a round trip before reuse once they have sat this long
+healthCheckSeconds = 30
+
+# After a failed connect, don't try again for this long (reruns while offline shouldn't all wait on the timeout)
+retrySeconds = 30
+
+# Idle connections kept open, extra ones are closed when they come back
+maxIdle = 4
+
+healthCheckQuery = "SELECT 1"
+
+
+class ConnectionPool:
+
+    def __init__(self, connect, errors=(Exception,)):
+        # connect() opens a new connection, errors are the exceptions that mean the connection/server is gone
+        self.connect = connect
+        self.errors = errors
+
+        # Idle connections as (conn, lastUsed), thread -> leased connection
+        self._idle = []
+        self._leases = {}
+        self._lock = threading.Lock()
+
+        self._failedAt = None
+        self.lastError = None
+
+        self.connects = 0
+        self.reuses = 0
+        self.reconnects = 0
+
+    # Connection for the calling thread (the same one on every call from that thread), None if the server is unreachable
+    def acquire(self):
+        thread = threading.current_thread()
+
+        with self._lock:
+            self._reclaim()
+
+            conn = self._leases.get(thread)
+            if conn is not None:
+                return conn
+
+            while self._idle:
+                conn, lastUsed = self._idle.pop()
+                if time.monotonic() - lastUsed < healthCheckSeconds or self._healthy(conn):
+                    self._leases[thread] = conn
+                    self.reuses += 1
+                    return conn
+                self._close(conn)
+                self.reconnects += 1
+
+            if self._failedAt is not None and time.monotonic() - self._failedAt < retrySeconds:
+                return None
+
+        # Connecting can take a while, don't hold up other sessions meanwhile
+        try:
+            conn = self.connect()
+        except self.errors as err:
+            with self._lock:
+                self._failedAt = time.monotonic()
+                self.lastError = str(err)
+            return None
+
+        with self._lock:
+            self._failedAt = None
+            self.lastError = None
+            self.connects += 1
+            self._leases[thread] = conn
+
+        return conn
+
+    # Hand the calling thread's connection back early (otherwise that happens once the thread is gone)
+    def release(self):
+        with self._lock:
+            conn = self._leases.pop(threading.current_thread(), None)
+            if conn is not None:
+                self._giveBack(conn)
+
+    # Drop the calling thread's connection after it failed, the next acquire() opens a fresh one
+    def discard(self):
+        with self._lock:
+            conn = self._leases.pop(threading.current_thread(), None)
+            if conn is not None:
+                self._close(conn)
+                self.reconnects += 1
+
+    # Leases of finished threads go back to the idle list
+    def _reclaim(self):
+        for thread in [thread for thread in self._leases if not thread.is_alive()]:
+            self._giveBack(self._leases.pop(thread))
+
+    def _giveBack(self, conn):
+        if len(self._idle) < maxIdle:
+            self._idle.append((conn, time.monotonic()))
+        else:
+            self._close(conn)
+
+    def _healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(healthCheckQuery).fetchall()
+            cursor.close()
+            return True
+        except self.errors:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except self.errors:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "leased": len(self._leases),
+                "idle": len(self._idle),
+                "connects": self.connects,
+                "reuses": self.reuses,
+                "reconnects": self.reconnects,
+                "lastError": self.lastError,
+            }
+
+
+_pool = None
+_poolLock = threading.Lock()
+
+
+# Create the shared pool once per server process (later calls keep the first one)
+def configure(connect, errors=(Exception,)):
+    global _pool
+
+    with _poolLock:
+        if _pool is None:
+            _pool = ConnectionPool(connect, errors)
+        return _pool
+
+
+# Shared pool, None until the main page has configured it
+def sharedPool():
+    return _pool
+
+
+# Connection for the calling thread from the shared pool, None when offline or not configured yet
+def acquire():
+    return _pool.acquire() if _pool is not None else None
+
+
+# Whether error (or an error it was raised from, pd.read_sql wraps driver errors in its own) is one of errors
+def _driverError(error, errors):
+    while error is not None:
+        if isinstance(error, errors):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+# Decorator for functions that run SQL on the calling thread's pooled connection: when one raises an error of the
+# pool's errors the connection is discarded (it may be broken or have results pending), the error is re-raised
+def discardOnError(function):
+    @functools.wraps(function)
+    def run(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except Exception as error:
+            if _pool is not None and _driverError(error, _pool.errors):
+                _pool.discard()
+            raise
+    return run
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+
+# Derived columns, shared by the main page and the Array Tracking page
+# Each metric is registered once with the columns it is calculated from (raw table columns or other metrics) and
+# a function that writes it into a preallocated array with in-place numpy ops, so there are no chained temporaries.
+# Columns are only calculated when a page asks for them, and the column pickers list every registered metric.
+# A metric can also give the same formula as a SQL template ({0}, {1}, ... are its sources) so aggregations over it
+# can run on SQL Server (see queries.columnSql).
+
+# name -> (source columns, compute(values, out)), in registration order
+derivedMetrics = {}
+
+# name -> SQL template, for the metrics that have one
+derivedSql = {}
+
+
+# Register a derived metric: compute gets a dict of source name -> numpy array and fills out
+def derivedMetric(name, sources, sql=None):
+    def register(compute):
+        derivedMetrics[name] = (list(sources), compute)
+        if sql is not None:
+            derivedSql[name] = sql
+        return compute
+    return register
+
+
+# Hours a tower runs in a year (for the T/Y columns)
+hoursPerYear = 8000
+
+
+# Fox_g / 1000 (kg) / CycleSecs (from per Cycle to Per Second) * 3600 (Seconds to Hr) * DAC_CO2_Percent / 100 (Purity Correct)
+@derivedMetric("CO2 Production Purity-Corrected (kg/hr)", ["CO2_Fox_g", "CycleSecs", "DAC_CO2_Percent"],
+               sql="{0} * 1.0 / NULLIF({1}, 0) * {2} * 0.036")
+def _purityCorrectedKgHr(values, out):
+    np.divide(values["CO2_Fox_g"], values["CycleSecs"], out=out)
+    np.multiply(out, values["DAC_CO2_Percent"], out=out)
+    np.multiply(out, 3600 / 1000 / 100, out=out)
+
+
+# kg/hr * 8000 hrs in a year / 1000 kg in a metric Ton
+@derivedMetric("CO2 Production Purity-Corrected (T/Y)", ["CO2 Production Purity-Corrected (kg/hr)"], sql=f"{{0}} * {hoursPerYear / 1000:g}")
+def _purityCorrectedTY(values, out):
+    np.multiply(values["CO2 Production Purity-Corrected (kg/hr)"], hoursPerYear / 1000, out=out)
+
+
+# Not Purity Corrected: same as above without the CO2 Percent
+@derivedMetric("CO2 Production (kg/hr)", ["CO2_Fox_g", "CycleSecs"], sql="{0} * 1.0 / NULLIF({1}, 0) * 3.6")
+def _kgHr(values, out):
+    np.divide(values["CO2_Fox_g"], values["CycleSecs"], out=out)
+    np.multiply(out, 3600 / 1000, out=out)
+
+
+@derivedMetric("CO2 Production (T/Y)", ["CO2 Production (kg/hr)"], sql=f"{{0}} * {hoursPerYear / 1000:g}")
+def _tY(values, out):
+    np.multiply(values["CO2 Production (kg/hr)"], hoursPerYear / 1000, out=out)
+
+
+# Raw table columns a metric is calculated from (following metrics built on other metrics)
+def rawSources(name):
+    if name not in derivedMetrics:
+        return [name]
+
+    columns = []
+    for source in derivedMetrics[name][0]:
+        for col in rawSources(source):
+            if col not in columns:
+                columns.append(col)
+    return columns
+
+
+# Metrics (plus the metrics they are built on) needed for names, in dependency order
+def _computeOrder(names):
+    order = []
+
+    def visit(name):
+        if name in derivedMetrics and name not in order:
+            for source in derivedMetrics[name][0]:
+                visit(source)
+            order.append(name)
+
+    for name in names:
+        visit(name)
+    return order
+
+
+# Frame with the derived columns in names added (every registered metric if names is None)
+# Metrics already in the frame or whose raw columns weren't loaded are skipped. The frame itself is not modified
+# (it may be shared between sessions), the new columns are put next to its existing ones.
+def addDerivedColumns(frame, names=None):
+    names = list(derivedMetrics) if names is None else names
+    loaded = set(frame.columns)
+
+    values = {}
+    for name in _computeOrder(names):
+        if name in loaded or not loaded.issuperset(rawSources(name)):
+            continue
+
+        sources = [values[src] if src in values else frame[src].to_numpy() for src in derivedMetrics[name][0]]
+        out = np.empty(len(frame), dtype=np.result_type(np.float32, *sources))
+        derivedMetrics[name][1](dict(zip(derivedMetrics[name][0], sources)), out)
+        values[name] = out
+
+    # Only return what was asked for (helper metrics calculated along the way are dropped)
+    added = {name: values[name] for name in names if name in values}
+    if not added:
+        return frame
+
+    return pd.concat([frame, pd.DataFrame(added, index=frame.index)], axis=1)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+
+# Level of detail for the main scatter plot
+# Sending every row to the browser as a Scattergl trace makes the page payload grow with the data. Above maxPoints
+# the points inside the visible x range are binned on a 2D grid and each non-empty cell is drawn as one point at the
+# mean of its rows, so the payload stays bounded. Narrowing the x range re-bins only the rows left in it (finer
+# cells), and once few enough rows are left the raw points are drawn.
+
+# Default number of points drawn for the whole plot (split between the customers)
+defaultMaxPoints = 20_000
+
+
+# Points for one trace: returns (x, y, counts), counts is None when the raw rows are returned
+# xRange (low, high) limits the rows to the visible part of the x axis, None keeps every row
+def scatterPoints(frame, xCol, yCol, maxPoints, xRange=None):
+    x = frame[xCol]
+    y = frame[yCol]
+
+    numeric = pd.api.types.is_numeric_dtype(x) and pd.api.types.is_numeric_dtype(y)
+    if not numeric:
+        # Can't bin strings/dates on a grid, fall back to every n-th row
+        step = max(1, -(-len(x) // maxPoints))
+        return x.iloc[::step].to_numpy(), y.iloc[::step].to_numpy(), None
+
+    x = x.to_numpy(dtype=np.float64)
+    y = y.to_numpy(dtype=np.float64)
+
+    keep = np.isfinite(x) & np.isfinite(y)
+    if xRange is not None:
+        keep &= (x >= xRange[0]) & (x <= xRange[1])
+    x, y = x[keep], y[keep]
+
+    if len(x) <= maxPoints:
+        return x, y, None
+
+    return binPoints(x, y, maxPoints)
+
+
+# Mean x/y and row count of every non-empty cell of a grid with about maxPoints cells
+def binPoints(x, y, maxPoints):
+    bins = max(1, int(np.sqrt(maxPoints)))
+
+    xCell = _cellIndex(x, bins)
+    yCell = _cellIndex(y, bins)
+    cell = xCell * bins + yCell
+
+    counts = np.bincount(cell, minlength=bins * bins)
+    xSums = np.bincount(cell, weights=x, minlength=bins * bins)
+    ySums = np.bincount(cell, weights=y, minlength=bins * bins)
+
+    filled = counts > 0
+    return xSums[filled] / counts[filled], ySums[filled] / counts[filled], counts[filled]
+
+
+def _cellIndex(values, bins):
+    low, high = values.min(), values.max()
+    if high <= low:
+        return np.zeros(len(values), dtype=np.int64)
+
+    index = ((values - low) * (bins / (high - low))).astype(np.int64)
+    return np.minimum(index, bins - 1)
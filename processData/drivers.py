@@ -0,0 +1,208 @@
+import threading
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Driver scan for the main page: how strongly every numeric column goes with the Y column
+# Rows are taken in blocks, each block is one (columns x rows) matrix centered on the first rows and the sums behind Pearson's r (n, sums,
+# sums of squares, cross products) come out of column sums and one matrix-vector product per block, with missing
+# values masked out pairwise. Binned means of Y over equal-width bins of each column, and the share of Y's variance
+# they explain (the correlation ratio, "Binned R²", which also picks up non-linear drivers), are worked out from an
+# evenly spaced sample of the rows with one bincount over (column, bin) cells.
+
+defaultBins = 10
+
+# Rows per block of the correlation pass, rows the sums are centered on
+blockRows = 8_192
+shiftRows = 1_000
+
+# Rows sampled for the binned means, split between the groups by their size (at least minSampleRows each)
+sampleRows = 20_000
+minSampleRows = 1_000
+
+# Scans kept, the least recently used ones are dropped first
+maxScans = 32
+
+# inputs -> ranking, ordered oldest use -> newest use
+_scans = OrderedDict()
+_scansLock = threading.Lock()
+
+
+# Numeric (not boolean) columns of frame, except the ones in exclude
+def numericColumns(frame, exclude=()):
+    exclude = set(exclude)
+    return [col for col in frame.columns if col not in exclude and pd.api.types.is_numeric_dtype(frame[col]) and not pd.api.types.is_bool_dtype(frame[col])]
+
+
+# rows (a slice or positions) of every array minus its shift as one float64 (columns x rows) block
+# Each column is copied contiguously, the subtraction is done on the way in
+def _block(arrays, rows, shift=None):
+    block = np.empty((len(arrays), _rowCount(rows)))
+    for j, values in enumerate(arrays):
+        if shift is None:
+            block[j] = values[rows]
+        else:
+            np.subtract(values[rows], shift[j], out=block[j])
+    return block
+
+
+def _rowCount(rows):
+    return rows.stop - rows.start if isinstance(rows, slice) else len(rows)
+
+
+# Mean of the first rows of every array and y (0 where there is none), the sums are taken around it
+def _shifts(arrays, y, rows):
+    head = rows if not isinstance(rows, slice) else slice(rows.start, min(rows.stop, rows.start + shiftRows))
+    head = head[:shiftRows] if not isinstance(head, slice) else head
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        x = _block(arrays, head)
+        xShift = np.nan_to_num(np.nanmean(np.where(np.isfinite(x), x, np.nan), axis=1))
+        yHead = np.asarray(y[head], dtype=np.float64)
+        yShift = float(np.nan_to_num(np.nanmean(np.where(np.isfinite(yHead), yHead, np.nan))))
+    return xShift, yShift
+
+
+# (rows, r) of y against every array over rows
+def _correlations(arrays, y, rows):
+    columnCount = len(arrays)
+    total = _rowCount(rows)
+    n = np.zeros(columnCount)
+    sx, sxx, sxy, sy, syy = (np.zeros(columnCount) for _ in range(5))
+
+    # Sums are taken around a rough center, so the variances don't cancel out
+    xShift, yShift = _shifts(arrays, y, rows)
+
+    for start in range(0, total, blockRows):
+        blockIdx = slice(rows.start + start, rows.start + min(start + blockRows, total)) if isinstance(rows, slice) else rows[start:start + blockRows]
+        x = _block(arrays, blockIdx, xShift)
+        yb = np.asarray(y[blockIdx], dtype=np.float64) - yShift
+
+        # Rows without a Y value count for no column
+        yValid = np.isfinite(yb)
+        if not yValid.all():
+            x[:, ~yValid] = 0.0
+            yb[~yValid] = 0.0
+        validRows = yValid.sum()
+
+        # A column's sum is only non-finite when one of its values is, just those columns get masked
+        rowSums = x.sum(axis=1)
+        bad = np.flatnonzero(~np.isfinite(rowSums))
+        n += validRows
+        sy += yb.sum()
+        syy += yb @ yb
+        if len(bad):
+            valid = np.isfinite(x[bad]) & yValid
+            x[bad] = np.where(valid, x[bad], 0.0)
+            rowSums[bad] = x[bad].sum(axis=1)
+            n[bad] += valid.sum(axis=1) - validRows
+            sy[bad] += valid @ yb - yb.sum()
+            syy[bad] += valid @ (yb * yb) - yb @ yb
+
+        sx += rowSums
+        sxx += np.einsum("ij,ij->i", x, x)
+        sxy += x @ yb
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        covariance = sxy - sx * sy / n
+        r = covariance / np.sqrt((sxx - sx * sx / n) * (syy - sy * sy / n))
+    return n.astype(np.int64), np.clip(r, -1, 1)
+
+
+# (column x bin mean Y, correlation ratio) over an evenly spaced sample of about sampleSize rows
+def _binnedMeans(arrays, y, rows, bins, sampleSize):
+    total = _rowCount(rows)
+    step = max(1, -(-total // sampleSize))
+    sample = slice(rows.start, rows.stop, step) if isinstance(rows, slice) else rows[::step]
+
+    x = _block(arrays, sample) if not isinstance(sample, slice) else _block(arrays, np.arange(sample.start, sample.stop, sample.step))
+    ys = np.asarray(y[sample], dtype=np.float64)
+    columnCount = len(arrays)
+
+    valid = np.isfinite(x) & np.isfinite(ys)
+    allValid = valid.all()
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low = (x.min(axis=1) if allValid else np.nanmin(np.where(valid, x, np.nan), axis=1))[:, None]
+        high = (x.max(axis=1) if allValid else np.nanmax(np.where(valid, x, np.nan), axis=1))[:, None]
+        x -= low
+        x *= bins / np.where(high > low, high - low, 1.0)
+        binCodes = np.clip(x.astype(np.int64), 0, bins - 1)
+
+    binCodes += np.arange(columnCount)[:, None] * bins
+    cells = binCodes.ravel() if allValid else binCodes[valid]
+    yCells = np.broadcast_to(ys, x.shape).ravel() if allValid else np.broadcast_to(ys, x.shape)[valid]
+    cellCount = columnCount * bins
+
+    counts = np.bincount(cells, minlength=cellCount).reshape(columnCount, bins)
+    sums = np.bincount(cells, weights=yCells, minlength=cellCount).reshape(columnCount, bins)
+    squares = np.bincount(cells, weights=yCells * yCells, minlength=cellCount).reshape(columnCount, bins)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        n, sumY = counts.sum(axis=1), sums.sum(axis=1)
+        between = np.where(counts > 0, sums * means, 0).sum(axis=1) - sumY * sumY / n
+        within = squares.sum(axis=1) - sumY * sumY / n
+        ratio = np.clip(between / within, 0, 1)
+    return means, ratio
+
+
+# Ranking of columns by how much of yCol they explain, per group of groupColumn (every row together when None)
+# positions limits the rows (None for all of them). One row per (group, column): rows with both values, r, R² (= r²),
+# binned R² and the mean Y per column bin
+def driverScan(frame, yCol, columns, groupColumn=None, positions=None, bins=defaultBins):
+    columns = [col for col in columns if col != yCol]
+    arrays = [frame[col].to_numpy() for col in columns]
+    y = frame[yCol].to_numpy(dtype=np.float64)
+
+    if groupColumn is None:
+        groups = [(None, slice(0, len(frame)) if positions is None else np.asarray(positions))]
+    else:
+        positions = np.arange(len(frame)) if positions is None else np.asarray(positions)
+        codes, names = pd.factorize(frame[groupColumn].to_numpy()[positions], sort=True)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        groups = [(name, positions[order[start:stop]]) for name, start, stop in zip(names, bounds[:-1], bounds[1:])]
+
+    totalRows = sum(_rowCount(rows) for _, rows in groups)
+
+    tables = []
+    for name, rows in groups:
+        # Contiguous rows (one customer of a frame loaded customer by customer) are read as views
+        if not isinstance(rows, slice) and len(rows) and rows[-1] - rows[0] + 1 == len(rows) and (len(rows) < 2 or np.all(np.diff(rows) == 1)):
+            rows = slice(int(rows[0]), int(rows[-1]) + 1)
+        if _rowCount(rows) == 0:
+            continue
+
+        n, r = _correlations(arrays, y, rows)
+        means, ratio = _binnedMeans(arrays, y, rows, bins, max(minSampleRows, sampleRows * _rowCount(rows) // max(1, totalRows)))
+        table = pd.DataFrame({"Column": columns, "Rows": n, "r": r, "R²": r * r, "Binned R²": ratio, "Binned Mean": list(means)})
+        if groupColumn is not None:
+            table.insert(0, groupColumn, name)
+        tables.append(table.sort_values("R²", ascending=False, na_position="last"))
+
+    if not tables:
+        return pd.DataFrame(columns=([groupColumn] if groupColumn else []) + ["Column", "Rows", "r", "R²", "Binned R²", "Binned Mean"])
+    return pd.concat(tables, ignore_index=True)
+
+
+# driverScan cached under inputs (data key/version, outlier settings, date window, ...): rerun only when one changes
+def cachedDriverScan(inputs, frame, yCol, columns, groupColumn=None, positions=None, bins=defaultBins):
+    key = (inputs, yCol, tuple(columns), groupColumn, bins)
+
+    with _scansLock:
+        if key in _scans:
+            _scans.move_to_end(key)
+            return _scans[key]
+
+    ranking = driverScan(frame, yCol, columns, groupColumn, positions, bins)
+
+    with _scansLock:
+        _scans[key] = ranking
+        while len(_scans) > maxScans:
+            _scans.popitem(last=False)
+
+    return ranking
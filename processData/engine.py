@@ -0,0 +1,501 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from processData import ingest, queries, regimes, snapshot, timeindex
+from processData.derived import addDerivedColumns, rawSources
+from processData.outliers import iqrWidth, madScale, madWidth, sdWidth
+from processData.towers import TowerIndex
+
+
+# Out-of-core, multi-core runs of the Array Tracking pipeline over the whole local snapshot
+# The pages hold every loaded row in one frame and filter/number/aggregate it on the script thread. Here the snapshot's
+# customer partitions (one Parquet directory each) are the units of work of a process pool: each worker reads its
+# customer, adds the derived columns, drops the outliers, numbers every tower's cycles (New_CycleNum) and builds the
+# regime cube with the same functions the pages use, so the results match an in-memory run.
+# Outlier limits cover every partition ("All Data"/"Per Tower" groups can span customers), so they are worked out
+# first from per-partition summaries and handed to the workers: count/mean/squared deviations for "3 SD", and for the
+# median/quartile methods an exact selection of the wanted ranks over a few rounds of bucket counts (partitions only
+# send back the few values left around a rank at the end). A customer that doesn't fit the memory budget is processed in batches of whole towers, and
+# kept rows over the budget are spilled to Parquet files instead of being sent back to the parent process.
+# Towers are assumed to belong to one customer (their cycles are numbered within their partition).
+# The Array Tracking page can run its aggregation here ("Aggregate in Worker Pool") for the towers it shows.
+
+# Bytes of rows all workers together hold at once (split evenly between them)
+defaultMemoryBudget = 2 * 1024 ** 3
+
+# Rough in-memory bytes per read column and row: the read values, derived/filtered copies and the sort keys
+bytesPerValue = 8 * 3
+
+# Columns every partition is read with (tower numbering/purity need them)
+baseColumns = queries.keyColumns + ["DAC_CO2_Percent"]
+
+# Rank selection: buckets per interval and round, intervals holding at most selectValues values are sent back whole
+selectBuckets = 1024
+selectValues = 4096
+maxSelectRounds = 16
+
+# Sorted values a worker keeps per (selection, partition), so the rounds of a selection don't read and sort the
+# partition again (the most recently used ones are kept)
+maxWorkerValues = 8
+_workerValues = OrderedDict()
+
+# Pipeline results kept for the page, the least recently used ones are dropped (and their spilled rows removed) first
+maxResults = 8
+_results = OrderedDict()
+_resultsLock = threading.Lock()
+
+_pool = None
+_poolLock = threading.Lock()
+
+
+# Kept rows with New_CycleNum, the merged regime cube and the limits used, per partition results are in memory
+# (a frame) or spilled to a Parquet file under spillDir
+class EngineResult:
+
+    def __init__(self, partitions, limits, spillDir):
+        self.partitions = partitions
+        self.limits = limits
+        self.spillDir = spillDir
+
+        cubes = [partition["cube"] for partition in partitions if len(partition["cube"])]
+        # Towers sorted like regimeCube() does, each tower's regimes stay in edge order (their labels don't sort)
+        self.cube = pd.concat(cubes).sort_index(level="DAC_TowerName", sort_remaining=False) if cubes else None
+
+        self.towers = sorted({tower for partition in partitions for tower in partition["towers"]}, key=str)
+        self.purityTowers = set().union(*(partition["purityTowers"] for partition in partitions))
+        self.rowCount = sum(partition["rowCount"] for partition in partitions)
+        self.spilled = sum(isinstance(partition["rows"], str) for partition in partitions)
+
+    # Kept rows of every partition, one frame at a time (spilled ones are read back from disk)
+    def frames(self):
+        for partition in self.partitions:
+            rows = partition["rows"]
+            yield pd.read_parquet(rows) if isinstance(rows, str) else rows
+
+    # Kept rows of the picked towers (all of them in memory)
+    def towerFrame(self, towers):
+        towers = set(towers)
+        frames = [frame[frame["DAC_TowerName"].isin(towers)] for frame in self.frames()]
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    # Remove the spilled partitions
+    def close(self):
+        if self.spillDir is not None:
+            shutil.rmtree(self.spillDir, ignore_errors=True)
+            self.spillDir = None
+
+
+def _useSnapshot(snapshotDir):
+    # Spawned workers start from the module default, not whatever the parent pointed it at
+    snapshot.snapshotDir = snapshotDir
+
+
+# Frame of one partition (only towers and the ProdDates of window when given) with the derived columns it needs
+def _readPartition(snapshotDir, customer, columns, derivedColumns, towers=None, window=None):
+    _useSnapshot(snapshotDir)
+    if window is not None:
+        columns = list(dict.fromkeys(list(columns) + ["ProdDate", "ProdTime"]))
+    frame, _ = snapshot.readCustomers([customer], columns, towers)
+    if frame is None:
+        return None
+
+    if window is not None:
+        low, high = timeindex.windowBounds(window)
+        stamps = frame[ingest.timestampColumn].to_numpy()
+        frame = frame[(stamps >= low) & (stamps < high)].reset_index(drop=True)
+    return addDerivedColumns(frame, derivedColumns)
+
+
+# Group -> (count, mean, squared deviations) of each limit column in one partition, for the "3 SD" limits
+def _limitStats(snapshotDir, customer, limitColumns, groupBy, window=None):
+    sources = list(dict.fromkeys(col for name in limitColumns for col in rawSources(name)))
+    frame = _readPartition(snapshotDir, customer, sources + ([groupBy] if groupBy else []), limitColumns, window=window)
+    if frame is None:
+        return {}
+
+    groups = frame[groupBy] if groupBy else pd.Series(0, index=frame.index)
+    stats = {}
+    for col in limitColumns:
+        grouped = frame[col].astype(np.float64).groupby(groups, dropna=False, observed=True)
+        counts, means, squares = grouped.count(), grouped.mean(), grouped.var(ddof=0) * grouped.count()
+        stats[col] = {group: (count, mean, square) for group, count, mean, square in zip(counts.index, counts, means, squares.fillna(0))}
+    return stats
+
+
+# Merge every partition's "3 SD" statistics of col into (groups, (lower, upper)), limits line up with groups
+def _mergeSdLimits(partitionStats, col):
+    merged = {}
+    for stats in partitionStats:
+        for group, value in stats.get(col, {}).items():
+            merged.setdefault(group, []).append(value)
+    colGroups = pd.Index(list(merged))
+
+    # Chan et al. pairwise update of count/mean/squared deviations, std(ddof=0) like columnLimits
+    lower, upper = [], []
+    for group in colGroups:
+        count, mean, squares = 0, 0.0, 0.0
+        for partCount, partMean, partSquares in merged[group]:
+            if partCount == 0:
+                continue
+            total = count + partCount
+            delta = partMean - mean
+            mean += delta * partCount / total
+            squares += partSquares + delta ** 2 * count * partCount / total
+            count = total
+        center = mean if count else np.nan
+        spread = np.sqrt(squares / count) * sdWidth if count else np.nan
+        lower.append(center - spread)
+        upper.append(center + spread)
+
+    return colGroups, (np.array(lower), np.array(upper))
+
+
+# {group: sorted finite values of column} in one partition, |value - centers[group]| when centers are given
+def _sortedGroupValues(snapshotDir, customer, column, groupBy, centers=None, window=None):
+    frame = _readPartition(snapshotDir, customer, list(dict.fromkeys(rawSources(column) + ([groupBy] if groupBy else []))), [column], window=window)
+    if frame is None or frame.empty:
+        return {}
+
+    values = frame[column].to_numpy(dtype=np.float64)
+    codes, groups = pd.factorize(frame[groupBy], use_na_sentinel=False) if groupBy else (np.zeros(len(frame), dtype=np.intp), [0])
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(groups) + 1))
+
+    groupValues = {}
+    for group, start, stop in zip(groups, bounds[:-1], bounds[1:]):
+        if centers is not None and group not in centers:
+            continue
+        groupRows = values[order[start:stop]]
+        if centers is not None:
+            groupRows = np.abs(groupRows - centers[group])
+        groupValues[group] = np.sort(groupRows[np.isfinite(groupRows)])
+    return groupValues
+
+
+# _sortedGroupValues() of one partition for selection, read once per worker (workers run one task at a time)
+def _selectionValues(selection, snapshotDir, customer, column, groupBy, centers, window):
+    key = (selection, customer)
+    if key in _workerValues:
+        _workerValues.move_to_end(key)
+        return _workerValues[key]
+
+    groupValues = _sortedGroupValues(snapshotDir, customer, column, groupBy, centers, window)
+    _workerValues[key] = groupValues
+    while len(_workerValues) > maxWorkerValues:
+        _workerValues.popitem(last=False)
+    return groupValues
+
+
+# {group: (count, min, max)} of column in one partition
+def _groupSummary(selection, snapshotDir, customer, column, groupBy, centers=None, window=None):
+    groupValues = _selectionValues(selection, snapshotDir, customer, column, groupBy, centers, window)
+    return {group: (len(values), values[0], values[-1]) for group, values in groupValues.items() if len(values)}
+
+
+# One selection round in one partition. searches are (id, group, low, high, closed, edges): the values in [low, high)
+# ([low, high] when closed) are sent back when edges is None, else their count, min and max per edges bucket
+def _selectionRound(selection, snapshotDir, customer, column, groupBy, centers, window, searches):
+    groupValues = _selectionValues(selection, snapshotDir, customer, column, groupBy, centers, window)
+    answers = {}
+
+    for searchId, group, low, high, closed, edges in searches:
+        values = groupValues.get(group)
+        if values is None:
+            continue
+        values = values[np.searchsorted(values, low, "left"):np.searchsorted(values, high, "right" if closed else "left")]
+        if len(values) == 0:
+            continue
+
+        if edges is None:
+            answers[searchId] = values
+            continue
+
+        # Bucket b holds edges[b] <= value < edges[b + 1], the last one also its right edge (like np.histogram)
+        cuts = np.concatenate([[0], np.searchsorted(values, edges[1:-1], "left"), [len(values)]])
+        counts = np.diff(cuts)
+        filled = counts > 0
+        lows = np.where(filled, values[np.minimum(cuts[:-1], len(values) - 1)], np.inf)
+        highs = np.where(filled, values[np.maximum(cuts[1:] - 1, 0)], -np.inf)
+        answers[searchId] = (counts, lows, highs)
+
+    return answers
+
+
+# {group: [quantile per probability]} of column over every partition (linear interpolation like pandas, medians as the
+# midpoint like groupby().median()), |value - centers[group]| when centers are given
+# Each wanted rank is searched for on its own: every round the partitions count their values in selectBuckets buckets
+# of the rank's interval and the interval shrinks to the bucket the rank falls in, until it holds a single value or
+# few enough values to send back.
+def partitionQuantiles(pool, snapshotDir, customers, column, probabilities, groupBy=None, centers=None, window=None):
+    # Identifies this selection's values in the workers' caches
+    selection = uuid.uuid4().hex
+    partitionArgs = [(selection, snapshotDir, customer, column, groupBy, centers, window) for customer in customers]
+
+    merged = {}
+    summaries = pool.map(_groupSummary, *zip(*partitionArgs)) if customers else []
+    for summary in summaries:
+        for group, (count, low, high) in summary.items():
+            total, groupLow, groupHigh = merged.get(group, (0, np.inf, -np.inf))
+            merged[group] = (total + count, min(groupLow, low), max(groupHigh, high))
+
+    # (group, rank) -> search state: interval, values below it, values/min/max inside it
+    searches = {}
+    for group, (count, low, high) in merged.items():
+        for probability in probabilities:
+            rank = int(np.floor((count - 1) * probability))
+            for wanted in {rank, min(rank + 1, count - 1)}:
+                searches[(group, wanted)] = {"low": -np.inf, "high": np.inf, "closed": True, "below": 0, "count": count, "min": low, "max": high}
+
+    found = {}
+    for roundNumber in range(maxSelectRounds + 1):
+        for key, search in searches.items():
+            if key not in found and search["min"] == search["max"]:
+                found[key] = search["min"]
+        pending = [key for key in searches if key not in found]
+        if not pending:
+            break
+
+        roundSearches = []
+        for searchId, key in enumerate(pending):
+            search = searches[key]
+            sendValues = search["count"] <= selectValues or roundNumber == maxSelectRounds
+            search["edges"] = None if sendValues else np.linspace(search["min"], search["max"], selectBuckets + 1)
+            roundSearches.append((searchId, key[0], search["low"], search["high"], search["closed"], search["edges"]))
+
+        answers = list(pool.map(_selectionRound, *zip(*[args + (roundSearches,) for args in partitionArgs])))
+
+        for searchId, key in enumerate(pending):
+            search = searches[key]
+            parts = [answer[searchId] for answer in answers if searchId in answer]
+
+            if search["edges"] is None:
+                found[key] = np.sort(np.concatenate(parts))[key[1] - search["below"]]
+                continue
+
+            counts = np.sum([part[0] for part in parts], axis=0)
+            lows = np.min([part[1] for part in parts], axis=0)
+            highs = np.max([part[2] for part in parts], axis=0)
+            cumulative = np.cumsum(counts)
+            bucket = int(np.searchsorted(cumulative, key[1] - search["below"], "right"))
+
+            search["below"] += int(cumulative[bucket - 1]) if bucket else 0
+            search["low"], search["high"] = search["edges"][bucket], search["edges"][bucket + 1]
+            search["closed"] = bucket == selectBuckets - 1
+            search["count"], search["min"], search["max"] = int(counts[bucket]), lows[bucket], highs[bucket]
+
+    quantiles = {}
+    for group, (count, _, _) in merged.items():
+        groupQuantiles = []
+        for probability in probabilities:
+            position = (count - 1) * probability
+            rank = int(np.floor(position))
+            low, high = found[(group, rank)], found[(group, min(rank + 1, count - 1))]
+            fraction = position - rank
+            if probability == 0.5 and fraction:
+                groupQuantiles.append((low + high) / 2)
+            else:
+                groupQuantiles.append(low + (high - low) * fraction)
+        quantiles[group] = groupQuantiles
+    return quantiles
+
+
+# Same rows as outliers.outlierMask with limits worked out over every partition
+def _applyLimits(frame, limits, groupBy):
+    keep = np.ones(len(frame), dtype=bool)
+    for col, (groups, (lower, upper)) in limits.items():
+        if groupBy is None:
+            codes = np.zeros(len(frame), dtype=np.intp)
+        else:
+            codes = groups.get_indexer(frame[groupBy])
+
+        # Groups missing from the limits (no values at all) keep nothing, like NaN limits
+        lower, upper = np.append(lower, np.nan), np.append(upper, np.nan)
+        values = frame[col].to_numpy()
+        keep &= values < upper[codes]
+        keep &= values >= np.maximum(lower, 0)[codes]
+    return keep
+
+
+# Columns to read and derived columns to add for the CO2/regime/outlier columns (plus any extra columns)
+def pipelineColumns(co2Cols, regimeCol, limitColumns, groupBy, extraColumns=()):
+    derivedColumns = list(dict.fromkeys(list(co2Cols) + [regimeCol] + list(limitColumns) + list(extraColumns)))
+    columns = list(dict.fromkeys(baseColumns + [col for name in derivedColumns for col in rawSources(name)] + ([groupBy] if groupBy else [])))
+    return columns, derivedColumns
+
+
+# Kept rows of a partition (only towers when given) sorted by tower/time with their New_CycleNum, and its TowerIndex
+# (None when the partition has no rows). Rows are read from loadWindow and numbered over it, only those in dateWindow
+# are returned (like the pages' load/date windows). Runs in a worker, limits come from outlierLimits()
+def partitionRows(snapshotDir, customer, towers, columns, derivedColumns, limits, groupBy, loadWindow=None, dateWindow=None):
+    frame = _readPartition(snapshotDir, customer, columns, derivedColumns, towers, loadWindow)
+    if frame is None or frame.empty:
+        return None, None
+
+    keep = _applyLimits(frame, limits, groupBy) if limits else None
+    index = TowerIndex(frame, keep)
+    rows = index.select(frame, index.towers, dateWindow)
+    if rows.empty:
+        return None, None
+    return rows, index
+
+
+# One unit of work: kept rows with New_CycleNum and the regime cube of a partition (or a batch of its towers)
+def _runPartition(snapshotDir, customer, towers, columns, derivedColumns, limits, groupBy, co2Cols, regimeCol, regimeWidth, spillDir, spillBytes,
+                  loadWindow=None, dateWindow=None):
+    rows, index = partitionRows(snapshotDir, customer, towers, columns, derivedColumns, limits, groupBy, loadWindow, dateWindow)
+    if rows is None:
+        return None
+
+    cube = regimes.regimeCube(rows, co2Cols, regimeCol, regimeWidth)
+
+    result = {"customer": customer, "rowCount": len(rows), "towers": index.towers, "purityTowers": index.purityTowers, "cube": cube, "rows": rows}
+    if rows.memory_usage(deep=True).sum() > spillBytes:
+        path = os.path.join(spillDir, f"{uuid.uuid4().hex}.parquet")
+        rows.to_parquet(path, index=False)
+        result["rows"] = path
+    return result
+
+
+# Rows a worker reads at once for columns/derived columns within its share of memoryBudget
+def rowBudget(memoryBudget, workers, columns, derivedColumns):
+    return max(1, memoryBudget // workers // (bytesPerValue * (len(columns) + len(derivedColumns))))
+
+
+# Batches of towers ({tower: rows}) of at most budget rows each, a tower is never split
+def towerBatches(towerRows, budget):
+    batches, batch, batchRows = [], [], 0
+    for tower, rows in towerRows.items():
+        if batch and batchRows + rows > budget:
+            batches.append(batch)
+            batch, batchRows = [], 0
+        batch.append(tower)
+        batchRows += rows
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# Customer -> batches of towers that fit budget rows (None for the whole partition), only towers when given
+def _plan(snapshotDir, customers, budget, towers=None):
+    _useSnapshot(snapshotDir)
+    units = []
+    for customer in customers:
+        towerRows, _ = snapshot.readCustomers([customer], ["DAC_TowerName"], towers)
+        if towerRows is None or towerRows.empty:
+            continue
+        counts = towerRows["DAC_TowerName"].value_counts(sort=False).sort_index()
+        if counts.sum() <= budget:
+            units.append((customer, None if towers is None else list(counts.index)))
+        else:
+            units.extend((customer, batch) for batch in towerBatches(counts, budget))
+    return units
+
+
+def newPool(workers=None):
+    # spawn: forking a process with Streamlit's threads running can leave locks held in the children
+    return ProcessPoolExecutor(workers or os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+
+
+# The process-wide pool the pages share (started on first use)
+def sharedPool():
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            _pool = newPool()
+        return _pool
+
+
+# Outlier limits of limitColumns over every one of customers' partitions (worked out in the pool), for partitionRows()
+# {column: (groups, (lower, upper))}, the rows of loadWindow only when given
+def outlierLimits(pool, snapshotDir, customers, limitColumns, method="3 SD", groupBy=None, loadWindow=None):
+    limitColumns = list(limitColumns)
+    if not limitColumns:
+        return None
+
+    limits = {}
+    if method == "3 SD":
+        stats = list(pool.map(_limitStats, *zip(*[(snapshotDir, customer, limitColumns, groupBy, loadWindow) for customer in customers]))) if customers else []
+        for col in limitColumns:
+            limits[col] = _mergeSdLimits(stats, col)
+        return limits
+
+    for col in limitColumns:
+        if method == "IQR":
+            quartiles = partitionQuantiles(pool, snapshotDir, customers, col, [0.25, 0.75], groupBy, window=loadWindow)
+            colGroups = pd.Index(list(quartiles))
+            low, high = np.array([quartiles[group] for group in colGroups]).reshape(-1, 2).T
+            spread = (high - low) * iqrWidth
+            lower, upper = low - spread, high + spread
+        else:
+            centers = {group: values[0] for group, values in partitionQuantiles(pool, snapshotDir, customers, col, [0.5], groupBy, window=loadWindow).items()}
+            deviations = partitionQuantiles(pool, snapshotDir, customers, col, [0.5], groupBy, centers, loadWindow)
+            colGroups = pd.Index(list(centers))
+            center = np.array([centers[group] for group in colGroups])
+            spread = np.array([deviations[group][0] for group in colGroups]) * madScale * madWidth
+            lower, upper = center - spread, center + spread
+        limits[col] = (colGroups, (lower, upper))
+    return limits
+
+
+# Array Tracking pipeline over the snapshot's customers (every customer on disk when None), only towers when given
+# limitColumns are the outlier filter's columns (empty keeps every row), method/groupBy as in outliers.outlierMask.
+# loadWindow/dateWindow are the pages' windows: rows are read (and numbered) from the first, the second picks the rows
+# that come back. pool is a newPool() to reuse (one is started and shut down when None). Call close() on the result
+# when done with it.
+def runArrayPipeline(customers=None, co2Cols=None, regimeCol=regimes.defaultBinColumn, regimeWidth=regimes.defaultBinWidth, limitColumns=("CO2_Fox_g",),
+                     method="3 SD", groupBy=None, workers=None, memoryBudget=defaultMemoryBudget, spillDir=None, pool=None, towers=None,
+                     extraColumns=(), loadWindow=None, dateWindow=None):
+    snapshotDir = snapshot.snapshotDir
+    customers = snapshot.customers() if customers is None else list(customers)
+    co2Cols = list(co2Cols or ["CO2 Production Purity-Corrected (kg/hr)"])
+    columns, derivedColumns = pipelineColumns(co2Cols, regimeCol, limitColumns, groupBy, extraColumns)
+
+    # workers is also what the memory budget is split by, pass the pool's worker count with a pool
+    workers = workers or os.cpu_count()
+    ownPool = pool is None
+    pool = pool or newPool(workers)
+    workerBytes = memoryBudget // workers
+    spillDir = tempfile.mkdtemp(prefix="processEngine-", dir=spillDir)
+
+    try:
+        limits = outlierLimits(pool, snapshotDir, customers, limitColumns, method, groupBy, loadWindow)
+        units = _plan(snapshotDir, customers, rowBudget(memoryBudget, workers, columns, derivedColumns), towers)
+        futures = [pool.submit(_runPartition, snapshotDir, customer, unitTowers, columns, derivedColumns, limits, groupBy, co2Cols, regimeCol, regimeWidth,
+                               spillDir, workerBytes, loadWindow, dateWindow) for customer, unitTowers in units]
+        partitions = [result for result in (future.result() for future in futures) if result is not None]
+
+    except BaseException:
+        shutil.rmtree(spillDir, ignore_errors=True)
+        raise
+    finally:
+        if ownPool:
+            pool.shutdown()
+
+    return EngineResult(partitions, limits, spillDir)
+
+
+# runArrayPipeline() result for key (which has to cover every input, the snapshot's parts included), run in the
+# shared pool when it isn't cached. Cached results belong to the cache, don't close() them
+def cachedArrayPipeline(key, **pipelineArgs):
+    with _resultsLock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key]
+
+    result = runArrayPipeline(pool=sharedPool(), **pipelineArgs)
+
+    with _resultsLock:
+        _results[key] = result
+        while len(_results) > maxResults:
+            _, dropped = _results.popitem(last=False)
+            dropped.close()
+    return result
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+
+# Process-wide cache of built Plotly figures/traces
+# Every widget change reruns the page script, which used to rebuild every trace even when nothing it shows changed.
+# Figures are cached under a name plus the inputs they are built from (data key and version, columns, ranges, ...),
+# so a rerun with the same inputs gets the same object back. Cached figures are shared between sessions, treat them
+# as read only.
+
+# Figures/traces kept, least recently used ones are dropped first
+maxFigures = 256
+
+
+class FigureCache:
+
+    def __init__(self, maxEntries):
+        self.maxEntries = maxEntries
+
+        # (name, inputs) -> figure, ordered oldest use -> newest use
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # name -> {"rebuilt": n, "reused": n}
+        self._counts = {}
+
+    # Cached figure for name/inputs, build() is only called when there is none (inputs has to be hashable)
+    def get(self, name, inputs, build):
+        key = (name, inputs)
+
+        with self._lock:
+            counts = self._counts.setdefault(name, {"rebuilt": 0, "reused": 0})
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                counts["reused"] += 1
+                return self._entries[key]
+
+        figure = build()
+
+        with self._lock:
+            counts["rebuilt"] += 1
+            self._entries[key] = figure
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+        return figure
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # Rebuild/reuse counts per figure name
+    def stats(self):
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
+
+
+figureCache = FigureCache(maxFigures)
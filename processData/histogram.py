@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+
+# Binned statistics for the main page histogram
+# px.histogram ships every row to the browser and bins there. Here the rows are binned on the server (one bincount per
+# statistic over (customer, bin) cells) and only the bins go out as bar traces, so the payload follows the bin count.
+
+defaultBins = 50
+
+
+# Bins of xCol with the row count and mean yCol of every (group, bin) cell
+# Returns (x, widths, groups, counts, means): x is the bin centers (the categories when xCol isn't numeric, widths is
+# then None), counts/means are group x bin arrays (means is None when yCol isn't numeric)
+def binnedStats(frame, xCol, yCol, bins=defaultBins, groupCol="CustomerName"):
+    groupCodes, groups = pd.factorize(frame[groupCol], sort=True)
+
+    if pd.api.types.is_numeric_dtype(frame[xCol]):
+        xValues = frame[xCol].to_numpy(dtype=np.float64)
+        valid = np.isfinite(xValues)
+        edges = np.histogram_bin_edges(xValues[valid], bins) if valid.any() else np.array([0.0, 1.0])
+        binCount = len(edges) - 1
+
+        # Right edge of the last bin is included (like np.histogram)
+        binCodes = np.clip(np.searchsorted(edges, xValues, side="right") - 1, 0, binCount - 1)
+        x, widths = (edges[:-1] + edges[1:]) / 2, np.diff(edges)
+    else:
+        binCodes, x = pd.factorize(frame[xCol], sort=True)
+        valid = binCodes >= 0
+        binCount = len(x)
+        x, widths = np.asarray(x), None
+
+    yNumeric = pd.api.types.is_numeric_dtype(frame[yCol])
+    if yNumeric:
+        yValues = frame[yCol].to_numpy(dtype=np.float64)
+        valid = valid & ~np.isnan(yValues)
+
+    valid &= groupCodes >= 0
+    cells = groupCodes[valid] * binCount + binCodes[valid]
+    cellCount = len(groups) * binCount
+
+    counts = np.bincount(cells, minlength=cellCount).reshape(len(groups), binCount)
+    means = None
+    if yNumeric:
+        sums = np.bincount(cells, weights=yValues[valid], minlength=cellCount).reshape(len(groups), binCount)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+
+    return x, widths, list(groups), counts, means
@@ -0,0 +1,160 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+# Chunked ingestion of SQL results
+# pd.read_sql on the whole result builds every row as Python objects before the frame exists, which peaks at
+# several times the final frame size. Here rows come in fixed-size chunks that are compacted as they arrive
+# (string keys -> categoricals, float64/int64 -> smaller types where nothing is lost), so the peak is roughly
+# the compact frame plus one raw chunk.
+# Categoricals are the dictionary encoding: every row holds a small integer code into one array of the distinct
+# values, so a million ProdDate/ProdTime strings cost a few MB of codes instead of a Python string per row.
+
+chunkRows = 50_000
+
+# String columns with few distinct values (relative to the rows) that are stored as categoricals
+categoryColumns = ["CustomerName", "DAC_TowerName", "ProdDate", "ProdTime"]
+
+# Categorical columns kept ordered by their values (sorted, compared and min/max'ed as dates/times)
+orderedColumns = ["ProdDate", "ProdTime"]
+
+# ProdDate + ProdTime parsed into one datetime64 column, added to every chunk (rows are ordered/windowed by it)
+timestampColumn = "ProdTimestamp"
+
+# Per thread: callbacks readChunked hands every compacted chunk to (see chunkListener)
+_listeners = threading.local()
+
+
+# Shrink a chunk in place: categoricals for the key strings, smallest int type, float32 where nothing is lost
+# (and add the parsed timestamps)
+def compactFrame(frame):
+    encodeKeys(frame)
+
+    for col in frame.columns:
+        values = frame[col]
+
+        if col in categoryColumns:
+            continue
+
+        if values.dtype == np.int64:
+            frame[col] = pd.to_numeric(values, downcast="integer")
+
+        elif values.dtype == np.float64 and _fitsFloat32(values.to_numpy()):
+            frame[col] = values.to_numpy().astype(np.float32)
+
+    return addTimestamps(frame)
+
+
+# Whether float64 values can be stored as float32 without changing any of them (every finite value reads back exactly)
+def _fitsFloat32(values):
+    finite = values[np.isfinite(values)]
+    return np.array_equal(finite.astype(np.float32).astype(np.float64), finite)
+
+
+# Dictionary-encode the categoryColumns of frame in place (frames read back from older snapshot parts may have strings)
+def encodeKeys(frame):
+    for col in categoryColumns:
+        if col not in frame.columns:
+            continue
+        values = encoded = frame[col]
+        if not isinstance(encoded.dtype, pd.CategoricalDtype):
+            encoded = encoded.astype("category")
+        # Parquet dictionaries keep their values in the order they were first seen
+        if col in orderedColumns and not (encoded.cat.ordered and encoded.cat.categories.is_monotonic_increasing):
+            encoded = encoded.cat.reorder_categories(encoded.cat.categories.sort_values(), ordered=True)
+        if encoded is not values:
+            frame[col] = encoded
+    return frame
+
+
+# Parse a column through its distinct values (dates/times repeat a lot, parsing each row is most of the cost)
+def _parseDistinct(values, parse):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    parsed = np.asarray(parse(pd.Series(uniques)))
+    return np.where(codes >= 0, parsed[np.maximum(codes, 0)], parsed.dtype.type("NaT"))
+
+
+# datetime64[ns] timestamps of ProdDate + ProdTime (dates/times as strings, date/time objects or datetime64)
+def prodTimestamps(frame):
+    dates = _parseDistinct(frame["ProdDate"], lambda values: pd.to_datetime(values).dt.normalize().to_numpy(dtype="datetime64[ns]"))
+
+    times = frame["ProdTime"]
+    if pd.api.types.is_datetime64_any_dtype(times):
+        offsets = (times - times.dt.normalize()).to_numpy(dtype="timedelta64[ns]")
+    else:
+        offsets = _parseDistinct(times, lambda values: pd.to_timedelta(values.astype(str)).to_numpy(dtype="timedelta64[ns]"))
+
+    return dates + offsets
+
+
+# Add the timestamp column to frame in place (when it has ProdDate and ProdTime and no timestamps yet)
+def addTimestamps(frame):
+    if timestampColumn not in frame.columns and "ProdDate" in frame.columns and "ProdTime" in frame.columns:
+        frame[timestampColumn] = prodTimestamps(frame)
+    return frame
+
+
+# pd.concat that keeps categorical columns categorical (plain concat falls back to object when categories differ)
+def concatFrames(frames):
+    frames = [frame for frame in frames if frame is not None]
+    if len(frames) == 1:
+        return frames[0]
+
+    result = pd.concat(frames, ignore_index=True)
+
+    for col in result.columns:
+        parts = [frame[col] for frame in frames if col in frame.columns]
+        if len(parts) == len(frames) and all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            # Categories come out sorted, so parts that were ordered stay ordered
+            combined = union_categoricals(parts, sort_categories=True, ignore_order=True)
+            result[col] = combined.as_ordered() if all(part.cat.ordered for part in parts) else pd.Categorical(combined)
+
+    return result
+
+
+# Inside the with block every chunk read on this thread is passed to callback(chunk) as soon as it is compacted
+# (background loads publish partial results this way, the callback can raise to stop the read)
+@contextmanager
+def chunkListener(callback):
+    if not hasattr(_listeners, "callbacks"):
+        _listeners.callbacks = []
+
+    _listeners.callbacks.append(callback)
+    try:
+        yield
+    finally:
+        _listeners.callbacks.remove(callback)
+
+
+# Number of rows a SELECT will return, for the progress bar
+def countRows(conn, sql, params):
+    countSql = "SELECT COUNT(*) FROM (" + sql + ") AS countedRows"
+    return int(pd.read_sql(sql=countSql, con=conn, params=params).iloc[0, 0])
+
+
+# Read a query chunk by chunk, compacting each chunk before the next one is fetched
+# progress(rowsRead, totalRows) is called after every chunk (totalRows may be None when it isn't known)
+def readChunked(conn, sql, params, progress=None, totalRows=None):
+    chunks = []
+    rowsRead = 0
+
+    for chunk in pd.read_sql(sql=sql, con=conn, params=params, chunksize=chunkRows):
+        chunks.append(compactFrame(chunk))
+        rowsRead += len(chunk)
+        for callback in getattr(_listeners, "callbacks", ()):
+            callback(chunks[-1])
+        if progress is not None:
+            progress(rowsRead, totalRows)
+
+    if not chunks:
+        # Older pandas yields no chunk at all for an empty result, still return the columns
+        return pd.read_sql(sql=sql, con=conn, params=params)
+
+    return concatFrames(chunks)
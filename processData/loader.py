@@ -0,0 +1,155 @@
+import threading
+
+from processData import access, connections, ingest
+
+
+# Background loading for the main page
+# "Load Data" used to block the script until the whole SELECT was read. A BackgroundLoad reads one customer at a time
+# (in the order they were picked) on its own thread and publishes every chunk as it arrives, so the page can draw
+# what is there on its next rerun and refine as more comes in. Sessions waiting on the same data share one load,
+# which is cancelled once no session wants it anymore (e.g. the customer selection changed mid-load).
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+class BackgroundLoad:
+
+    def __init__(self, customers, requested, tableColumns, window=None):
+        self.key = access.makeKey(customers, requested, tableColumns, window)
+        self.customers = list(dict.fromkeys(customers))
+        self.requested = list(requested)
+        self.tableColumns = list(tableColumns)
+        self.window = window
+
+        # Bumped every time rows are published
+        self.version = 0
+        self.customersDone = 0
+        self.error = None
+        self.finished = False
+
+        # Session tokens waiting on this load
+        self.watchers = set()
+
+        # Frames of the finished customers, chunks of the one being read, last partial frame as (version, frame)
+        self._frames = []
+        self._chunks = []
+        self._partial = (None, None)
+        self._lock = threading.Lock()
+
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="BackgroundLoad", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    # Stops the load at the next chunk, nothing is cached for key
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def rowsRead(self):
+        with self._lock:
+            return sum(len(frame) for frame in self._frames + self._chunks)
+
+    # Rows read so far as one frame (None before the first chunk), only rebuilt when new rows arrived
+    def partialFrame(self):
+        with self._lock:
+            version, frames = self.version, self._frames + self._chunks
+
+        if self._partial[0] != version:
+            self._partial = (version, ingest.concatFrames(frames) if frames else None)
+        return self._partial[1]
+
+    def _onChunk(self, chunk):
+        if self._cancelled.is_set():
+            raise LoadCancelled()
+
+        with self._lock:
+            self._chunks.append(chunk)
+            self.version += 1
+
+    def _run(self):
+        # Connection leased to this thread (the session's own connection stays with its script thread)
+        conn = connections.acquire()
+        customerKeys = []
+
+        try:
+            with ingest.chunkListener(self._onChunk):
+                for customer in self.customers:
+                    if self._cancelled.is_set():
+                        raise LoadCancelled()
+
+                    # Each customer goes through the normal cache/snapshot/SQL path on its own key
+                    customerKey = access.makeKey([customer], self.requested, self.tableColumns, self.window)
+                    if customerKey != self.key and access.sharedCache.peek(customerKey) is None:
+                        customerKeys.append(customerKey)
+                    frame = access.getFrame(conn, customerKey, self.tableColumns)
+
+                    with self._lock:
+                        self._frames.append(frame)
+                        self._chunks = []
+                        self.customersDone += 1
+                        self.version += 1
+
+            # A single customer was already cached under key by getFrame
+            if len(self.customers) > 1:
+                access.storeFrame(self.key, ingest.concatFrames(self._frames))
+
+        except LoadCancelled:
+            pass
+        except Exception as error:
+            self.error = error
+
+        finally:
+            # Per-customer frames are only a step towards key, don't keep them twice
+            for customerKey in customerKeys:
+                access.sharedCache.pop(customerKey)
+
+            pool = connections.sharedPool()
+            if pool is not None:
+                # A read stopped half way may leave results pending on the connection, don't hand that one out again
+                if self.cancelled or self.error is not None:
+                    pool.discard()
+                else:
+                    pool.release()
+
+            self.finished = True
+
+
+# key -> load, running loads and finished ones that a session hasn't picked up yet
+_loads = {}
+_loadsLock = threading.Lock()
+
+
+# Load for customers/requested columns (only the ProdDates of window when given), shared with any session already
+# waiting on the same data. token identifies the session, hand it back with release() once the load is done or not
+# wanted anymore
+def startLoad(token, customers, requested, tableColumns, window=None):
+    key = access.makeKey(customers, requested, tableColumns, window)
+
+    with _loadsLock:
+        load = _loads.get(key)
+        stale = load is not None and (load.cancelled or load.error is not None or (load.finished and access.sharedCache.peek(key) is None))
+        if load is None or stale:
+            load = BackgroundLoad(customers, requested, tableColumns, window).start()
+            _loads[key] = load
+        load.watchers.add(token)
+
+    return load
+
+
+# Session token stops waiting on load, the load is cancelled when no session is left waiting on it
+def release(load, token):
+    with _loadsLock:
+        load.watchers.discard(token)
+        if not load.watchers:
+            if not load.finished:
+                load.cancel()
+            if _loads.get(load.key) is load:
+                del _loads[load.key]
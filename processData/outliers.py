@@ -0,0 +1,125 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+
+# Outlier filtering shared by both pages
+# Limits are worked out per column (optionally per customer/tower) and combined into one boolean mask, so the pages
+# index the frame once instead of copying it for every bound. Limits and masks are cached per data key and version,
+# a refresh (new version) drops them.
+
+# Lower limits are clipped at 0 for every method (negative production/sensor values are never kept)
+methods = {
+    "3 SD": "Mean +/- 3 standard deviations",
+    "MAD": "Median +/- 3 scaled median absolute deviations",
+    "IQR": "Quartiles +/- 1.5 interquartile ranges",
+}
+
+# Columns the limits can be worked out per group of
+groupings = {
+    "All Data": None,
+    "Per Customer": "CustomerName",
+    "Per Tower": "DAC_TowerName",
+}
+
+sdWidth = 3
+madWidth = 3
+iqrWidth = 1.5
+
+# MAD * madScale estimates the standard deviation of normally distributed data
+madScale = 1.4826
+
+# Data keys whose limits/masks are kept, the least recently used ones are dropped first
+maxCachedKeys = 16
+
+# dataKey -> (version, {entry key -> limits or mask}), ordered oldest use -> newest use
+_cache = OrderedDict()
+_cacheLock = threading.Lock()
+
+
+def _cached(cacheKey, entry, compute):
+    if cacheKey is None:
+        return compute()
+
+    dataKey, version = cacheKey
+    with _cacheLock:
+        cachedVersion, entries = _cache.get(dataKey, (None, None))
+        if cachedVersion == version and entry in entries:
+            _cache.move_to_end(dataKey)
+            return entries[entry]
+
+    value = compute()
+
+    with _cacheLock:
+        cachedVersion, entries = _cache.get(dataKey, (None, None))
+        if cachedVersion != version:
+            entries = {}
+            _cache[dataKey] = (version, entries)
+        entries[entry] = value
+        _cache.move_to_end(dataKey)
+        while len(_cache) > maxCachedKeys:
+            _cache.popitem(last=False)
+
+    return value
+
+
+# Row -> group number for groupBy (all rows in group 0 when there is no grouping)
+def _groupCodes(frame, groupBy):
+    if groupBy is None:
+        return np.zeros(len(frame), dtype=np.intp), 1
+
+    codes, groups = pd.factorize(frame[groupBy], use_na_sentinel=False)
+    return codes, len(groups)
+
+
+# (lower, upper) limit per group for one column
+def columnLimits(values, codes, groupCount, method):
+    grouped = values.groupby(codes)
+
+    if method == "3 SD":
+        center = grouped.mean()
+        spread = grouped.std(ddof=0) * sdWidth
+        lower, upper = center - spread, center + spread
+
+    elif method == "MAD":
+        center = grouped.median()
+        deviation = (values - center.reindex(range(groupCount)).to_numpy()[codes]).abs()
+        spread = deviation.groupby(codes).median() * madScale * madWidth
+        lower, upper = center - spread, center + spread
+
+    elif method == "IQR":
+        lowQuartile = grouped.quantile(0.25)
+        highQuartile = grouped.quantile(0.75)
+        spread = (highQuartile - lowQuartile) * iqrWidth
+        lower, upper = lowQuartile - spread, highQuartile + spread
+
+    else:
+        raise ValueError("Unknown outlier method: " + str(method))
+
+    return lower.reindex(range(groupCount)).to_numpy(), upper.reindex(range(groupCount)).to_numpy()
+
+
+# Boolean mask of the rows that are inside the limits of every numeric column in columns (other columns, like a
+# CustomerName axis, have no outliers, so with none left every row is kept)
+# cacheKey (dataKey, dataVersion) caches the limits and the mask until the data behind the key changes
+def outlierMask(frame, columns, method="3 SD", groupBy=None, cacheKey=None):
+    columns = [col for col in dict.fromkeys(columns) if is_numeric_dtype(frame[col])]
+
+    def computeMask():
+        codes, groupCount = _groupCodes(frame, groupBy)
+        keep = np.ones(len(frame), dtype=bool)
+
+        for col in columns:
+            lower, upper = _cached(cacheKey, ("limits", col, method, groupBy),
+                                   lambda: columnLimits(frame[col], codes, groupCount, method))
+
+            values = frame[col].to_numpy()
+            keep &= values < upper[codes]
+            keep &= values >= np.maximum(lower, 0)[codes]
+
+        return keep
+
+    return _cached(cacheKey, ("mask", tuple(columns), method, groupBy), computeMask)
@@ -0,0 +1,349 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from processData import derived, ingest
+
+
+# Query building for ProcessDataPerIndex
+# Every query uses "?" parameter markers and [bracket] quoted identifiers, which both pyodbc (SQL Server)
+# and sqlite3 accept, so the same SQL can be run against a local SQLite copy of the table.
+
+tableName = "ProcessDataPerIndex"
+
+# Columns that identify a row and that every load needs (Array Tracking sorts/groups on these)
+keyColumns = ["CustomerName", "DAC_TowerName", "ProdDate", "ProdTime", "CycleNumber"]
+
+# Raw columns each derived column is calculated from
+derivedColumnSources = {name: derived.rawSources(name) for name in derived.derivedMetrics}
+
+# Raw columns the Array Tracking page reads on top of its user selected second axis
+arrayTrackingColumns = ["CO2_Fox_g", "DAC_CO2_Percent", "AirRelHumid_In"]
+
+
+# Catalog queries for the sidebar (customer names and the column names, which keep their case)
+customerNamesQuery = f"SELECT DISTINCT CustomerName FROM {tableName}"
+columnNamesQuery = f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = '{tableName}'"
+
+
+# Quote a column name for SQL Server / SQLite
+def quoteColumn(col):
+    return "[" + col.replace("]", "]]") + "]"
+
+
+# Turn the columns the pages ask for (axes, derived columns, ...) into the raw table columns we have to select
+# Derived columns are swapped for their sources, anything not in the table is dropped and order is kept
+def neededColumns(requested, tableColumns):
+    tableColumns = set(tableColumns)
+    columns = []
+
+    for col in list(keyColumns) + list(requested):
+        for rawCol in derivedColumnSources.get(col, [col]):
+            if rawCol in tableColumns and rawCol not in columns:
+                columns.append(rawCol)
+
+    return columns
+
+
+# ProdDate condition for window (first date, last date), both days included, returns (sql, params)
+def windowCondition(window):
+    first, last = window
+    return "ProdDate >= ? AND ProdDate < ?", [first, last + datetime.timedelta(days=1)]
+
+
+# Build the SELECT for a set of customers and columns (only rows inside window when there is one), returns (sql, params)
+def buildSelectQuery(customers, columns, window=None):
+    if not customers:
+        raise ValueError("No Customer Specified!")
+
+    colSql = ", ".join(quoteColumn(col) for col in columns) if columns else "*"
+    markers = ", ".join("?" for _ in customers)
+
+    sql = f"SELECT {colSql} FROM {tableName} WHERE CustomerName IN ({markers})"
+    params = list(customers)
+
+    if window is not None:
+        windowSql, windowParams = windowCondition(window)
+        sql += " AND " + windowSql
+        params += windowParams
+
+    return sql, params
+
+
+# Run a SELECT through the chunked reader, counting the rows first when there is a progress callback
+def readQuery(conn, sql, params, progress=None):
+    totalRows = ingest.countRows(conn, sql, params) if progress is not None else None
+    return ingest.readChunked(conn, sql, params, progress=progress, totalRows=totalRows)
+
+
+# Load the rows for customers/columns, only querying what existingDf does not already hold
+# - New customers are queried on their own and appended
+# - If a needed column is missing, the already loaded customers are re-queried with the wider column list
+# window (first date, last date) limits every query to those ProdDates (existingDf has to be limited the same way)
+def loadProcessData(conn, customers, requested, tableColumns, existingDf=None, progress=None, window=None):
+    columns = neededColumns(requested, tableColumns)
+
+    if existingDf is None or existingDf.empty:
+        sql, params = buildSelectQuery(customers, columns, window)
+        return readQuery(conn, sql, params, progress)
+
+    # Only keep the raw table columns (and timestamps), derived columns get recalculated by the caller
+    existingDf = existingDf[[col for col in existingDf.columns if col in set(tableColumns) or col == ingest.timestampColumn]]
+
+    loadedCustomers = list(existingDf["CustomerName"].unique())
+    newCustomers = [customer for customer in customers if customer not in loadedCustomers]
+    missingCols = [col for col in columns if col not in existingDf.columns]
+
+    if missingCols:
+        # Keep what was already loaded as well, so switching axes back and forth doesn't shrink the select
+        columns = columns + [col for col in existingDf.columns if col not in columns and col != ingest.timestampColumn]
+        sql, params = buildSelectQuery(loadedCustomers + newCustomers, columns, window)
+        return readQuery(conn, sql, params, progress)
+
+    if not newCustomers:
+        return existingDf
+
+    sql, params = buildSelectQuery(newCustomers, [col for col in existingDf.columns if col != ingest.timestampColumn], window)
+    newDf = readQuery(conn, sql, params, progress)
+
+    return ingest.concatFrames([existingDf, newDf])
+
+
+# Incremental refresh
+# ProcessDataPerIndex is append-mostly, so after the first load we only ask for rows past each tower's last
+# (ProdDate, ProdTime, CycleNumber). SQL narrows on ProdDate per tower, the exact cut is done in pandas.
+
+highWaterColumns = ["ProdDate", "ProdTime", "CycleNumber"]
+
+
+# Last (ProdDate, ProdTime, CycleNumber) per DAC_TowerName
+def highWaterMarks(frame):
+    last = frame.sort_values(highWaterColumns).groupby("DAC_TowerName", observed=True).tail(1)
+    marks = last.set_index("DAC_TowerName")[highWaterColumns]
+    marks.index = marks.index.astype(object)
+    return marks
+
+
+# numpy/pandas scalars -> plain python values the ODBC/sqlite drivers can bind
+def sqlValue(value):
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+# SELECT for the rows past marks (towers we have never seen come back in full), only inside window if there is one
+def buildNewRowsQuery(customers, columns, marks, window=None):
+    sql, params = buildSelectQuery(customers, columns, window)
+
+    towers = list(marks.index)
+    if not towers:
+        return sql, params
+
+    towerSql = " OR ".join("(DAC_TowerName = ? AND ProdDate >= ?)" for _ in towers)
+    towerMarkers = ", ".join("?" for _ in towers)
+    sql += f" AND ({towerSql} OR DAC_TowerName NOT IN ({towerMarkers}))"
+
+    for tower, prodDate in zip(towers, marks["ProdDate"]):
+        params += [sqlValue(tower), sqlValue(prodDate)]
+    params += [sqlValue(tower) for tower in towers]
+
+    return sql, params
+
+
+# Boolean mask of the rows in frame that come after their tower's mark
+def newerThanMarks(frame, marks):
+    aligned = marks.reindex(frame["DAC_TowerName"])
+    known = aligned["ProdDate"].notna().to_numpy()
+
+    newer = ~known
+    equal = known.copy()
+    # Lexicographic (ProdDate, ProdTime, CycleNumber) > mark, rows of unknown towers compare against themselves
+    for col in highWaterColumns:
+        values = frame[col].to_numpy(dtype=object)
+        markValues = np.where(known, aligned[col].to_numpy(dtype=object), values)
+        newer = newer | (equal & (values > markValues))
+        equal = equal & (values == markValues)
+
+    return newer
+
+
+# Rows for customers/columns that are newer than marks
+def loadNewRows(conn, customers, columns, marks, progress=None, window=None):
+    sql, params = buildNewRowsQuery(customers, columns, marks, window)
+    newDf = readQuery(conn, sql, params, progress)
+
+    if newDf.empty or marks.empty:
+        return newDf
+
+    return newDf[newerThanMarks(newDf, marks)].reset_index(drop=True)
+
+
+# Aggregation queries for the Array Tracking summaries
+# Cycle counts/date ranges per customer and mean/count/std per (tower, regime) come back from GROUP BY queries, so
+# the tables and regime bars don't need the raw rows. Std is worked out from COUNT/SUM/SUM of squares (SQLite has
+# no STDEV) and regimes from a floor written with CAST (SQLite may not have FLOOR).
+
+
+# SQL expression for a table column or a derived column that has a SQL template
+def columnSql(name):
+    if name in derived.derivedSql:
+        sources = derived.derivedMetrics[name][0]
+        return "(" + derived.derivedSql[name].format(*[columnSql(source) for source in sources]) + ")"
+    if name in derived.derivedMetrics:
+        raise ValueError(name + " has no SQL formula")
+    return quoteColumn(name)
+
+
+# WHERE for customers (and towers, ProdDate window), returns (sql, params)
+def _summaryWhere(customers, towers=None, window=None):
+    if not customers:
+        raise ValueError("No Customer Specified!")
+
+    sql = " WHERE CustomerName IN (" + ", ".join("?" for _ in customers) + ")"
+    params = [sqlValue(customer) for customer in customers]
+
+    if towers is not None:
+        sql += " AND DAC_TowerName IN (" + ", ".join("?" for _ in towers) + ")"
+        params += [sqlValue(tower) for tower in towers]
+
+    if window is not None:
+        windowSql, windowParams = windowCondition(window)
+        sql += " AND " + windowSql
+        params += windowParams
+
+    return sql, params
+
+
+# First and last ProdDate of customers
+def buildDateSpanQuery(customers):
+    where, params = _summaryWhere(customers)
+    return f"SELECT MIN(ProdDate) AS firstDate, MAX(ProdDate) AS lastDate FROM {tableName}" + where, params
+
+
+# Row count, sum and sum of squares of column (per groupBy), for mean/std based outlier limits
+def buildMomentsQuery(customers, column, groupBy=None, window=None):
+    expr = columnSql(column) + " * 1.0"
+    groupSql = quoteColumn(groupBy) + ", " if groupBy else ""
+
+    where, params = _summaryWhere(customers, window=window)
+    sql = f"SELECT {groupSql}COUNT({expr}) AS n, SUM({expr}) AS s, SUM({expr} * {expr}) AS ss FROM {tableName}" + where
+    if groupBy:
+        sql += " GROUP BY " + quoteColumn(groupBy)
+
+    return sql, params
+
+
+# Condition keeping the rows inside limits {group (None when ungrouped): (lower, upper)}, returns (sql, params)
+# Same bounds as outliers.outlierMask: lower <= value < upper with the lower limit clipped at 0
+def limitsCondition(column, limits, groupBy=None):
+    expr = columnSql(column)
+
+    parts, params = [], []
+    for group, (lower, upper) in limits.items():
+        part = f"{expr} >= ? AND {expr} < ?"
+        partParams = [max(float(lower), 0.0), float(upper)]
+        if groupBy:
+            part = f"{quoteColumn(groupBy)} = ? AND " + part
+            partParams = [sqlValue(group)] + partParams
+        parts.append("(" + part + ")")
+        params += partParams
+
+    if not parts:
+        return "1 = 0", []
+    return "(" + " OR ".join(parts) + ")", params
+
+
+# Total cycles, first and last ProdDate per tower and customer
+def buildTowerSummaryQuery(customers, towers, keepSql=None, keepParams=(), window=None):
+    sql = ("SELECT DAC_TowerName, CustomerName, COUNT(CycleNumber) AS [Total Cycles], "
+           f"MIN(ProdDate) AS [Start Date], MAX(ProdDate) AS [End Date] FROM {tableName}")
+    where, params = _summaryWhere(customers, towers, window)
+    sql += where
+
+    if keepSql:
+        sql += " AND " + keepSql
+        params += list(keepParams)
+
+    sql += " GROUP BY DAC_TowerName, CustomerName ORDER BY DAC_TowerName, CustomerName"
+    return sql, params
+
+
+# COUNT/SUM/SUM of squares of valueColumns per tower and binWidth wide regime of binColumn
+# (regime n covers n * binWidth <= value < (n + 1) * binWidth)
+def buildRegimeSummaryQuery(customers, towers, valueColumns, binColumn, binWidth, keepSql=None, keepParams=(), window=None):
+    binExpr = columnSql(binColumn) + " * 1.0 / ?"
+    regimeSql = f"CAST({binExpr} AS INT) - CASE WHEN {binExpr} < CAST({binExpr} AS INT) THEN 1 ELSE 0 END"
+    params = [float(binWidth)] * 3
+
+    # Regimes and values are worked out in a derived table, so the outer GROUP BY only needs the aliases
+    innerSql = f"SELECT DAC_TowerName, {regimeSql} AS regime"
+    outerSql = []
+    for i, col in enumerate(valueColumns):
+        innerSql += f", {columnSql(col)} * 1.0 AS v{i}"
+        outerSql.append(f"COUNT(v{i}) AS n{i}, SUM(v{i}) AS s{i}, SUM(v{i} * v{i}) AS ss{i}")
+    innerSql += f" FROM {tableName}"
+
+    where, whereParams = _summaryWhere(customers, towers, window)
+    innerSql += where + f" AND {columnSql(binColumn)} IS NOT NULL"
+    params += whereParams
+
+    if keepSql:
+        innerSql += " AND " + keepSql
+        params += list(keepParams)
+
+    sql = (f"SELECT DAC_TowerName, regime, COUNT(*) AS rowCount, " + ", ".join(outerSql) +
+           f" FROM ({innerSql}) AS binned GROUP BY DAC_TowerName, regime ORDER BY DAC_TowerName, regime")
+
+    return sql, params
+
+
+# Mean +/- width standard deviations of column per groupBy value ({None: limits} when ungrouped)
+def loadSdLimits(conn, customers, column, width, groupBy=None, window=None):
+    sql, params = buildMomentsQuery(customers, column, groupBy, window)
+    moments = pd.read_sql(sql=sql, con=conn, params=params)
+
+    n = moments["n"].to_numpy(dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = moments["s"].to_numpy(dtype=np.float64) / n
+        sd = np.sqrt(np.maximum(moments["ss"].to_numpy(dtype=np.float64) / n - mean ** 2, 0))
+
+    groups = moments[groupBy] if groupBy else [None] * len(moments)
+    return {group: (lower, upper) for group, lower, upper in zip(groups, mean - width * sd, mean + width * sd) if np.isfinite(lower)}
+
+
+# Tower/customer summary and the (tower, regime) x (column, stat) cube (same layout as regimes.regimeCube) from SQL
+# limits ({group: (lower, upper)} for limitColumn, grouped by limitGroupBy) drops outliers the same way the pages do
+# window (first date, last date) only counts rows of those ProdDates
+def loadArraySummaries(conn, customers, towers, valueColumns, binColumn, binWidth, limitColumn=None, limits=None, limitGroupBy=None, window=None):
+    keepSql, keepParams = limitsCondition(limitColumn, limits, limitGroupBy) if limitColumn else (None, [])
+
+    sql, params = buildTowerSummaryQuery(customers, towers, keepSql, keepParams, window)
+    towerSummary = pd.read_sql(sql=sql, con=conn, params=params)
+
+    sql, params = buildRegimeSummaryQuery(customers, towers, valueColumns, binColumn, binWidth, keepSql, keepParams, window)
+    sums = pd.read_sql(sql=sql, con=conn, params=params)
+
+    regimeIdx = sums["regime"].to_numpy(dtype=np.float64)
+    labels = [f"[{low:g}, {high:g})" for low, high in zip(regimeIdx * binWidth, (regimeIdx + 1) * binWidth)]
+
+    stats = {}
+    for i, col in enumerate(valueColumns):
+        n = sums[f"n{i}"].to_numpy(dtype=np.float64)
+        s = sums[f"s{i}"].to_numpy(dtype=np.float64)
+        ss = sums[f"ss{i}"].to_numpy(dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = s / n
+            std = np.sqrt(np.maximum(ss - n * mean ** 2, 0) / (n - 1))
+
+        stats[(col, "mean")] = mean
+        stats[(col, "count")] = n.astype(np.int64)
+        stats[(col, "std")] = np.where(n > 1, std, np.nan)
+
+    index = pd.MultiIndex.from_arrays([sums["DAC_TowerName"], labels], names=["DAC_TowerName", "Regime"])
+    cube = pd.DataFrame(stats, index=index)
+    cube.columns = pd.MultiIndex.from_tuples(list(stats), names=["Column", "Stat"])
+
+    return towerSummary, cube
@@ -0,0 +1,154 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Regime aggregation for the Array Tracking page
+# Rows are put in bins of binColumn (5% RH regimes by default) and mean/count/std of every value column is worked
+# out for each (tower, regime) cell in one pass: integer cell codes from np.digitize, sums from np.bincount.
+
+defaultBinColumn = "AirRelHumid_In"
+defaultBinWidth = 5
+
+statNames = ["mean", "count", "std"]
+
+# Most regimes values are split into, narrower widths are widened to a multiple of themselves
+maxBins = 500
+
+# Cubes kept, the least recently used ones are dropped first
+maxCubes = 64
+
+# inputs -> cube, ordered oldest use -> newest use
+_cubes = OrderedDict()
+_cubesLock = threading.Lock()
+
+# inputs -> (min, max) of a column, ordered oldest use -> newest use
+_spans = OrderedDict()
+_spansLock = threading.Lock()
+
+
+# Bin edges every binWidth covering values (RH keeps its 0, 5, ..., 100 edges)
+def binEdges(values, binWidth):
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return np.array([0.0, binWidth])
+
+    binWidth = cappedWidth(values, binWidth)
+
+    low = np.floor(values.min() / binWidth) * binWidth
+    high = (np.floor(values.max() / binWidth) + 1) * binWidth
+    return np.arange(low, high + binWidth / 2, binWidth)
+
+
+# binWidth, or the smallest multiple of it that splits values into at most maxBins regimes
+def cappedWidth(values, binWidth):
+    return spanWidth(valueSpan(values), binWidth)
+
+
+# (min, max) of the finite values, None when there are none
+def valueSpan(values):
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return None
+    return float(values.min()), float(values.max())
+
+
+# binWidth, or the smallest multiple of it that splits the values of span (min, max) into at most maxBins regimes
+def spanWidth(span, binWidth):
+    if span is None:
+        return binWidth
+
+    low, high = span
+    binCount = np.floor(high / binWidth) - np.floor(low / binWidth) + 1
+    factor = max(1, int(np.ceil(binCount / maxBins)))
+    while np.floor(high / (binWidth * factor)) - np.floor(low / (binWidth * factor)) + 1 > maxBins:
+        factor += 1
+    return binWidth * factor if factor > 1 else binWidth
+
+
+def regimeLabels(edges):
+    return [f"[{low:g}, {high:g})" for low, high in zip(edges[:-1], edges[1:])]
+
+
+# (tower, regime) x (column, stat) frame of mean/count/std for valueColumns, only cells holding rows are kept
+# Rows whose binColumn is missing aren't in any regime.
+def regimeCube(frame, valueColumns, binColumn=defaultBinColumn, binWidth=defaultBinWidth):
+    binValues = frame[binColumn].to_numpy(dtype=np.float64)
+    edges = binEdges(binValues, binWidth)
+    binCount = len(edges) - 1
+
+    towerCodes, towers = pd.factorize(frame["DAC_TowerName"], sort=True)
+    binCodes = np.digitize(binValues, edges) - 1
+
+    inRegime = (towerCodes >= 0) & (binCodes >= 0) & (binCodes < binCount)
+    cells = towerCodes * binCount + binCodes
+    cellCount = len(towers) * binCount
+
+    stats = {}
+    for col in valueColumns:
+        values = frame[col].to_numpy(dtype=np.float64)
+        valid = inRegime & ~np.isnan(values)
+        colCells, colValues = cells[valid], values[valid]
+
+        counts = np.bincount(colCells, minlength=cellCount)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.bincount(colCells, weights=colValues, minlength=cellCount) / counts
+            squares = np.bincount(colCells, weights=(colValues - means[colCells]) ** 2, minlength=cellCount)
+            stds = np.sqrt(squares / (counts - 1))
+
+        stats[(col, "mean")] = means
+        stats[(col, "count")] = counts
+        stats[(col, "std")] = np.where(counts > 1, stds, np.nan)
+
+    rows = np.bincount(cells[inRegime], minlength=cellCount) > 0
+    index = pd.MultiIndex.from_product([list(towers), regimeLabels(edges)], names=["DAC_TowerName", "Regime"])
+    cube = pd.DataFrame(stats, index=index)
+    cube.columns = pd.MultiIndex.from_tuples(cube.columns, names=["Column", "Stat"])
+
+    return cube[rows]
+
+
+# mean/count/std per regime of one tower and column (no rows when the tower has no rows in any regime)
+def towerRegimes(cube, tower, column):
+    if tower not in cube.index.get_level_values("DAC_TowerName"):
+        return pd.DataFrame(columns=statNames, index=pd.Index([], name="Regime"))
+    return cube[column].xs(tower, level="DAC_TowerName")
+
+
+# regimeCube cached under inputs (data key/version, row filter, towers, ...): rebuilt only when one of them changes
+def cachedRegimeCube(inputs, frame, valueColumns, binColumn=defaultBinColumn, binWidth=defaultBinWidth):
+    key = (inputs, tuple(valueColumns), binColumn, binWidth)
+
+    with _cubesLock:
+        if key in _cubes:
+            _cubes.move_to_end(key)
+            return _cubes[key]
+
+    cube = regimeCube(frame, valueColumns, binColumn, binWidth)
+
+    with _cubesLock:
+        _cubes[key] = cube
+        while len(_cubes) > maxCubes:
+            _cubes.popitem(last=False)
+
+    return cube
+
+
+# valueSpan of the column values() returns, cached under inputs (data key/version, column): the column is only read
+# when one of them changes
+def cachedSpan(inputs, values):
+    with _spansLock:
+        if inputs in _spans:
+            _spans.move_to_end(inputs)
+            return _spans[inputs]
+
+    span = valueSpan(values())
+
+    with _spansLock:
+        _spans[inputs] = span
+        while len(_spans) > maxCubes:
+            _spans.popitem(last=False)
+
+    return span
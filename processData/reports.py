@@ -0,0 +1,248 @@
+import argparse
+import html
+import json
+import os
+import time
+from urllib.parse import quote
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs
+
+from processData import downsample, engine, ingest, regimes, snapshot
+from processData.arrayFigures import buildArrayFigures, buildArrayPanel, colorList, customerTable
+from processData.outliers import groupings, methods
+
+
+# Batch Array Tracking reports
+#   python -m processData.reports --out reports --workers 8
+# Every tower of every customer in the local snapshot is rendered to a static HTML page (and its figures/tables to
+# JSON) with the Array Tracking page's own figure builders, fanned out over the engine's process pool, so reports
+# don't need anybody clicking through the page or any work on the interactive server.
+# manifest.json in the output directory keeps each tower's cycle count/last timestamp, the outlier limits its rows
+# were filtered with and the settings it was rendered with. Outlier limits are worked out over all the data on every
+# run, a later run renders the towers that got new cycles or whose limits moved since (everything when the settings
+# changed), so every report in the directory uses the current limits. With "All Data" limits any new cycles move them
+# for every tower, "Per Customer"/"Per Tower" limits only re-render that customer's/tower's reports.
+
+defaultOut = "reports"
+manifestName = "manifest.json"
+
+# Purity-corrected towers are reported in the purity-corrected column, the rest in the plain one (like the page's
+# "Purity Corrected Arrays" split)
+purityCol = "CO2 Production Purity-Corrected (kg/hr)"
+plainCol = "CO2 Production (kg/hr)"
+
+defaultSecondAxis = "AirRelHumid_In"
+
+# Points drawn in each tower's CO2 scatter (binned above this)
+defaultMaxPoints = 20_000
+
+
+def _fileName(customer, tower):
+    return quote(str(customer), safe="") + "--" + quote(str(tower), safe="")
+
+
+# Tower -> [cycles, last timestamp] of one customer in the snapshot
+def _towerStats(snapshotDir, customer):
+    snapshot.snapshotDir = snapshotDir
+    frame, _ = snapshot.readCustomers([customer], ["DAC_TowerName", "ProdDate", "ProdTime"])
+    if frame is None:
+        return {}
+
+    grouped = frame.groupby("DAC_TowerName", observed=True)[ingest.timestampColumn]
+    return {tower: [int(cycles), str(last)] for tower, cycles, last in zip(grouped.size().index, grouped.size(), grouped.max())}
+
+
+# {column: [lower, upper]} of the outlier limits a tower's rows are filtered with (as JSON, None when it has none)
+def _towerLimits(limits, groupBy, customer, tower):
+    group = {None: 0, "CustomerName": customer, "DAC_TowerName": tower}[groupBy]
+    towerLimits = {}
+    for col, (groups, (lower, upper)) in (limits or {}).items():
+        position = groups.get_indexer([group])[0]
+        bounds = [lower[position], upper[position]] if position >= 0 else [np.nan, np.nan]
+        towerLimits[col] = [float(bound) if np.isfinite(bound) else None for bound in bounds]
+    return towerLimits
+
+
+def _scatter(towerDf, xCol, yCol, color, maxPoints):
+    xPoints, yPoints, counts = downsample.scatterPoints(towerDf, xCol, yCol, maxPoints)
+    fig = go.Figure(go.Scattergl(x=xPoints, y=yPoints, mode="markers", marker=dict(color=color), customdata=counts,
+                                 hovertemplate="%{x}, %{y}<br>%{customdata:,} points" if counts is not None else None))
+    fig.update_layout(title=dict(text=f"{xCol} vs {yCol}"), height=400)
+    fig.update_xaxes(title_text=xCol)
+    fig.update_yaxes(title_text=yCol)
+    return fig
+
+
+def _records(table):
+    return json.loads(table.reset_index().to_json(orient="records", date_format="iso"))
+
+
+def _writeReport(outDir, name, customer, tower, stats, figures, tables):
+    title = html.escape(f"{customer} / {tower}")
+    body = [fig.to_html(full_html=False, include_plotlyjs="directory" if i == 0 else False) for i, fig in enumerate(figures.values())]
+    with open(os.path.join(outDir, name + ".html.tmp"), "w") as file:
+        file.write(f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{title}</title></head><body>"
+                   f"<h1>{title}</h1><p>{stats[0]:,} cycles, last {html.escape(stats[1])}</p>" + "".join(body) + "</body></html>")
+
+    report = {"customer": str(customer), "tower": str(tower), "cycles": stats[0], "last": stats[1],
+              "figures": {key: json.loads(fig.to_json()) for key, fig in figures.items()}, "tables": tables}
+    with open(os.path.join(outDir, name + ".json.tmp"), "w") as file:
+        json.dump(report, file)
+
+    # Swapped in together at the end, a half-written report is never picked up
+    os.replace(os.path.join(outDir, name + ".html.tmp"), os.path.join(outDir, name + ".html"))
+    os.replace(os.path.join(outDir, name + ".json.tmp"), os.path.join(outDir, name + ".json"))
+
+
+# Render towers of one customer (a batch that fits the worker's memory), returns tower -> file name
+def _renderTowers(snapshotDir, customer, towers, stats, colors, settings, limits, outDir):
+    regimeCol, secondAxis = settings["regimeCol"], settings["secondAxis"]
+    groupBy = groupings[settings["outlierLimits"]]
+    regimeTitle = "RH Regime" if regimeCol == regimes.defaultBinColumn else regimeCol + " Regime"
+
+    columns, derivedColumns = engine.pipelineColumns([purityCol, plainCol], regimeCol, settings["limitColumns"], groupBy, [secondAxis])
+    rows, index = engine.partitionRows(snapshotDir, customer, towers, columns, derivedColumns, limits, groupBy)
+    if rows is None:
+        return {}
+    cube = regimes.regimeCube(rows, [purityCol, plainCol], regimeCol, settings["regimeWidth"])
+
+    rendered = {}
+    for tower in towers:
+        towerDf = rows[rows["DAC_TowerName"] == tower]
+        co2Col = purityCol if tower in index.purityTowers else plainCol
+        colorIdx = colors[tower]
+
+        regimeTbl = regimes.towerRegimes(cube, tower, co2Col)
+        groupedTbl = customerTable(towerDf)
+        panel = buildArrayPanel(towerDf, regimeTbl, groupedTbl, tower, co2Col, secondAxis, regimeTitle, colorIdx, 1)
+        rhBar, figBar = buildArrayFigures([panel], [tower], co2Col, secondAxis, regimeTitle)
+
+        figures = {"regimeTable": panel["regimeVisual"], "customerTable": panel["groupedVisual"], "regimeBars": rhBar, "cycleBars": figBar,
+                   "scatter": _scatter(towerDf, secondAxis, co2Col, colorList[colorIdx], settings["maxPoints"])}
+        tables = {"regimes": _records(regimeTbl), "customers": _records(groupedTbl)}
+
+        name = _fileName(customer, tower)
+        _writeReport(outDir, name, customer, tower, stats[tower], figures, tables)
+        rendered[tower] = name
+
+    return rendered
+
+
+def _readManifest(outDir):
+    try:
+        with open(os.path.join(outDir, manifestName)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {"settings": None, "towers": {}}
+
+
+def _writeIndex(outDir, towers):
+    rows = []
+    for entry in sorted(towers.values(), key=lambda entry: (entry["customer"], entry["tower"])):
+        rows.append(f"<tr><td>{html.escape(entry['customer'])}</td><td><a href='{quote(entry['file'])}.html'>{html.escape(entry['tower'])}</a></td>"
+                    f"<td>{entry['stats'][0]:,}</td><td>{html.escape(entry['stats'][1])}</td><td>{html.escape(entry['rendered'])}</td></tr>")
+
+    with open(os.path.join(outDir, "index.html"), "w") as file:
+        file.write("<!DOCTYPE html><html><head><meta charset='utf-8'><title>Array Tracking Reports</title></head><body><h1>Array Tracking Reports</h1>"
+                   "<table><tr><th>Customer</th><th>Tower</th><th>Cycles</th><th>Last Cycle</th><th>Rendered</th></tr>" + "".join(rows) + "</table></body></html>")
+
+
+# Render the towers of customers (every customer in the snapshot when None) that got new cycles since the last run
+# into outDir, force renders every tower. Returns the (customer, tower) pairs rendered
+def runReports(outDir=defaultOut, customers=None, workers=None, secondAxis=defaultSecondAxis, regimeCol=regimes.defaultBinColumn,
+               regimeWidth=regimes.defaultBinWidth, outlierMethod="3 SD", outlierLimits="All Data", includeOutliers=False,
+               maxPoints=defaultMaxPoints, memoryBudget=engine.defaultMemoryBudget, force=False):
+    os.makedirs(outDir, exist_ok=True)
+    snapshotDir = snapshot.snapshotDir
+    customers = snapshot.customers() if customers is None else list(customers)
+    workers = workers or os.cpu_count()
+
+    settings = {"secondAxis": secondAxis, "regimeCol": regimeCol, "regimeWidth": regimeWidth, "outlierMethod": outlierMethod,
+                "outlierLimits": outlierLimits, "limitColumns": [] if includeOutliers else ["CO2_Fox_g"], "maxPoints": maxPoints}
+    manifest = _readManifest(outDir)
+    previous = manifest["towers"] if manifest["settings"] == settings and not force else {}
+    groupBy = groupings[outlierLimits]
+
+    pool = engine.newPool(workers)
+    try:
+        towerStats = dict(zip(customers, pool.map(_towerStats, [snapshotDir] * len(customers), customers)))
+        limits = engine.outlierLimits(pool, snapshotDir, customers, settings["limitColumns"], outlierMethod, groupBy)
+        towerLimits = {_fileName(customer, tower): _towerLimits(limits, groupBy, customer, tower) for customer in customers for tower in towerStats[customer]}
+
+        # Towers whose cycle count, last timestamp or outlier limits moved since their last render
+        def changed(customer, tower):
+            entry = previous.get(_fileName(customer, tower), {})
+            return entry.get("stats") != towerStats[customer][tower] or entry.get("limits") != towerLimits[_fileName(customer, tower)]
+
+        dirty = {customer: [tower for tower in towerStats[customer] if changed(customer, tower)] for customer in customers}
+        dirty = {customer: towers for customer, towers in dirty.items() if towers}
+
+        futures = []
+        if dirty:
+            columns, derivedColumns = engine.pipelineColumns([purityCol, plainCol], regimeCol, settings["limitColumns"], groupBy, [secondAxis])
+            budget = engine.rowBudget(memoryBudget, workers, columns, derivedColumns)
+
+            for customer, towers in dirty.items():
+                stats = towerStats[customer]
+                colors = {tower: i % len(colorList) for i, tower in enumerate(sorted(stats, key=str))}
+                for batch in engine.towerBatches({tower: stats[tower][0] for tower in towers}, budget):
+                    futures.append((customer, pool.submit(_renderTowers, snapshotDir, customer, batch, stats, colors, settings, limits, outDir)))
+
+        rendered = []
+        towers = {}
+        renderedAt = time.strftime("%Y-%m-%d %H:%M:%S")
+        for customer, future in futures:
+            for tower, name in future.result().items():
+                towers[name] = {"customer": str(customer), "tower": str(tower), "file": name, "stats": towerStats[customer][tower], "limits": towerLimits[name],
+                                "rendered": renderedAt}
+                rendered.append((customer, tower))
+    finally:
+        pool.shutdown()
+
+    # Towers rendered before that are still in the snapshot (and unchanged) stay, the rest of the old files go
+    current = {_fileName(customer, tower) for customer in customers for tower in towerStats[customer]}
+    for name, entry in previous.items():
+        if name in current and name not in towers:
+            towers[name] = entry
+    for name in set(manifest["towers"]) - set(towers):
+        for extension in (".html", ".json"):
+            if os.path.exists(os.path.join(outDir, name + extension)):
+                os.remove(os.path.join(outDir, name + extension))
+
+    if not os.path.exists(os.path.join(outDir, "plotly.min.js")):
+        with open(os.path.join(outDir, "plotly.min.js"), "w") as file:
+            file.write(get_plotlyjs())
+
+    with open(os.path.join(outDir, manifestName), "w") as file:
+        json.dump({"settings": settings, "towers": towers}, file, indent=2)
+    _writeIndex(outDir, towers)
+
+    return rendered
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render Array Tracking reports for every tower in the local snapshot")
+    parser.add_argument("--out", default=defaultOut, help="output directory (also holds the manifest of what was rendered)")
+    parser.add_argument("--customers", nargs="+", help="only these customers (default: every customer in the snapshot)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--second-axis", default=defaultSecondAxis)
+    parser.add_argument("--regime-column", default=regimes.defaultBinColumn)
+    parser.add_argument("--regime-width", type=float, default=regimes.defaultBinWidth)
+    parser.add_argument("--outlier-method", choices=list(methods), default="3 SD")
+    parser.add_argument("--outlier-limits", choices=list(groupings), default="All Data")
+    parser.add_argument("--include-outliers", action="store_true")
+    parser.add_argument("--max-points", type=int, default=defaultMaxPoints, help="points per scatter plot, more rows get binned")
+    parser.add_argument("--memory-budget", type=int, default=engine.defaultMemoryBudget, help="bytes of rows all workers hold at once")
+    parser.add_argument("--force", action="store_true", help="render every tower, not just the ones with new cycles")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    rendered = runReports(args.out, args.customers, args.workers, args.second_axis, args.regime_column, args.regime_width, args.outlier_method,
+                          args.outlier_limits, args.include_outliers, args.max_points, args.memory_budget, args.force)
+    print(f"rendered {len(rendered)} towers in {time.perf_counter() - start:.1f} s -> {os.path.join(args.out, 'index.html')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import glob
+import os
+import threading
+import time
+from urllib.parse import quote, unquote
+
+import pyarrow.parquet as pq
+
+from processData import ingest, queries
+
+
+# Local columnar snapshot of ProcessDataPerIndex
+# One directory per customer (CustomerName=<name>/) holding Parquet parts sorted by ProdDate/ProdTime/CycleNumber,
+# so a cold start memory-maps only the customers/columns it needs instead of going through pd.read_sql.
+# A background thread keeps it in sync with SQL Server (only rows past each tower's high-water mark are fetched)
+# and the app can run from it alone when the server can't be reached.
+
+snapshotDir = os.environ.get("PROCESS_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".snapshot", queries.tableName))
+
+# Row groups of ~100k rows sorted by date, parts get merged back into one file once a customer has more than maxParts
+rowGroupSize = 100_000
+maxParts = 8
+
+# Seconds between background syncs
+syncInterval = 5 * 60
+
+# Last background sync result, shown in the sidebar
+syncStatus = {"lastSync": None, "rows": 0, "error": None}
+
+# Readers and the compaction step share this lock so nobody globs a part that is about to be removed
+_fileLock = threading.RLock()
+
+_syncLock = threading.Lock()
+_syncThread = None
+
+# Customers the app has asked for, synced on top of the ones already in the snapshot
+_trackedCustomers = set()
+
+
+def _customerDir(customer):
+    return os.path.join(snapshotDir, "CustomerName=" + quote(str(customer), safe=""))
+
+
+def _parts(customer):
+    return sorted(glob.glob(os.path.join(_customerDir(customer), "part-*.parquet")))
+
+
+# Customers that have at least one part on disk
+def customers():
+    names = []
+    for path in sorted(glob.glob(os.path.join(snapshotDir, "CustomerName=*"))):
+        if glob.glob(os.path.join(path, "part-*.parquet")):
+            names.append(unquote(os.path.basename(path).split("=", 1)[1]))
+    return names
+
+
+# Part files of customers on disk, changes whenever a sync writes or compacts one (for caching results read from them)
+def partsVersion(customerNames):
+    return tuple((customer, tuple(os.path.basename(path) for path in _parts(customer))) for customer in customerNames)
+
+
+# Column names of the snapshot (for running without SQL Server), empty if there is no snapshot yet
+def tableColumns():
+    with _fileLock:
+        for customer in customers():
+            parts = _parts(customer)
+            if parts:
+                # Parts written from SQL reads carry the parsed timestamps, they aren't a table column
+                return [name for name in pq.read_schema(parts[0]).names if name != ingest.timestampColumn]
+    return []
+
+
+# Memory-mapped read of the wanted customers/columns, returns (frame or None, customers found on disk)
+# towers only keeps the rows of those DAC_TowerNames (all rows when None)
+def readCustomers(customerNames, columns, towers=None):
+    frames = []
+    found = []
+
+    with _fileLock:
+        for customer in customerNames:
+            parts = _parts(customer)
+            if not parts:
+                continue
+
+            for part in parts:
+                names = pq.read_schema(part).names
+                partCols = [col for col in columns if col in names] if columns else None
+                filters = None if towers is None else [("DAC_TowerName", "in", list(towers))]
+                frames.append(pq.read_table(part, columns=partCols, filters=filters, memory_map=True).to_pandas())
+            found.append(customer)
+
+    if not frames:
+        return None, []
+
+    return ingest.addTimestamps(ingest.encodeKeys(ingest.concatFrames(frames))), found
+
+
+# Write frame as a new part for customer (to a temp file first so readers never see half a file)
+def _writePart(customer, frame):
+    os.makedirs(_customerDir(customer), exist_ok=True)
+
+    frame = frame.sort_values(queries.highWaterColumns).reset_index(drop=True)
+    path = os.path.join(_customerDir(customer), f"part-{time.time_ns()}.parquet")
+    frame.to_parquet(path + ".tmp", index=False, row_group_size=rowGroupSize)
+    os.replace(path + ".tmp", path)
+
+
+# Merge all parts of a customer back into one file
+def _compact(customer):
+    with _fileLock:
+        parts = _parts(customer)
+        frame = ingest.concatFrames([pq.read_table(part).to_pandas() for part in parts])
+        _writePart(customer, frame)
+        for part in parts:
+            os.remove(part)
+
+
+# Bring one customer up to date with SQL Server, returns the number of rows written
+def syncCustomer(conn, customer):
+    with _fileLock:
+        parts = _parts(customer)
+
+    if parts:
+        existing, _ = readCustomers([customer], ["DAC_TowerName"] + queries.highWaterColumns)
+        newDf = queries.loadNewRows(conn, [customer], [], queries.highWaterMarks(existing))
+    else:
+        sql, params = queries.buildSelectQuery([customer], [])
+        newDf = queries.readQuery(conn, sql, params)
+
+    if newDf.empty:
+        return 0
+
+    with _fileLock:
+        _writePart(customer, newDf)
+
+    if len(parts) + 1 > maxParts:
+        _compact(customer)
+
+    return len(newDf)
+
+
+def trackCustomers(customerNames):
+    _trackedCustomers.update(customerNames)
+
+
+# Sync every customer already on disk plus the ones the app asked for
+def syncAll(conn):
+    rows = 0
+    for customer in sorted(set(customers()) | _trackedCustomers):
+        rows += syncCustomer(conn, customer)
+
+    syncStatus.update(lastSync=time.strftime("%Y-%m-%d %H:%M:%S"), rows=rows, error=None)
+    return rows
+
+
+def _syncLoop(connect, interval):
+    while True:
+        try:
+            conn = connect()
+            try:
+                syncAll(conn)
+            finally:
+                conn.close()
+        except Exception as err:
+            # Server unreachable (or a bad batch): keep serving the last snapshot and try again next round
+            syncStatus["error"] = str(err)
+
+        time.sleep(interval)
+
+
+# Start the background sync once per server process. connect() opens a fresh connection for the sync thread
+# (pyodbc connections shouldn't be shared across threads).
+def startBackgroundSync(connect, interval=syncInterval):
+    global _syncThread
+
+    with _syncLock:
+        if _syncThread is not None and _syncThread.is_alive():
+            return
+
+        _syncThread = threading.Thread(target=_syncLoop, args=(connect, interval), name="snapshotSync", daemon=True)
+        _syncThread.start()
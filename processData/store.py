@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from processData import ingest
+
+
+# Row layout of the cached frames and zero-copy selections from them
+# The shared frame is the store: key strings are dictionary-encoded (ingest.categoryColumns), every other column is
+# one typed contiguous array (float32/smallest int where nothing is lost) and rows are kept grouped by customer in
+# time order. Pages work out which rows they want as positions (time/tower indexes, outlier masks) and only turn them
+# into a frame here: a run of consecutive rows is a slice of the shared frame (a view, nothing is copied), any other
+# selection copies just the columns that are asked for.
+
+
+# frame with each customer's rows back to back in time order (customers stay in the order they first appear)
+# An already arranged frame comes back as is
+def arrange(frame, groupColumn="CustomerName"):
+    if groupColumn not in frame.columns or ingest.timestampColumn not in frame.columns or len(frame) < 2:
+        return frame
+
+    codes, _ = pd.factorize(frame[groupColumn])
+    stamps = frame[ingest.timestampColumn].to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+    # NaT is the smallest int64, sort it last like the time indexes do
+    stamps = np.where(stamps == np.iinfo(np.int64).min, np.iinfo(np.int64).max, stamps)
+    order = np.lexsort((stamps, codes))
+    if np.array_equal(order, np.arange(len(frame))):
+        return frame
+
+    return frame.take(order).reset_index(drop=True)
+
+
+# positions as a slice when they are one run of consecutive rows, else None
+def rowRun(positions):
+    if isinstance(positions, slice):
+        return positions
+    if len(positions) == 0:
+        return slice(0, 0)
+    start, stop = int(positions[0]), int(positions[-1]) + 1
+    if stop - start == len(positions) and (len(positions) < 3 or np.all(np.diff(positions) == 1)):
+        return slice(start, stop)
+    return None
+
+
+# Rows of frame at positions (a slice, row positions or a boolean mask) with only columns (every column when None)
+# One run of rows is a view of frame, other selections copy the wanted columns only
+def take(frame, positions, columns=None):
+    if columns is not None:
+        frame = frame[list(dict.fromkeys(columns))]
+    if positions is None:
+        return frame
+
+    positions = np.flatnonzero(positions) if isinstance(positions, np.ndarray) and positions.dtype == bool else positions
+    run = rowRun(positions)
+    return frame.iloc[run] if run is not None else frame.take(positions)
+
+
+# value -> slice of the rows holding it, for a frame whose rows are grouped by column (like a tower selection)
+def groupSlices(frame, column):
+    codes, values = pd.factorize(frame[column])
+    if len(codes) == 0:
+        return {}
+
+    starts = np.concatenate([[0], np.flatnonzero(codes[1:] != codes[:-1]) + 1])
+    stops = np.append(starts[1:], len(codes))
+    if len(starts) != len(values):
+        raise ValueError(column + " rows aren't grouped")
+    return {values[codes[start]]: slice(int(start), int(stop)) for start, stop in zip(starts, stops)}
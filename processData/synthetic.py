@@ -0,0 +1,107 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from processData import queries, snapshot
+
+
+# Synthetic ProcessDataPerIndex rows for running the app/benchmarks without the production SQL Server
+# Every tower runs cycles back to back (CycleSecs apart) with a daily RH swing, CO2 per cycle follows RH with a step
+# at each configuration change, and a small share of cycles are spikes/zeros so the outlier filters have work to do.
+# Towers named "...-P.." are purity-corrected (DAC_CO2_Percent above towers.purityThreshold), the rest report 0.
+
+startDate = "2024-01-01"
+
+# Share of cycles that are spikes (x3-x10) or zero readings
+outlierShare = 0.01
+
+
+def towerNames(customer, towersPerCustomer):
+    return [f"{customer}-{'P' if i % 2 == 0 else 'T'}{i + 1:02d}" for i in range(towersPerCustomer)]
+
+
+# rows = customers x towersPerCustomer x cyclesPerTower, in tower/time order like the table's clustered index
+# Columns are queries.keyColumns, the raw CO2/RH/temperature sensors and extraColumns "Sensor_NN" columns
+def generateFrame(customers=3, towersPerCustomer=4, cyclesPerTower=10_000, extraColumns=10, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+
+    for c in range(customers):
+        customer = f"SN{c + 1}"
+        for tower in towerNames(customer, towersPerCustomer):
+            frames.append(_towerFrame(rng, customer, tower, cyclesPerTower, extraColumns))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def _towerFrame(rng, customer, tower, cycles, extraColumns):
+    cycleSecs = rng.normal(2400, 300, cycles).clip(900, 4800).round().astype(np.int32)
+    seconds = np.cumsum(cycleSecs) + int(rng.integers(0, 86_400))
+    days, secondOfDay = np.divmod(seconds, 86_400)
+
+    # Daily RH swing plus weather noise (0-100 %)
+    dayFraction = secondOfDay / 86_400
+    rh = (55 + 25 * np.sin(2 * np.pi * dayFraction) + rng.normal(0, 8, cycles)).clip(2, 99)
+    temp = 20 - 8 * np.sin(2 * np.pi * dayFraction) + rng.normal(0, 2, cycles)
+
+    # CO2 per cycle: tower efficiency x RH response, stepped at a few configuration changes
+    steps = np.sort(rng.integers(0, cycles, rng.integers(1, 4)))
+    efficiency = rng.uniform(0.8, 1.2) * np.cumprod(np.r_[1, rng.uniform(0.9, 1.15, len(steps))])[np.searchsorted(steps, np.arange(cycles), side="right")]
+    co2 = efficiency * (600 + 6 * rh) * cycleSecs / 2400 + rng.normal(0, 40, cycles)
+
+    outliers = rng.random(cycles) < outlierShare
+    co2[outliers] *= rng.choice([0.0, 3.0, 10.0], outliers.sum())
+
+    purity = rng.normal(96, 1.5, cycles).clip(80, 100) if "-P" in tower else np.zeros(cycles)
+
+    frame = {
+        "CustomerName": customer,
+        "DAC_TowerName": tower,
+        "ProdDate": _dateStrings(days.max() + 1)[days],
+        "ProdTime": _timeOfDay[secondOfDay],
+        "CycleNumber": np.arange(1, cycles + 1, dtype=np.int64),
+        "CO2_Fox_g": co2.clip(0),
+        "CycleSecs": cycleSecs,
+        "DAC_CO2_Percent": purity,
+        "AirRelHumid_In": rh,
+        "AirTemp_In": temp,
+    }
+    for i in range(extraColumns):
+        frame[f"Sensor_{i + 1:02d}"] = rng.normal(i * 10, 1 + i, cycles)
+
+    return pd.DataFrame(frame)
+
+
+# "YYYY-MM-DD" of the first dayCount days from startDate / "HH:MM:SS" of every second of a day, looked up by index
+# (formatting every row's timestamp is most of the generation time at 10M rows)
+def _dateStrings(dayCount):
+    return pd.date_range(startDate, periods=dayCount, freq="D").strftime("%Y-%m-%d").to_numpy(dtype=object)
+
+
+def _timeStrings():
+    return pd.to_datetime(np.arange(86_400), unit="s").strftime("%H:%M:%S").to_numpy(dtype=object)
+
+
+# Built once, every tower looks its times up in it
+_timeOfDay = _timeStrings()
+
+
+# Write frame as the ProcessDataPerIndex table of a SQLite file (replacing it), chunked to bound memory
+def writeSqlite(frame, path, chunkRows=200_000):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {queries.tableName}")
+        for start in range(0, len(frame), chunkRows):
+            frame.iloc[start:start + chunkRows].to_sql(queries.tableName, conn, if_exists="append", index=False)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS customerIdx ON {queries.tableName} (CustomerName)")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# Write frame into the local snapshot (snapshot.snapshotDir), one part per customer
+def writeSnapshot(frame):
+    for customer, customerDf in frame.groupby("CustomerName", sort=True):
+        with snapshot._fileLock:
+            snapshot._writePart(customer, customerDf)
@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from processData import ingest
+
+
+# Date windows over the loaded rows
+# Rows are kept sorted by group (customer) and timestamp (ingest.timestampColumn) with where each group starts and
+# stops, so the rows of a date window are two binary searches per group (np.searchsorted) instead of comparing every
+# row's ProdDate/ProdTime. One index is kept per data key and version (a refresh rebuilds it).
+
+# Data keys whose indexes are kept, the least recently used ones are dropped first
+maxCachedKeys = 16
+
+
+# window (first date, last date) -> [low, high) datetime64 bounds covering both days
+def windowBounds(window):
+    first, last = window
+    return np.datetime64(first, "ns"), np.datetime64(last, "ns") + np.timedelta64(1, "D")
+
+
+# (first date, last date) of sorted timestamps (NaT last), None when there is none
+def dateSpan(stamps):
+    valid = stamps[~np.isnat(stamps)]
+    if len(valid) == 0:
+        return None
+    return pd.Timestamp(valid.min()).date(), pd.Timestamp(valid.max()).date()
+
+
+# Start/stop of the rows inside window within one group's sorted timestamps
+def windowSlice(stamps, start, stop, window):
+    if window is None:
+        return start, stop
+
+    low, high = windowBounds(window)
+    groupStamps = stamps[start:stop]
+    return start + np.searchsorted(groupStamps, low, "left"), start + np.searchsorted(groupStamps, high, "left")
+
+
+class TimeIndex:
+
+    def __init__(self, frame, groupColumn="CustomerName"):
+        stamps = frame[ingest.timestampColumn].to_numpy(dtype="datetime64[ns]")
+        codes, groups = pd.factorize(frame[groupColumn], sort=True)
+
+        # Rows without a group are left out, NaT timestamps sort last within their group
+        order = np.lexsort((stamps, codes))
+        order = order[codes[order] >= 0]
+        sortedCodes = codes[order]
+
+        self.rows = order
+        self.stamps = stamps[order]
+
+        starts = np.searchsorted(sortedCodes, np.arange(len(groups)), "left")
+        stops = np.searchsorted(sortedCodes, np.arange(len(groups)), "right")
+        self.bounds = {group: (start, stop) for group, start, stop in zip(groups, starts, stops)}
+
+        self.span = dateSpan(self.stamps)
+
+    # Positions of the rows of groups (every group when None) inside window (every row when None)
+    # Each group's rows come out in time order, groups in name order
+    def window(self, window=None, groups=None):
+        names = sorted(self.bounds, key=str) if groups is None else sorted(set(groups), key=str)
+        slices = [windowSlice(self.stamps, *self.bounds[name], window) for name in names if name in self.bounds]
+
+        if not slices:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate([self.rows[start:stop] for start, stop in slices])
+
+
+# dataKey -> (version, {groupColumn: index}), ordered oldest use -> newest use
+_indexes = OrderedDict()
+_indexesLock = threading.Lock()
+
+
+# Time index of the frame behind cacheKey (dataKey, dataVersion), None builds an uncached one (partial loads)
+def timeIndex(cacheKey, frame, groupColumn="CustomerName"):
+    if cacheKey is None:
+        return TimeIndex(frame, groupColumn)
+
+    dataKey, version = cacheKey
+    with _indexesLock:
+        cachedVersion, indexes = _indexes.get(dataKey, (None, {}))
+        if cachedVersion == version and groupColumn in indexes:
+            _indexes.move_to_end(dataKey)
+            return indexes[groupColumn]
+
+    index = TimeIndex(frame, groupColumn)
+
+    with _indexesLock:
+        cachedVersion, indexes = _indexes.get(dataKey, (None, {}))
+        if cachedVersion != version:
+            indexes = {}
+            _indexes[dataKey] = (version, indexes)
+        indexes[groupColumn] = index
+        _indexes.move_to_end(dataKey)
+        while len(_indexes) > maxCachedKeys:
+            _indexes.popitem(last=False)
+
+    return index
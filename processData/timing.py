@@ -0,0 +1,89 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Timing spans for one page rerun (in place of the st.write("Done ...") markers)
+# Each span records wall time, the rows it worked on and how much the process RSS moved while it ran. Spans nest, so
+# "figure build" inside "aggregation" shows up as its own row with a depth. A rerun can also be run under cProfile.
+
+# Per-rerun JSON lines are appended here when logging is switched on
+logPath = os.environ.get("PROCESS_TIMING_LOG", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".timing", "reruns.jsonl"))
+
+# Functions listed from a cProfile capture
+profileRows = 40
+
+_logLock = threading.Lock()
+
+
+# Resident set size of this process in bytes (None where /proc isn't available)
+def currentRss():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RerunTimer:
+
+    def __init__(self, page, profile=False):
+        self.page = page
+        self.started = time.time()
+        self.spans = []
+        self._depth = 0
+        self._start = time.perf_counter()
+
+        self.profile = None
+        self.profileText = None
+        if profile:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    # with timer.span("filtering", rows=len(df)) as span: ... (span["rows"] can also be set inside the block)
+    @contextmanager
+    def span(self, name, rows=None):
+        span = {"name": name, "depth": self._depth, "rows": rows}
+        self.spans.append(span)
+        rssBefore = currentRss()
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            yield span
+        finally:
+            self._depth -= 1
+            span["seconds"] = time.perf_counter() - start
+            rssAfter = currentRss()
+            span["rssDelta"] = rssAfter - rssBefore if rssBefore is not None and rssAfter is not None else None
+
+    # Stop profiling (if on) and return the whole rerun as a dict
+    def finish(self):
+        if self.profile is not None:
+            self.profile.disable()
+            out = io.StringIO()
+            pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(profileRows)
+            self.profileText = out.getvalue()
+            self.profile = None
+
+        return self.summary()
+
+    def summary(self):
+        return {
+            "page": self.page,
+            "started": self.started,
+            "seconds": time.perf_counter() - self._start,
+            "spans": [dict(span) for span in self.spans],
+        }
+
+
+# Append one rerun's summary to logPath as a JSON line
+def logRerun(summary, path=None):
+    path = path or logPath
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _logLock, open(path, "a") as log:
+        log.write(json.dumps(summary) + "\n")
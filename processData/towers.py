@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from processData import ingest, store, timeindex
+
+
+# Per-tower index for the Array Tracking page
+# Holds the positions of the loaded rows sorted by tower and time, where each tower starts/stops in that order and
+# the per-tower cycle counter (New_CycleNum), so picking towers is a slice instead of a sort of the whole frame.
+# With the rows' timestamps alongside, a date window within a tower is a binary search of its slice.
+# One index is kept per data key and row filter (outlier settings). A refresh only appends rows, so the index for
+# the next data version is built from the previous one by merging in the new rows of the towers that got some.
+
+sortColumns = ["DAC_TowerName", "ProdDate", "ProdTime"]
+
+# Towers with a reading above this DAC_CO2_Percent are listed as purity-corrected arrays
+purityThreshold = 1
+
+# Data keys whose indexes are kept, the least recently used ones are dropped first
+maxCachedKeys = 16
+
+
+class TowerIndex:
+
+    def __init__(self, frame, keep=None):
+        self.sourceRows = len(frame)
+        self.keep = keep
+
+        positions = np.arange(len(frame)) if keep is None else np.flatnonzero(keep)
+        self.segments = _towerSegments(frame, positions)
+        self.purityTowers = _purityTowers(frame, positions)
+        self._finish(frame)
+
+    # Index for frame with rows appended past self.sourceRows (keep is the row filter for the whole new frame)
+    def appended(self, frame, keep=None):
+        newPositions = np.arange(self.sourceRows, len(frame))
+        if keep is not None:
+            newPositions = newPositions[keep[self.sourceRows:]]
+
+        index = TowerIndex.__new__(TowerIndex)
+        index.sourceRows = len(frame)
+        index.keep = keep
+        index.segments = dict(self.segments)
+        index.purityTowers = self.purityTowers | _purityTowers(frame, newPositions)
+
+        for tower, rows in _towerSegments(frame, newPositions).items():
+            if tower in index.segments:
+                # Re-sort just this tower, new rows are usually all after the old ones already
+                rows = _sortPositions(frame, np.concatenate([index.segments[tower], rows]))
+            index.segments[tower] = rows
+
+        index._finish(frame)
+        return index
+
+    # Whether keep only changes rows past the ones this index covers (so appended() gives the same index as a rebuild)
+    def extendsTo(self, frame, keep):
+        if len(frame) < self.sourceRows or (keep is None) != (self.keep is None):
+            return False
+        return keep is None or np.array_equal(keep[:self.sourceRows], self.keep)
+
+    def _finish(self, frame):
+        # Towers in name order, their rows back to back with the start/stop of each tower
+        self.towers = sorted(self.segments, key=str)
+        self.rows = np.concatenate([self.segments[tower] for tower in self.towers]) if self.towers else np.empty(0, dtype=np.intp)
+
+        lengths = np.array([len(self.segments[tower]) for tower in self.towers], dtype=np.intp)
+        stops = np.cumsum(lengths)
+        self.bounds = {tower: (stop - length, stop) for tower, stop, length in zip(self.towers, stops, lengths)}
+
+        # Counter that restarts at 1 for every tower
+        self.cycleNums = np.arange(1, len(self.rows) + 1) - np.repeat(stops - lengths, lengths)
+
+        # Timestamps in the same order (None for frames without them, date windows are then ignored)
+        self.stamps = None
+        self.span = None
+        if ingest.timestampColumn in frame.columns:
+            self.stamps = frame[ingest.timestampColumn].to_numpy(dtype="datetime64[ns]")[self.rows]
+            self.span = timeindex.dateSpan(self.stamps)
+
+    # Rows of the picked towers (sorted by tower, date, time) with their New_CycleNum, only columns when given
+    # window (first date, last date) keeps only the rows of those dates, cycles keep their number from the whole history
+    def select(self, frame, towers, window=None, columns=None):
+        if self.stamps is None:
+            window = None
+        picked = [timeindex.windowSlice(self.stamps, *self.bounds[tower], window) for tower in sorted(set(towers), key=str) if tower in self.bounds]
+        rows = np.concatenate([self.rows[start:stop] for start, stop in picked]) if picked else np.empty(0, dtype=np.intp)
+        cycleNums = np.concatenate([self.cycleNums[start:stop] for start, stop in picked]) if picked else np.empty(0, dtype=np.int64)
+
+        return store.take(frame, rows, columns).assign(New_CycleNum=cycleNums)
+
+
+# positions sorted by tower, date, time (by the parsed timestamps when the frame has them)
+def _sortPositions(frame, positions):
+    columns = ["DAC_TowerName", ingest.timestampColumn] if ingest.timestampColumn in frame.columns else sortColumns
+    keys = frame[columns].iloc[positions].reset_index(drop=True)
+    order = keys.sort_values(columns, kind="stable").index.to_numpy()
+    return positions[order]
+
+
+# tower -> its positions sorted by date/time
+def _towerSegments(frame, positions):
+    if len(positions) == 0:
+        return {}
+
+    positions = _sortPositions(frame, positions)
+    names = frame["DAC_TowerName"].to_numpy()[positions]
+    starts = np.concatenate([[0], np.flatnonzero(names[1:] != names[:-1]) + 1])
+    stops = np.append(starts[1:], len(positions))
+
+    return {names[start]: positions[start:stop] for start, stop in zip(starts, stops)}
+
+
+def _purityTowers(frame, positions):
+    pure = frame["DAC_CO2_Percent"].to_numpy()[positions] > purityThreshold
+    return set(frame["DAC_TowerName"].to_numpy()[positions[pure]])
+
+
+# dataKey -> {filterKey: (version, index)}, ordered oldest use -> newest use
+_indexes = OrderedDict()
+_indexesLock = threading.Lock()
+
+
+# Tower index for the frame behind cacheKey (dataKey, dataVersion) with the rows in keep (None for every row)
+# filterKey identifies the row filter (the outlier settings). appendOnly says the rows added since the previous
+# version were only appended (a refresh), then the previous index is extended instead of rebuilt.
+def towerIndex(cacheKey, frame, keep=None, filterKey=None, appendOnly=False):
+    dataKey, version = cacheKey
+
+    with _indexesLock:
+        previous = _indexes.get(dataKey, {}).get(filterKey)
+
+    if previous is not None and previous[0] == version:
+        index = previous[1]
+    elif previous is not None and appendOnly and previous[0] == version - 1 and previous[1].extendsTo(frame, keep):
+        index = previous[1].appended(frame, keep)
+    else:
+        index = TowerIndex(frame, keep)
+
+    with _indexesLock:
+        _indexes.setdefault(dataKey, {})[filterKey] = (version, index)
+        _indexes.move_to_end(dataKey)
+        while len(_indexes) > maxCachedKeys:
+            _indexes.popitem(last=False)
+
+    return index
@@ -0,0 +1,142 @@
+import json
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+from processData import access, connections, timing
+
+
+# Streamlit sidebar pieces shared by both pages
+
+
+# Progress bar for chunked loads (in place of st.spinner("Loading Data...")), yields the progress callback
+@contextmanager
+def loadingProgress(text="Loading Data..."):
+    bar = st.progress(0.0, text=text)
+
+    def update(rowsRead, totalRows):
+        if totalRows:
+            bar.progress(min(rowsRead / totalRows, 1.0), text=f"{text} {rowsRead:,} / {totalRows:,} rows")
+        else:
+            bar.progress(0.0, text=f"{text} {rowsRead:,} rows")
+
+    try:
+        yield update
+    finally:
+        bar.empty()
+
+
+# Sidebar date range picker starting out at span (first date, last date), returns (first, last) with both days included
+# (the first date to the end of span while the range is still being picked)
+def dateRangeInput(label, span, key):
+    value = st.sidebar.date_input(label, value=span, key=key)
+    if len(value) < 2:
+        return value[0], max(value[0], span[1])
+    return tuple(value)
+
+
+# Progress of a background load (loader.BackgroundLoad), polled every interval seconds
+# Reruns the page when rows arrived since drawnVersion (the load version this rerun drew) and once the load is done
+def backgroundLoadStatus(load, drawnVersion, interval=1):
+
+    @st.fragment(run_every=interval)
+    def poll():
+        if load.finished or load.version != drawnVersion:
+            st.rerun()
+
+        done = load.customersDone / len(load.customers)
+        st.progress(done, text=f"Loading Data... {load.customersDone} / {len(load.customers)} customers, {load.rowsRead():,} rows")
+
+    poll()
+
+
+# Timer for this rerun of page, under cProfile when "Profile Next Rerun" was pressed on the previous one
+def rerunTimer(page):
+    return timing.RerunTimer(page, profile=st.session_state.pop("profileNextRerun", False))
+
+
+# Sidebar "Timing Debug" panel with the spans of this rerun (call at the end of the page script)
+# Can append every rerun to timing.logPath, export this rerun as JSON and profile the next rerun with cProfile
+def timingPanel(timer):
+    summary = timer.finish()
+
+    # Logging is its own toggle, rendered even with Timing Debug off so the widget (and its state) stays alive
+    timingDebug = st.sidebar.checkbox("Timing Debug", key="timingDebug")
+    if st.sidebar.checkbox("Log Every Rerun", key="timingLog", help="Appends each rerun as a JSON line to " + timing.logPath):
+        timing.logRerun(summary)
+
+    if not timingDebug:
+        return
+
+    with st.sidebar.expander("Timings", expanded=True):
+        st.caption(f"Rerun took {summary['seconds']:.3f} s")
+
+        spans = pd.DataFrame(summary["spans"], columns=["name", "depth", "seconds", "rows", "rssDelta"])
+        spans["name"] = ["\u00a0\u00a0" * depth + name for depth, name in zip(spans["depth"], spans["name"])]
+        spans["rows"] = spans["rows"].astype("Int64")
+        spans["RSS Delta (MB)"] = spans["rssDelta"] / 1024 ** 2
+        st.dataframe(spans[["name", "seconds", "rows", "RSS Delta (MB)"]], hide_index=True)
+
+        st.download_button("Export Rerun JSON", json.dumps(summary, indent=2), file_name="rerunTimings.json", mime="application/json")
+
+        if st.button("Profile Next Rerun"):
+            st.session_state.profileNextRerun = True
+            st.rerun()
+        if timer.profileText:
+            st.text(timer.profileText)
+
+
+# Refresh controls: pull cycles newer than what is loaded into the shared frame without a full reload
+# Auto-Refresh polls on an interval (for leaving the dashboard up on a wall display) and reruns the page when
+# new rows arrived, either from this session's poll or from another session refreshing the same data
+def refreshControls(conn, tableColumns):
+    if "dataKey" not in st.session_state:
+        return
+
+    # Version this rerun draws, so the poller can tell when the shared frame moved on
+    st.session_state.renderedVersion = access.dataVersion(st.session_state.dataKey)
+
+    if st.sidebar.button("Refresh Data"):
+        with loadingProgress("Loading New Cycles...") as progress:
+            towers = access.refreshData(conn, st.session_state.dataKey, tableColumns, progress)
+        st.session_state.lastRefresh = time.monotonic()
+        st.sidebar.caption(f"New cycles for {len(towers)} tower(s)" if towers is not None else "Data reloaded")
+
+    if st.sidebar.checkbox("Auto-Refresh", key="autoRefresh"):
+        interval = st.sidebar.number_input("Auto-Refresh Interval (s)", min_value=10, value=60, step=10, key="autoRefreshInterval")
+        _autoRefresh(tableColumns, interval)
+
+
+# Page of items to show: "per page" and "page" pickers in the sidebar, perPage 0 shows every item on one page
+# Only the returned items get built/sent to the browser, so what a rerun costs follows the page and not the selection
+# (the page picker has no key, so it goes back to the first page when the number of pages changes)
+def pageControls(items, label, defaultPerPage, key):
+    perPage = st.sidebar.number_input(label + " per Page (0 for all)", min_value=0, value=defaultPerPage, step=1, key=key + "PerPage")
+    if perPage == 0 or len(items) <= perPage:
+        return list(items)
+
+    pageCount = -(-len(items) // perPage)
+    pages = [items[start:start + perPage] for start in range(0, len(items), perPage)]
+    page = st.sidebar.selectbox(label + " Page", range(pageCount),
+                                format_func=lambda i: f"{i + 1} of {pageCount}: " + (f"{pages[i][0]} - {pages[i][-1]}" if len(pages[i]) > 1 else str(pages[i][0])))
+    return list(pages[page])
+
+
+def _autoRefresh(tableColumns, interval):
+
+    @st.fragment(run_every=interval)
+    def poll():
+        key = st.session_state.dataKey
+
+        if time.monotonic() - st.session_state.get("lastRefresh", 0) >= interval:
+            # Fragment runs can outlive the rerun that leased conn, so take this run's own connection
+            access.refreshData(connections.acquire(), key, tableColumns)
+            st.session_state.lastRefresh = time.monotonic()
+
+        if access.dataVersion(key) != st.session_state.renderedVersion:
+            st.rerun()
+
+    with st.sidebar:
+        poll()
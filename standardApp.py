@@ -4,14 +4,26 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+import datetime
+import uuid
 
 
 # SQL Connection module
 import pyodbc
 
+# Query building and the process-wide data cache shared by every session
+from processData import access, configChanges, connections, downsample, drivers, histogram, loader, queries, snapshot, store, timeindex
+from processData.derived import addDerivedColumns, derivedMetrics
+from processData.figures import figureCache
+from processData.outliers import groupings, methods, outlierMask
+from processData.widgets import backgroundLoadStatus, dateRangeInput, refreshControls, rerunTimer, timingPanel
+
 # Set Page Con
 st.set_page_config(page_title="General Analysis Dashboard", layout="wide")
 
+# Named timing spans for this rerun, shown in the sidebar "Timing Debug" panel
+timer = rerunTimer("General Analysis")
+
 # For Setting up Graph Color Values: 
 
 # Complementary color pairs dictionary (limited to 6)
@@ -41,17 +53,28 @@ def get_complementary_color(color):
 sqlSecrets = st.secrets["SQLInfo"]
 
 # Connection String (Where Connection is done)
-conn = pyodbc.connect(
-    'DRIVER={ODBC Driver 17 for SQL Server};'
-    f'SERVER={sqlSecrets['server_name']};'
-    f'DATABASE={sqlSecrets['process_file']};'
-    f'UID={sqlSecrets['sql_login']};'
-    f'PWD={sqlSecrets['sql_password']}'
-)
-
-# Getting customer Names from SQL
-custNameQuery = "SELECT DISTINCT CustomerName FROM ProcessDataPerIndex"
-custNames = pd.read_sql(sql=custNameQuery, con = conn)["CustomerName"]
+def connectSql():
+    return pyodbc.connect(
+        'DRIVER={ODBC Driver 17 for SQL Server};'
+        f'SERVER={sqlSecrets['server_name']};'
+        f'DATABASE={sqlSecrets['process_file']};'
+        f'UID={sqlSecrets['sql_login']};'
+        f'PWD={sqlSecrets['sql_password']}'
+    )
+
+# Connections are pooled per server process, so a rerun reuses an open connection instead of reconnecting
+connections.configure(connectSql, errors=(pyodbc.Error,))
+
+# If SQL Server can't be reached we keep going from the local Parquet snapshot
+conn = connections.acquire()
+if conn is None:
+    st.warning("SQL Server unreachable, showing data from the last local snapshot")
+
+# Keeps the local snapshot in sync with SQL in the background (one thread per server process)
+snapshot.startBackgroundSync(connectSql)
+
+# Getting customer Names from SQL (cached for a few minutes, not re-queried on every rerun)
+custNames = access.customerNames(conn)
 
 # Getting user input regarding customer names
 st.session_state.customerList = []
@@ -63,31 +86,56 @@ customerList = st.session_state.customerList
 # Dont run until customerList is specified
 # Code for creating our initial SQL Query and Establishing the CycleNumber User Input
 if customerList:
-    # Change so it fits correct format
-    formatted_customer_list = ', '.join([f"'{customer}'" for customer in customerList])
-
-    query = f"SELECT * FROM ProcessDataPerIndex"
-
-
     # Configuration Change (Cycle Number INput) Code
+    # Saved to the local config change registry when edited, so they are still there after a reload (and for other sessions)
+    def saveConfigChanges(customer):
+        configChanges.setChanges(customer, configChanges.parseCycles(st.session_state[f"configChanges_{customer}"])[0])
+
     st.sidebar.write("Please Specify All Configuration Change Cycles (separated by commas)")
+    savedChanges = configChanges.changeCycles(customerList)
     configDict = {}
     for customer in customerList:
-        configDict[customer] = st.sidebar.text_area(f'{customer} Configuration Changes')
+        configText = st.sidebar.text_area(f'{customer} Configuration Changes', value = configChanges.formatCycles(savedChanges[customer]),
+                                          key = f"configChanges_{customer}", on_change = saveConfigChanges, args = (customer,))
+        configDict[customer], badCycles = configChanges.parseCycles(configText)
+        if badCycles:
+            st.sidebar.error(f"{customer}: not cycle numbers, ignored: " + ", ".join(badCycles))
 
-# Specify whether we include outliers (+/- 3 SD)
+# Specify whether we include outliers (+/- 3 SD by default) and how the limits are worked out
 outliers = st.sidebar.checkbox("Include Outliers?")
+outlierMethod = st.sidebar.selectbox("Outlier Method", list(methods), help = "\n\n".join(f"{name}: {text}" for name, text in methods.items()))
+outlierGroups = st.sidebar.selectbox("Outlier Limits", list(groupings))
+
+# Points sent to the browser for the main scatter plot, more rows than this get binned
+maxPoints = st.sidebar.number_input("Max Plot Points", min_value=1000, value=downsample.defaultMaxPoints, step=1000)
+
+# Average Y per X bin for each customer (binned on the server, only the bins are sent)
+showHist = st.sidebar.checkbox("Show Histogram", value = False)
+histBins = st.sidebar.number_input("Histogram Bins", min_value=1, value=histogram.defaultBins, step=10, disabled = not showHist)
+
+# Ranking of every numeric column against the Y axis (loads every column of the table)
+showDrivers = st.sidebar.checkbox("Driver Scan", value = False)
+driverGroups = st.sidebar.selectbox("Scan Per", list(groupings), disabled = not showDrivers)
+
+# Shared data cache hit/miss stats (same numbers for every session on this server), snapshot sync status and connection pool
+with st.sidebar.expander("Data Cache Stats"):
+    st.json(access.sharedCache.stats())
+    st.json(snapshot.syncStatus)
+    st.json(connections.sharedPool().stats())
+    st.json(figureCache.stats())
 
 
 # Code that allows users to input column names
 # Column Name Specification (making a column 'COLUMN_NAME' that holds all the column names (doing this to maintain case))
-colNameQuery = "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = 'ProcessDataPerIndex'"
-st.session_state.colNames = np.append(np.array(pd.read_sql(sql=colNameQuery, con=conn)), ["CO2 Production Purity-Corrected (kg/hr)", "CO2 Production Purity-Corrected (T/Y)", "CO2 Production (kg/hr)", "CO2 Production (T/Y)"])
+tableColumns = access.columnNames(conn)
+st.session_state.tableColumns = tableColumns
+# Every registered derived column is listed after the table columns
+st.session_state.colNames = np.append(np.array(tableColumns), list(derivedMetrics))
 
 colNames = st.session_state.colNames
 
 # General User Specified X Axis 
-st.session_state.xValue = st.selectbox("Specify X-Axis Value:", colNames)
+st.session_state.xValue = st.selectbox("Specify X-Axis Value:", colNames, key = "xAxis")
 xValue = ""
 
 # General User Specified Y Axis 
@@ -95,37 +143,45 @@ st.session_state.yValue = st.selectbox("Specify Y-Axis Value:", index = list(col
 yValue = ""
 
 
-# Figure List
 
-# Main Scatter Plot
-st.session_state.generalFig = go.Figure()
 
 
- 
-# Basic Outlier Removal Function
-def noOutliers(df, xValue, yValue):
 
-    xmean = np.mean(df[xValue])
-    xsd = np.std(df[xValue])
-    ymean = np.mean(df[yValue])
-    ysd = np.std(df[yValue])
-    xUpperLim = xmean + (3 * xsd)
-    xLowerLim = xmean - (3 * xsd)
-    yUpperLim = ymean + (3 * ysd)
-    yLowerLim = ymean - (3 * ysd)
+# Columns we actually select from SQL: current axes, derived CO2 columns and what the Array Tracking page reads
+requiredColumns = [st.session_state.xValue, st.session_state.yValue] + list(queries.derivedColumnSources) + queries.arrayTrackingColumns
+if showDrivers:
+    requiredColumns += tableColumns
 
-    # Doing Filtering: Likely Could be Less Messy
+# Only select a range of ProdDates from SQL (older history stays on the server)
+loadWindow = None
+if st.sidebar.checkbox("Only Load a Date Range", key = "loadWindowOn"):
+    # Starts out as every date the picked customers have (the last 90 days when that can't be worked out)
+    today = datetime.date.today()
+    loadSpan = access.dateSpan(conn, customerList) or (today - datetime.timedelta(days = 90), today)
+    loadWindow = dateRangeInput("Load Date Range", loadSpan, key = "loadWindow")
 
-    #Potentially df[df[xValue] < xUpperLim & df[xValue] >= max(xLowerLim, 0)]
-    df = df[df[xValue] < xUpperLim]
-    df = df[df[xValue] >= max(xLowerLim,0)]
 
-    df = df[df[yValue] < yUpperLim]
-    df = df[df[yValue] >= max(yLowerLim, 0)]
-    
-    return df
 
+# Loads run on a background thread: the page draws the rows read so far and reruns as more arrive
+# (the session only keeps its token, the load itself is shared with other sessions loading the same data)
+loadToken = st.session_state.setdefault("loadToken", uuid.uuid4().hex)
+loadJob = st.session_state.get("loadJob")
 
+# Customers (or the load date range) changed mid-load, that load isn't wanted anymore (cancelled unless another session
+# waits on it too). Other columns (axes, Driver Scan) don't cancel it, they are added by the re-query below once it is done
+wantedKey = access.makeKey(customerList, requiredColumns, tableColumns, loadWindow)
+if loadJob is not None and (not customerList or loadJob.key[0] != wantedKey[0] or access.keyWindow(loadJob.key) != access.keyWindow(wantedKey)):
+    loader.release(loadJob, loadToken)
+    loadJob = st.session_state.loadJob = None
+
+# Finished load becomes the session's data (before the re-query below, which adds what it is missing)
+if loadJob is not None and loadJob.finished:
+    if loadJob.error is not None:
+        st.error("Loading Data failed: " + str(loadJob.error))
+    elif not loadJob.cancelled:
+        st.session_state.dataKey = loadJob.key
+    loader.release(loadJob, loadToken)
+    loadJob = st.session_state.loadJob = None
 
 # Button for loading the dataframe for the very first time
 if st.button("Load Data"):
@@ -134,189 +190,268 @@ if st.button("Load Data"):
 
     else:
         # Logic such that we only need to load the dataframe once (Loads if No DF exists already or Re-Queries if customer List names changed)
-        if "df" not in st.session_state:
-            # Visual Spinner as Loading Data takes a lot of time
-            with st.spinner("Loading Data..."):
-                tempDf  = pd.read_sql(sql= query, con = conn)
-                
-
-                # Add additional columns to code 
-
-                # Fox_g  * DAC_CO2_Percent/100 (Puriy Correct ) / 1000 (kg) / CycleSecs (from per Cycle to Per Second) * 3600 (Seconds to Hr)
-                tempDf["CO2 Production Purity-Corrected (kg/hr)"] = tempDf["CO2_Fox_g"] / 1000 / tempDf["CycleSecs"] * 3600 * (tempDf["DAC_CO2_Percent"] / 100)
-                
-                # We use 8000 hrs in a year (1000 kg in a metric Ton)
-                tempDf["CO2 Production Purity-Corrected (T/Y)"] = tempDf["CO2 Production Purity-Corrected (kg/hr)"] * 8000 / 1000  
-
-
-                # Not Purity Corrected Columns
-                
-                # Similar to before but without CO2 Percent multiplication
-                tempDf["CO2 Production (kg/hr)"] = tempDf["CO2_Fox_g"] / 1000 / tempDf["CycleSecs"] * 3600
-                
-                # We use 8000 hrs in a year (1000 kg in a metric Ton)
-                tempDf["CO2 Production (T/Y)"] = tempDf["CO2 Production (kg/hr)"] * 8000 / 1000 
-                
-                st.session_state.fullDf = tempDf
-                st.session_state.df = tempDf[st.session_state.fullDf["CustomerName"].isin(customerList)]
-            # Steps for me to monitor Speed
-            st.write("Done Defining DataFrame")
-
-        
-        
+        if "dataKey" not in st.session_state and loadJob is None:
+            # Only the chosen customers and needed columns come back from SQL (or straight from the shared cache
+            # if another session already loaded them), customers in the order they were picked
+            loadJob = st.session_state.loadJob = loader.startLoad(loadToken, customerList, requiredColumns, tableColumns, loadWindow)
+
+# In case we change the customername (or pick an axis column that isn't loaded, or change the load date range) and need
+# to re-query the working dataframe (only customers/columns that aren't cached yet are queried, the rest is taken from the shared cache)
+if "dataKey" in st.session_state and loadJob is None and customerList and not access.covers(st.session_state.dataKey, customerList, requiredColumns, tableColumns, loadWindow):
+    loadJob = st.session_state.loadJob = loader.startLoad(loadToken, customerList, requiredColumns, tableColumns, loadWindow)
+
+# Rows of a running load read so far (drawn until it is done)
+partialDf = None
+if loadJob is not None:
+    partialDf = loadJob.partialFrame()
+    backgroundLoadStatus(loadJob, loadJob.version)
 
         
+# Pull new cycles into the loaded data (manually or on an interval) instead of clearing the session
+refreshControls(conn, tableColumns)
 
 # Begin Plot Phase
 # Getting the maximum value for the y axis for us to build horizontal line
-if "df" in st.session_state:
-
-    # In case we change the customername and need to re-query the working dataframe
-    if ("fullDf" in st.session_state) and list(st.session_state["df"]["CustomerName"].unique()) != customerList:
-        # Visual Spinner as Loading Data takes a lot of time
-        with st.spinner("Loading Data..."):
-
-            # Calling it tempNormDf because I dont want to confuse it with the tempDf for fullDf from above.
-            tempNormDf = st.session_state.fullDf[st.session_state.fullDf["CustomerName"].isin(customerList)]
-
-            # Add additional columns to code 
-
-            # Fox_g  * DAC_CO2_Percent/100 (Puriy Correct ) / 1000 (kg) / CycleSecs (from per Cycle to Per Second) * 3600 (Seconds to Hr)
-            tempNormDf["CO2 Production Purity-Corrected (kg/hr)"] = tempNormDf["CO2_Fox_g"] / 1000 / tempNormDf["CycleSecs"] * 3600 * (tempNormDf["DAC_CO2_Percent"] / 100)
-            
-            # We use 8000 hrs in a year (1000 kg in a metric Ton)
-            tempNormDf["CO2 Production Purity-Corrected (T/Y)"] = tempNormDf["CO2 Production Purity-Corrected (kg/hr)"] * 8000 / 1000  
+if "dataKey" in st.session_state or partialDf is not None:
 
+    if partialDf is not None:
+        # Nothing is cached off a partial frame, it changes with every chunk
+        dataKey, dataVersion = None, None
+        getFigure = lambda name, inputs, build: build()
 
-            # Not Purity Corrected Columns
-            
-            # Similar to before but without CO2 Percent multiplication
-            tempNormDf["CO2 Production (kg/hr)"] = tempNormDf["CO2_Fox_g"] / 1000 / tempNormDf["CycleSecs"] * 3600
-            
-            # We use 8000 hrs in a year (1000 kg in a metric Ton)
-            tempNormDf["CO2 Production (T/Y)"] = tempNormDf["CO2 Production Purity-Corrected (kg/hr)"] * 8000 / 1000 
-
-            st.session_state.df = tempNormDf
-            
-        # Steps for me to monitor Speed
-        st.write("Done Defining DataFrame")
-
-    # Outlier removal call
-    if not outliers:
-        df = noOutliers(st.session_state.df, st.session_state.xValue, st.session_state.yValue).sort_values(by = ["CustomerName"])
+        with timer.span("derivation", rows=len(partialDf)):
+            loadedDf = addDerivedColumns(partialDf, [st.session_state.xValue, st.session_state.yValue])
     else:
-        df = st.session_state.df
-    st.write("Done removing outliers from DF")
-    
-    custDf = df[df["CustomerName"].isin(customerList)]
-
-    low  = st.number_input('Specify the Lower End ' + st.session_state.xValue, value = min(custDf[st.session_state.xValue]))
-    highEnd = st.number_input('Specify the Upper End ' + st.session_state.xValue, value = max(custDf[st.session_state.xValue]))
+        dataKey = st.session_state.dataKey
+        dataVersion = access.dataVersion(dataKey)
+        getFigure = figureCache.get
+
+        # Shared frame for this session's customers (read only, no per-session copy)
+        # (derived axis columns are calculated the first time they are picked)
+        with timer.span("derivation") as span:
+            loadedDf = access.getFrame(conn, dataKey, tableColumns, columns=[st.session_state.xValue, st.session_state.yValue])
+            span["rows"] = len(loadedDf)
+
+    # Axis picked while a load runs: its column only arrives with the load (or the re-query after it)
+    if loadJob is not None and (st.session_state.xValue not in loadedDf.columns or st.session_state.yValue not in loadedDf.columns):
+        st.info("The picked axes are shown once the current load is done")
+        timingPanel(timer)
+        st.stop()
+
+    xValue = st.session_state.xValue
+    yValue = st.session_state.yValue
+
+    # Each customer's rows in time order (built once per data version), the date window below is a binary search of them
+    timeIdx = timeindex.timeIndex(None if dataKey is None else (dataKey, dataVersion), loadedDf)
+    dateWindow = None
+    if timeIdx.span is not None:
+        dateWindow = dateRangeInput("Date Range", timeIdx.span, key = "dateWindow")
+        if dateWindow == timeIdx.span:
+            dateWindow = None
+
+    # Outlier removal call: a mask cached until the data changes, the shared frame is only indexed when a figure needs rows
+    keep = None
+    if not outliers:
+        with timer.span("filtering", rows=len(loadedDf)):
+            keep = outlierMask(loadedDf, [xValue, yValue], outlierMethod, groupings[outlierGroups],
+                               cacheKey=None if dataKey is None else (dataKey, dataVersion))
+
+    # Rows (of one customer) inside the date window that passed the outlier filter, only the columns asked for
+    # (a customer's rows with nothing filtered out are a view of the shared frame, see store.take)
+    def keptRows(customer=None, columns=None):
+        if customer is None and dateWindow is None:
+            return store.take(loadedDf, keep, columns)
+        positions = timeIdx.window(dateWindow, None if customer is None else [customer])
+        if keep is not None and not keep[positions].all():
+            positions = positions[keep[positions]]
+        return store.take(loadedDf, positions, columns)
+
+    xKept = keptRows(columns = [xValue])[xValue]
+
+    # Nothing to plot (date window without rows, every row filtered out)
+    if xKept.empty:
+        st.warning("No rows left to plot, pick another date range")
+        timingPanel(timer)
+        st.stop()
+
+    lowEnd = st.number_input('Specify the Lower End ' + xValue, value = min(xKept))
+    highEnd = st.number_input('Specify the Upper End ' + xValue, value = max(xKept))
 
     if highEnd < lowEnd:
         st.error("Higher End Value is lower than Lower End Value")
 
 
-    topOfLine = df[st.session_state.yValue].max()    
-
-    #st.write('Histogram')
-    st.session_state.overHist = px.histogram(df, x = st.session_state.xValue, y = st.session_state.yValue, color="CustomerName", histfunc = "avg", color_discrete_sequence=colorList)
-
+    # Sorting customerList so it is alphabetical
+    customerList.sort()
 
-    
+    # Everything the plots are built from: figures are only rebuilt when one of these changes
+    dataInputs = (dataKey, dataVersion, outliers, outlierMethod, outlierGroups, dateWindow)
+    configInputs = tuple(tuple(configDict[customer]) for customer in customerList)
+
+    # Average Y per X bin, one bar trace per customer built from the binned stats
+    def buildHistogram():
+        with timer.span("aggregation") as span:
+            x, widths, groups, counts, means = histogram.binnedStats(keptRows(columns = ["CustomerName", xValue, yValue]), xValue, yValue, histBins)
+            span["rows"] = int(counts.sum())
+        fig = go.Figure()
+
+        for i, customer in enumerate(customerList):
+            if customer not in groups:
+                continue
+            row = groups.index(customer)
+            filled = counts[row] > 0
+
+            # Counts when Y can't be averaged (text columns)
+            fig.add_trace(go.Bar(x = x[filled], y = (means if means is not None else counts)[row][filled], width = None if widths is None else widths[filled],
+                                 name = f'{customer}', marker = dict(color = colorList[i]), opacity = .7, customdata = counts[row][filled],
+                                 hovertemplate = "%{x}, %{y}<br>%{customdata:,} rows"))
+
+        fig.update_layout(barmode = "overlay", title = dict(text = f"Average {yValue} per {xValue} Bin" if means is not None else f"Rows per {xValue} Bin"))
+        fig.update_xaxes(title_text = xValue)
+        fig.update_yaxes(title_text = yValue if means is not None else "Rows")
+        return fig
 
+    #st.write('Histogram')
+    if showHist:
+        with timer.span("figure build (histogram)"):
+            st.session_state.overHist = getFigure("Histogram", dataInputs + (tuple(customerList), xValue, yValue, histBins), buildHistogram)
 
 
-    # Sorting customerList so it is alphabetical
-    customerList.sort()
-    
-    #(xValue != st.session_state or yValue != st.session_state) <- Only Regenerate if 
-    for i, customer in enumerate(customerList):
-        xValue = st.session_state.xValue
-        yValue = st.session_state.yValue
+    # One customer's scatter trace, cached on its own so changing the customer list only builds the new customers
+    def buildTrace(customer, curColor):
         # Get Specific Dataframe
-        curDf = df.query('CustomerName == @customer')
-
-        
-        # Get Customer Data Color
-        curColor = colorList[i]
+        curDf = keptRows(customer, [xValue, yValue])
 
-        # Basic user defined Scatter Plot
+        # Using Scattergl because of us having lots of data, above the point budget only binned points inside Lower/Upper End are sent
+        with timer.span("aggregation", rows=len(curDf)):
+            xPoints, yPoints, counts = downsample.scatterPoints(curDf, xValue, yValue, maxPoints // len(customerList), xRange=(lowEnd, highEnd))
+        return go.Scattergl(x = xPoints, y = yPoints, legendgroup = "Customers", legendgrouptitle_text = "Customers", mode = "markers", marker=dict(
+        color= curColor), name = f'{customer}', customdata = counts, hovertemplate = "%{x}, %{y}<br>%{customdata:,} points" if counts is not None else None)
 
-        # Using Scattergl because of us having lots of data, may make logic so that it automatically changes at lower amounts of data
-        st.session_state.generalFig.add_trace(go.Scattergl(x = curDf[xValue], y = curDf[yValue], legendgroup = "Customers", legendgrouptitle_text = "Customers", mode = "markers", marker=dict(
-        color= curColor), name = f'{customer}'))
 
-        
+    def buildScatter():
+        fig = go.Figure()
+        topOfLine = keptRows(columns = [yValue])[yValue].max()
 
+        for i, customer in enumerate(customerList):
+            # Get Customer Data Color
+            curColor = colorList[i]
 
+            # Basic user defined Scatter Plot
+            traceInputs = dataInputs + (customer, curColor, xValue, yValue, lowEnd, highEnd, maxPoints // len(customerList))
+            fig.add_trace(getFigure("Scatter Trace", traceInputs, lambda: buildTrace(customer, curColor)))
 
-        for line in configDict[customer].split(','):
-            
+            # Every change line of the customer in one trace (segments split by None gaps)
             # Assumes lowest val 0, may want to change
-            st.session_state.generalFig.add_trace(go.Scattergl(x = [line, line], y = [0, topOfLine], line = dict(dash = 'dash'), legendgroup = customer, legendgrouptitle_text= f'{customer} Config Changes', name=f'{str(line)} ({customer})', marker = dict(color = get_complementary_color(curColor))))
-
+            cycles = configDict[customer]
+            if cycles:
+                fig.add_trace(go.Scatter(x = [x for cycle in cycles for x in (cycle, cycle, None)], y = [y for _ in cycles for y in (0, topOfLine, None)],
+                                         mode = 'lines', line = dict(dash = 'dash', color = get_complementary_color(curColor)), legendgroup = customer,
+                                         legendgrouptitle_text = f'{customer} Config Changes', name = f'{len(cycles)} Changes ({customer})', hovertemplate = "Cycle %{x}"))
+
+        # Figure updates
+
+        # So that we toggle on and off group elements by clicking the individual items, not the whole trace
+        fig.update_layout(title=dict(text=xValue + " vs " + yValue), legend=dict(groupclick="toggleitem"))
+        fig.update_xaxes(title_text = xValue, range = [lowEnd, highEnd])
+        fig.update_yaxes(title_text = yValue)
+
+        fig.update_layout(
+          title={
+              'text': f'<b>{xValue} vs {yValue}</b>',
+              'y':.95,
+              'x':0.479,
+              'xanchor': 'center',
+              'yanchor': 'top',
+              'font': {
+                  'size': 24,
+                  'family': 'Arial, sans-serif',
+
+              }
+          },
+          legend=dict(font=dict(size= 15)),
+
+          xaxis = dict(tickfont=dict(
+                size=15,  # Increase the font size here
+                color='black'
+            ),
+          titlefont=dict(
+                size=20,  # Increase the font size here
+                color='black'
+            )),
+           yaxis = dict(
+             range=[0, None],
+             tickfont=dict(
+                size=15,  # Increase the font size here
+                color='black'
+            ),
+          titlefont=dict(
+                size=20,  # Increase the font size here
+                color='black'
+            )),
         
-        
-            
-
-    st.write("Done Making Plot ")
-    # Figure updates
-
-    #Specifying what goes on home page vs Other Pages
-    
-    # Update Histogram Layout
-
-    #Update Scatterplot Layout
-
-    # So that we toggle on and off group elements by clicking the individual items, not the whole trace
-    st.session_state.generalFig.update_layout(title=dict(text=xValue + " vs " + yValue), legend=dict(groupclick="toggleitem"))
-    st.session_state.generalFig.update_xaxes(title_text = xValue, range = [lowEnd, highEnd])
-    st.session_state.generalFig.update_yaxes(title_text = yValue)
-
-    st.session_state.generalFig.update_layout(
-      title={
-          'text': f'<b>{xValue} vs {yValue}</b>',
-          'y':.95,
-          'x':0.479,
-          'xanchor': 'center',
-          'yanchor': 'top',
-          'font': {
-              'size': 24,
-              'family': 'Arial, sans-serif',
-
-          }
-      },
-      legend=dict(font=dict(size= 15)),
-
-      xaxis = dict(tickfont=dict(
-            size=15,  # Increase the font size here
-            color='black'
-        ),
-      titlefont=dict(
-            size=20,  # Increase the font size here
-            color='black'
-        )),
-       yaxis = dict(
-         range=[0, None],
-         tickfont=dict(
-            size=15,  # Increase the font size here
-            color='black'
-        ),
-      titlefont=dict(
-            size=20,  # Increase the font size here
-            color='black'
-        )),
-        
-      images=[dict(
-            source='https://assets-global.website-files.com/63c8119087b31650e9ba22d1/63c8119087b3160b9bba2367_logo_black.svg',  # Replace with your image URL or local path
-            xref='paper', yref='paper',
-            x=.95, y=1.1,
-            sizex=0.1, sizey=0.1,
-            xanchor='center', yanchor='bottom'
-        )]
+          images=[dict(
+                source='https://assets-global.website-files.com/63c8119087b31650e9ba22d1/63c8119087b3160b9bba2367_logo_black.svg',  # Replace with your image URL or local path
+                xref='paper', yref='paper',
+                x=.95, y=1.1,
+                sizex=0.1, sizey=0.1,
+                xanchor='center', yanchor='bottom'
+            )]
       
-    )
-
-
-    st.plotly_chart(st.session_state.generalFig, use_container_width=True)
\ No newline at end of file
+        )
+
+        return fig
+
+
+    # Main Scatter Plot
+    with timer.span("figure build (scatter)"):
+        st.session_state.generalFig = getFigure("Scatter", dataInputs + (tuple(customerList), configInputs, xValue, yValue, lowEnd, highEnd, maxPoints), buildScatter)
+
+    if any(trace.customdata is not None for trace in st.session_state.generalFig.data if trace.legendgroup == "Customers"):
+        st.caption(f"Points are binned to stay under {maxPoints:,}, narrow the Lower/Upper End range (or raise Max Plot Points) to see raw points")
+
+    with timer.span("chart serialization"):
+        st.plotly_chart(st.session_state.generalFig, use_container_width=True)
+
+        if showHist:
+            st.plotly_chart(st.session_state.overHist, use_container_width=True)
+
+    # Mean/std/count of Y between each customer's configuration changes (same rows as the scatter plot)
+    changedCustomers = {customer: configDict[customer] for customer in customerList if configDict[customer]}
+    if changedCustomers and pd.api.types.is_numeric_dtype(loadedDf[yValue]):
+        with timer.span("aggregation (config segments)"):
+            segments = getFigure("Config Segments", dataInputs + (configInputs, tuple(changedCustomers), yValue),
+                                 lambda: configChanges.segmentStats(keptRows(columns = ["CustomerName", "CycleNumber", yValue]), yValue, changedCustomers))
+        st.write(f"{yValue} Between Configuration Changes")
+        st.dataframe(segments, hide_index = True, use_container_width = True)
+
+    # Every numeric column against Y in one pass (per customer/tower when picked), a row click puts that column on the X axis
+    if showDrivers:
+        if dataKey is None:
+            st.caption("Driver Scan runs once the load is done")
+        elif pd.api.types.is_numeric_dtype(loadedDf[yValue]):
+            scanDf = access.getFrame(conn, dataKey, tableColumns, columns=list(derivedMetrics))
+            scanColumns = drivers.numericColumns(scanDf, exclude=queries.keyColumns + [yValue])
+
+            # Same date window as the plots, outliers only dropped on Y (X changes with every column)
+            scanRows = None if dateWindow is None else timeIdx.window(dateWindow)
+            if not outliers:
+                scanKeep = outlierMask(scanDf, [yValue], outlierMethod, groupings[outlierGroups], cacheKey=(dataKey, dataVersion))
+                scanRows = np.flatnonzero(scanKeep) if scanRows is None else scanRows[scanKeep[scanRows]]
+
+            with timer.span("aggregation (driver scan)", rows=len(scanDf) if scanRows is None else len(scanRows)):
+                ranking = drivers.cachedDriverScan(dataInputs, scanDf, yValue, scanColumns, groupings[driverGroups], scanRows)
+
+            def showDriver():
+                selected = st.session_state.driverScan.selection.rows
+                if selected:
+                    st.session_state.xAxis = ranking["Column"].iloc[selected[0]]
+
+            st.write(f"Drivers of {yValue}")
+            st.dataframe(ranking, hide_index = True, use_container_width = True, key = "driverScan", on_select = showDriver, selection_mode = "single-row",
+                         column_config = {"r": st.column_config.NumberColumn(format = "%.3f"), "R²": st.column_config.NumberColumn(format = "%.3f"),
+                                          "Binned R²": st.column_config.NumberColumn(format = "%.3f"),
+                                          "Binned Mean": st.column_config.LineChartColumn(f"Mean {yValue} per Bin")})
+
+# Span table/profile for this rerun in the sidebar
+timingPanel(timer)
\ No newline at end of file
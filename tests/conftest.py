@@ -0,0 +1,33 @@
+import sqlite3
+
+import pytest
+
+from processData import access, snapshot, synthetic
+
+
+# Small synthetic ProcessDataPerIndex: 2 customers x 2 towers x 500 cycles (spikes/zeros included)
+@pytest.fixture
+def processFrame():
+    return synthetic.generateFrame(customers=2, towersPerCustomer=2, cyclesPerTower=500, extraColumns=0)
+
+
+# SQLite copy of processFrame standing in for SQL Server (same "?" markers and [bracket] identifiers)
+@pytest.fixture
+def sqliteConn(tmp_path, processFrame):
+    path = str(tmp_path / "process.sqlite")
+    synthetic.writeSqlite(processFrame, path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+# Every test starts with an empty shared cache and its own (empty) snapshot directory
+@pytest.fixture(autouse=True)
+def isolatedState(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "snapshotDir", str(tmp_path / "snapshot"))
+    access.sharedCache.clear()
+    access._versions.clear()
+    access._highWater.clear()
+    access._changedTowers.clear()
+    yield
+    access.sharedCache.clear()
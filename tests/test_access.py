@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+from processData import access, queries, store, synthetic
+
+
+@pytest.fixture
+def growingTable(tmp_path, processFrame):
+    path = str(tmp_path / "growing.sqlite")
+    firstRows = processFrame.groupby("DAC_TowerName").cumcount() < 400
+    synthetic.writeSqlite(processFrame[firstRows], path)
+    conn = sqlite3.connect(path)
+    yield conn, processFrame[~firstRows]
+    conn.close()
+
+
+def rowKeys(frame):
+    return frame[["DAC_TowerName", "ProdDate", "ProdTime", "CycleNumber"]].astype(str).agg("|".join, axis=1)
+
+
+def test_refresh_appends_new_rows_without_duplicates(growingTable, processFrame):
+    conn, laterRows = growingTable
+    tableColumns = list(processFrame.columns)
+    key = access.loadData(conn, ["SN1", "SN2"], ["CO2_Fox_g", "AirRelHumid_In"], tableColumns)
+    loadedRows = len(access.getFrame(conn, key, tableColumns))
+
+    laterRows.to_sql(queries.tableName, conn, if_exists="append", index=False)
+    towers = access.refreshData(conn, key, tableColumns)
+
+    frame = access.getFrame(conn, key, tableColumns)
+    assert sorted(towers) == sorted(laterRows["DAC_TowerName"].unique())
+    assert len(frame) == loadedRows + len(laterRows) == len(processFrame)
+    assert not rowKeys(frame).duplicated().any()
+
+    # Still one block of rows per customer in time order, the moved rows mean indexes are rebuilt
+    assert store.arrange(frame) is frame
+    assert access.changedTowers(key) is None
+
+
+def test_refresh_without_new_rows_changes_nothing(growingTable, processFrame):
+    conn, _ = growingTable
+    tableColumns = list(processFrame.columns)
+    key = access.loadData(conn, ["SN1", "SN2"], ["CO2_Fox_g"], tableColumns)
+    version = access.dataVersion(key)
+    rows = len(access.getFrame(conn, key, tableColumns))
+
+    assert access.refreshData(conn, key, tableColumns) == []
+    assert access.refreshData(conn, key, tableColumns) == []
+    assert len(access.getFrame(conn, key, tableColumns)) == rows
+    assert access.dataVersion(key) == version
+
+
+
+# A row later than every loaded row of the last customer goes at the end, towers that got rows are reported
+def test_refresh_past_the_last_customers_rows_only_appends(growingTable, processFrame):
+    conn, _ = growingTable
+    tableColumns = list(processFrame.columns)
+    key = access.loadData(conn, ["SN1", "SN2"], ["CO2_Fox_g"], tableColumns)
+    before = access.getFrame(conn, key, tableColumns)
+
+    lastRow = processFrame[processFrame["DAC_TowerName"] == "SN2-T02"].tail(1).assign(ProdDate="2030-01-01")
+    lastRow.to_sql(queries.tableName, conn, if_exists="append", index=False)
+    towers = access.refreshData(conn, key, tableColumns)
+
+    frame = access.getFrame(conn, key, tableColumns)
+    assert towers == access.changedTowers(key) == ["SN2-T02"]
+    assert len(frame) == len(before) + 1
+    assert rowKeys(frame.iloc[:len(before)]).tolist() == rowKeys(before).tolist()
+
+
+# Versions, high-water marks and the key's lock go with a frame the cache evicts, a reload gets a version never used before
+def test_evicted_keys_drop_their_state(growingTable, processFrame, monkeypatch):
+    conn, _ = growingTable
+    tableColumns = list(processFrame.columns)
+    first = access.loadData(conn, ["SN1"], ["CO2_Fox_g"], tableColumns)
+    access.refreshData(conn, first, tableColumns)
+    firstVersion = access.dataVersion(first)
+    assert first in access._highWater and first in access._keyLocks
+
+    monkeypatch.setattr(access.sharedCache, "maxBytes", 1)
+    access.loadData(conn, ["SN2"], ["CO2_Fox_g"], tableColumns)
+    assert access.sharedCache.peek(first) is None
+    assert access.dataVersion(first) == 0
+    assert first not in access._highWater and first not in access._changedTowers and first not in access._keyLocks
+
+    access.getFrame(conn, first, tableColumns)
+    assert access.dataVersion(first) not in (0, firstVersion)
@@ -0,0 +1,17 @@
+import pytest
+
+from processData import benchmark
+
+
+@pytest.mark.parametrize("source", ["sqlite", "parquet"])
+def test_run_scale_times_every_step_at_a_small_row_count(tmp_path, source):
+    results = benchmark.runScale(2_000, source, str(tmp_path), customers=2, towersPerCustomer=2, extraColumns=0, maxPoints=500, traceMemory=False)
+    steps = {result["step"]: result for result in results}
+
+    assert steps["frame size"]["rows"] == 2_000
+    assert ("frame size (plain)" in steps) == (source == "sqlite")
+    if source == "sqlite":
+        assert steps["frame size (plain)"]["rows"] == 2_000
+    for name in ["generate", "load", "figures (main)", "regime cube", "figures (array)"]:
+        assert steps[name]["seconds"] >= 0
+    assert steps["payload (main)"]["bytes"] > 0
@@ -0,0 +1,37 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from processData import access, connections
+
+
+@pytest.fixture
+def sqlitePool(tmp_path, monkeypatch):
+    pool = connections.ConnectionPool(lambda: sqlite3.connect(str(tmp_path / "empty.sqlite"), check_same_thread=False), errors=(sqlite3.Error,))
+    monkeypatch.setattr(connections, "_pool", pool)
+    return pool
+
+
+def test_driver_errors_discard_the_lease(sqlitePool):
+    conn = connections.acquire()
+
+    # The empty database has no ProcessDataPerIndex table (pd.read_sql wraps the driver's error)
+    with pytest.raises(pd.errors.DatabaseError):
+        access.customerNames(conn)
+
+    assert sqlitePool.stats()["leased"] == 0
+    assert sqlitePool.stats()["reconnects"] == 1
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    assert connections.acquire() is not conn
+
+
+def test_other_errors_keep_the_lease(sqlitePool):
+    conn = connections.acquire()
+
+    with pytest.raises(ValueError):
+        access.arraySummaries(conn, ((), ()), [], [], "AirRelHumid_In", 5)
+
+    assert connections.acquire() is conn
+    assert sqlitePool.stats()["reconnects"] == 0
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processData import engine, regimes, snapshot, synthetic
+from processData.derived import addDerivedColumns
+from processData.outliers import outlierMask
+from processData.towers import TowerIndex
+
+
+co2Cols = ["CO2 Production (kg/hr)", "CO2 Production Purity-Corrected (kg/hr)"]
+keyColumns = ["DAC_TowerName", "ProdDate", "ProdTime", "CycleNumber"]
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = engine.newPool(1)
+    yield pool
+    pool.shutdown()
+
+
+# The pages' in-memory pipeline over the whole snapshot: kept rows with New_CycleNum and their regime cube
+def memoryPipeline(method, groupBy):
+    frame, _ = snapshot.readCustomers(snapshot.customers(), engine.baseColumns + ["CO2_Fox_g", "CycleSecs", regimes.defaultBinColumn])
+    frame = addDerivedColumns(frame, co2Cols)
+    index = TowerIndex(frame, outlierMask(frame, ["CO2_Fox_g"], method, groupBy))
+    rows = index.select(frame, index.towers)
+    return rows, regimes.regimeCube(rows, co2Cols)
+
+
+@pytest.mark.parametrize("spill", [False, True])
+@pytest.mark.parametrize("groupBy", [None, "CustomerName", "DAC_TowerName"])
+@pytest.mark.parametrize("method", ["3 SD", "MAD", "IQR"])
+def test_engine_matches_the_in_memory_pipeline(pool, processFrame, method, groupBy, spill):
+    synthetic.writeSnapshot(processFrame)
+    rows, cube = memoryPipeline(method, groupBy)
+
+    # A budget this small splits customers into tower batches and spills every one of them
+    memoryBudget = 10_000 if spill else engine.defaultMemoryBudget
+    result = engine.runArrayPipeline(co2Cols=co2Cols, method=method, groupBy=groupBy, workers=1, pool=pool, memoryBudget=memoryBudget)
+    try:
+        engineRows = pd.concat(list(result.frames()), ignore_index=True)
+        assert (result.spilled > 0) == spill
+
+        expected = rows.sort_values(keyColumns).reset_index(drop=True)
+        actual = engineRows.sort_values(keyColumns).reset_index(drop=True)
+        assert len(actual) == len(expected) < len(processFrame)
+        np.testing.assert_array_equal(actual["New_CycleNum"], expected["New_CycleNum"])
+        np.testing.assert_allclose(actual[co2Cols].to_numpy(np.float64), expected[co2Cols].to_numpy(np.float64))
+
+        assert list(result.cube.index) == list(cube.index)
+        np.testing.assert_allclose(result.cube.to_numpy(np.float64), cube.to_numpy(np.float64), rtol=1e-9, equal_nan=True)
+    finally:
+        result.close()
+
+
+def test_quantiles_match_pandas_over_several_rounds(pool, processFrame, monkeypatch):
+    synthetic.writeSnapshot(processFrame)
+    # Forces most ranks through bucket rounds instead of sending the values back straight away
+    monkeypatch.setattr(engine, "selectValues", 3)
+    monkeypatch.setattr(engine, "selectBuckets", 8)
+
+    quantiles = engine.partitionQuantiles(pool, snapshot.snapshotDir, snapshot.customers(), "CO2_Fox_g", [0.25, 0.5, 0.75], "DAC_TowerName")
+
+    expected = processFrame.groupby("DAC_TowerName")["CO2_Fox_g"].quantile([0.25, 0.5, 0.75]).unstack()
+    assert sorted(quantiles) == sorted(expected.index)
+    for tower, values in quantiles.items():
+        np.testing.assert_allclose(values, expected.loc[tower].to_numpy(), rtol=1e-12)
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from processData import downsample, drivers, histogram
+from processData.figures import FigureCache
+
+
+def test_figure_cache_builds_once_per_inputs_and_drops_the_oldest():
+    cache = FigureCache(maxEntries=2)
+    builds = []
+
+    def build(value):
+        builds.append(value)
+        return value
+
+    assert cache.get("scatter", ("key", 1), lambda: build("a")) == "a"
+    assert cache.get("scatter", ("key", 1), lambda: build("b")) == "a"
+    cache.get("scatter", ("key", 2), lambda: build("c"))
+    cache.get("hist", ("key", 1), lambda: build("d"))
+    assert cache.get("scatter", ("key", 1), lambda: build("e")) == "e"
+    assert cache.stats() == {"scatter": {"rebuilt": 3, "reused": 1}, "hist": {"rebuilt": 1, "reused": 0}}
+
+
+def test_scatter_points_are_binned_above_max_points():
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({"x": rng.normal(size=50_000), "y": rng.normal(size=50_000)})
+
+    x, y, counts = downsample.scatterPoints(frame, "x", "y", 400)
+    assert len(x) <= 400 and counts.sum() == 50_000
+    assert np.isclose((x * counts).sum() / counts.sum(), frame["x"].mean())
+
+    x, y, counts = downsample.scatterPoints(frame, "x", "y", 400, xRange=(0, 0.005))
+    assert counts is None and len(x) == frame["x"].between(0, 0.005).sum()
+
+
+def test_binned_stats_match_a_groupby():
+    rng = np.random.default_rng(1)
+    frame = pd.DataFrame({"CustomerName": rng.choice(["SN1", "SN2"], 5_000), "x": rng.uniform(0, 10, 5_000), "y": rng.normal(size=5_000)})
+
+    x, widths, groups, counts, means = histogram.binnedStats(frame, "x", "y", bins=10)
+    assert groups == ["SN1", "SN2"] and counts.shape == (2, 10) and counts.sum() == 5_000
+
+    edges = np.histogram_bin_edges(frame["x"], 10)
+    bins = np.clip(np.searchsorted(edges, frame["x"], side="right") - 1, 0, 9)
+    expected = frame.groupby(["CustomerName", bins])["y"].mean().unstack().to_numpy()
+    assert np.allclose(means, expected)
+
+
+def test_driver_scan_matches_pearson_r():
+    rng = np.random.default_rng(2)
+    frame = pd.DataFrame({"y": rng.normal(size=20_000)})
+    frame["strong"] = frame["y"] * 2 + rng.normal(size=20_000) * 0.1
+    frame["weak"] = rng.normal(size=20_000)
+    frame.loc[::7, "weak"] = np.nan
+
+    table = drivers.driverScan(frame, "y", drivers.numericColumns(frame))
+    assert list(table["Column"]) == ["strong", "weak"]
+    for col, row in zip(table["Column"], table.itertuples()):
+        assert np.isclose(row.r, frame["y"].corr(frame[col]))
+    assert table["Rows"].tolist() == [20_000, frame["weak"].notna().sum()]
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from processData import ingest
+
+
+def test_compact_frame_keeps_float64_where_float32_loses_values():
+    frame = pd.DataFrame({
+        "AirRelHumid_In": [12.345678, 55.5, np.nan, 99.9],
+        "HalfSteps": [12.5, 55.25, np.nan, -0.75],
+        "CycleCount": [1.0, np.nan, 3.0, 2.0 ** 24 + 1],
+        "SmallCount": [1.0, np.nan, 3.0, 4.0],
+        "Reading": [12_345.678, 1.5, np.inf, np.nan],
+    })
+    original = frame.copy()
+
+    compacted = ingest.compactFrame(frame)
+
+    assert compacted["HalfSteps"].dtype == np.float32
+    assert compacted["SmallCount"].dtype == np.float32
+    for col in ["AirRelHumid_In", "CycleCount", "Reading"]:
+        assert compacted[col].dtype == np.float64
+        pd.testing.assert_series_equal(compacted[col], original[col])
+
+
+def test_compact_frame_encodes_keys_and_adds_timestamps():
+    frame = pd.DataFrame({"CustomerName": ["A", "B", "A"], "ProdDate": ["2024-01-02", "2024-01-01", "2024-01-02"],
+                          "ProdTime": ["00:00:01", "23:59:59", "12:00:00"], "CycleNumber": np.array([1, 2, 3], dtype=np.int64)})
+
+    compacted = ingest.compactFrame(frame)
+
+    assert isinstance(compacted["CustomerName"].dtype, pd.CategoricalDtype)
+    assert compacted["ProdDate"].cat.ordered
+    assert compacted["CycleNumber"].dtype == np.int8
+    assert compacted[ingest.timestampColumn].tolist() == [pd.Timestamp("2024-01-02 00:00:01"), pd.Timestamp("2024-01-01 23:59:59"), pd.Timestamp("2024-01-02 12:00:00")]
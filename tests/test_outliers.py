@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from processData.outliers import outlierMask
+
+
+# The pages' original filter: mean +/- 3 SD (population) with the lower limit clipped at 0
+def noOutliers(df, cols):
+    for i in cols:
+        tempmean = np.mean(df[i])
+        tempsd = np.std(df[i])
+
+        tempUpper = tempmean + (3 * tempsd)
+        tempLower = tempmean - (3 * tempsd)
+
+        df = df[(df[i] < tempUpper) & (df[i] >= max(tempLower, 0))]
+
+    return df
+
+
+def test_three_sd_mask_keeps_the_rows_of_the_original_filter(processFrame):
+    assert not outlierMask(processFrame, ["CO2_Fox_g"], "3 SD").all()
+
+    for col in ["CO2_Fox_g", "AirRelHumid_In", "CycleSecs"]:
+        keep = outlierMask(processFrame, [col], "3 SD")
+        pd.testing.assert_frame_equal(processFrame[keep], noOutliers(processFrame, [col]))
+
+
+def test_three_sd_mask_clips_the_lower_limit_at_zero():
+    frame = pd.DataFrame({"value": [-1.0, 0.0, 0.5, 1.0, 1.5]})
+    assert outlierMask(frame, ["value"], "3 SD").tolist() == [False, True, True, True, True]
+
+
+def test_grouped_mask_uses_each_groups_limits(processFrame):
+    keep = outlierMask(processFrame, ["CO2_Fox_g"], "3 SD", "DAC_TowerName")
+
+    for tower, towerRows in processFrame.groupby("DAC_TowerName"):
+        expected = noOutliers(towerRows, ["CO2_Fox_g"])
+        pd.testing.assert_frame_equal(processFrame[keep & (processFrame["DAC_TowerName"] == tower).to_numpy()], expected)
+
+
+def test_non_numeric_columns_are_left_out(processFrame):
+    frame = processFrame.astype({"CustomerName": "category"})
+
+    assert outlierMask(frame, ["CustomerName", "DAC_TowerName"], "MAD").all()
+    np.testing.assert_array_equal(outlierMask(frame, ["CustomerName", "CO2_Fox_g"], "IQR"), outlierMask(frame, ["CO2_Fox_g"], "IQR"))
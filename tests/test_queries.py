@@ -0,0 +1,78 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from processData import queries
+
+
+keyColumns = ["DAC_TowerName", "ProdDate", "ProdTime", "CycleNumber"]
+
+
+def sortedRows(frame):
+    return frame.sort_values(keyColumns).reset_index(drop=True)
+
+
+def test_select_query_filters_customers_and_columns(sqliteConn, processFrame):
+    sql, params = queries.buildSelectQuery(["SN2"], ["CustomerName", "DAC_TowerName", "ProdDate", "ProdTime", "CycleNumber", "CO2_Fox_g"])
+    rows = pd.read_sql(sql=sql, con=sqliteConn, params=params)
+
+    expected = processFrame.loc[processFrame["CustomerName"] == "SN2", list(rows.columns)]
+    assert list(rows.columns) == ["CustomerName", "DAC_TowerName", "ProdDate", "ProdTime", "CycleNumber", "CO2_Fox_g"]
+    pd.testing.assert_frame_equal(sortedRows(rows), sortedRows(expected), check_dtype=False)
+
+
+def test_select_query_window_includes_both_days(sqliteConn, processFrame):
+    window = (datetime.date(2024, 1, 3), datetime.date(2024, 1, 5))
+    sql, params = queries.buildSelectQuery(["SN1", "SN2"], ["DAC_TowerName", "ProdDate", "ProdTime", "CycleNumber"], window)
+    rows = pd.read_sql(sql=sql, con=sqliteConn, params=params)
+
+    inWindow = processFrame["ProdDate"].between("2024-01-03", "2024-01-05")
+    assert len(rows) == inWindow.sum() > 0
+    assert rows["ProdDate"].min() == "2024-01-03" and rows["ProdDate"].max() == "2024-01-05"
+
+
+def test_select_query_needs_a_customer():
+    with pytest.raises(ValueError):
+        queries.buildSelectQuery([], ["CO2_Fox_g"])
+
+
+def test_needed_columns_swaps_derived_columns_for_their_sources():
+    tableColumns = queries.keyColumns + ["CO2_Fox_g", "CycleSecs", "DAC_CO2_Percent", "AirRelHumid_In"]
+    columns = queries.neededColumns(["CO2 Production Purity-Corrected (kg/hr)", "NotInTable"], tableColumns)
+    assert columns == queries.keyColumns + ["CO2_Fox_g", "CycleSecs", "DAC_CO2_Percent"]
+
+
+# Marks taken with the last cycles of every tower missing, the new rows query + exact cut return just those cycles
+def test_new_rows_are_the_rows_past_the_marks(sqliteConn, processFrame):
+    cutoff = processFrame.groupby("DAC_TowerName").cumcount() < 450
+    marks = queries.highWaterMarks(processFrame[cutoff])
+
+    columns = list(processFrame.columns)
+    sql, params = queries.buildNewRowsQuery(["SN1", "SN2"], columns, marks)
+    fetched = pd.read_sql(sql=sql, con=sqliteConn, params=params)
+    newRows = fetched[queries.newerThanMarks(fetched, marks)]
+
+    pd.testing.assert_frame_equal(sortedRows(newRows), sortedRows(processFrame[~cutoff]), check_dtype=False)
+
+
+def test_towers_without_a_mark_come_back_in_full(sqliteConn, processFrame):
+    marks = queries.highWaterMarks(processFrame[processFrame["DAC_TowerName"] != "SN1-T02"])
+
+    newRows = queries.loadNewRows(sqliteConn, ["SN1", "SN2"], list(processFrame.columns), marks)
+
+    assert set(newRows["DAC_TowerName"]) == {"SN1-T02"}
+    assert len(newRows) == (processFrame["DAC_TowerName"] == "SN1-T02").sum()
+
+
+def test_newer_than_marks_compares_date_time_and_cycle():
+    marks = pd.DataFrame({"ProdDate": ["2024-01-02"], "ProdTime": ["12:00:00"], "CycleNumber": [5]}, index=pd.Index(["T1"], dtype=object))
+    frame = pd.DataFrame({
+        "DAC_TowerName": ["T1", "T1", "T1", "T1", "T1", "T2"],
+        "ProdDate": ["2024-01-01", "2024-01-02", "2024-01-02", "2024-01-02", "2024-01-03", "2024-01-01"],
+        "ProdTime": ["23:00:00", "11:59:59", "12:00:00", "12:00:00", "00:00:00", "00:00:00"],
+        "CycleNumber": [9, 9, 5, 6, 1, 1],
+    })
+
+    assert queries.newerThanMarks(frame, marks).tolist() == [False, False, False, True, True, True]
@@ -0,0 +1,27 @@
+import numpy as np
+
+from processData import regimes
+
+
+def test_bin_count_is_capped_at_a_multiple_of_the_width():
+    values = np.array([0.5, 37.2, np.nan, 99.9, np.inf])
+
+    assert regimes.cappedWidth(values, 5) == 5
+    assert len(regimes.binEdges(values, 5)) - 1 == 20
+
+    width = regimes.cappedWidth(values, 0.01)
+    assert width == 0.2
+    assert len(regimes.binEdges(values, 0.01)) - 1 <= regimes.maxBins
+
+
+def test_cached_span_reads_the_column_once_per_inputs():
+    reads = []
+
+    def values():
+        reads.append(1)
+        return np.array([3.0, np.nan, -2.5], dtype=np.float32)
+
+    assert regimes.cachedSpan(("key", 1, "col"), values) == (-2.5, 3.0)
+    assert regimes.cachedSpan(("key", 1, "col"), values) == (-2.5, 3.0)
+    assert len(reads) == 1
+    assert regimes.spanWidth(None, 5) == 5
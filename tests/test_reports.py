@@ -0,0 +1,34 @@
+import json
+import os
+
+from processData import reports, synthetic
+
+
+# A few cycles of tower past everything in the snapshot, written as a new part (like a sync)
+def addCycles(processFrame, tower):
+    rows = processFrame[processFrame["DAC_TowerName"] == tower].tail(5)
+    synthetic.writeSnapshot(rows.assign(ProdDate="2030-01-01", CycleNumber=rows["CycleNumber"] + 10_000, CO2_Fox_g=rows["CO2_Fox_g"] * 2))
+
+
+def renderedTowers(outDir, **settings):
+    return sorted(tower for _, tower in reports.runReports(outDir, workers=1, maxPoints=500, **settings))
+
+
+def test_incremental_runs_rerender_the_towers_whose_limits_moved(tmp_path, processFrame):
+    synthetic.writeSnapshot(processFrame)
+    towers = sorted(processFrame["DAC_TowerName"].unique())
+
+    allData, perTower = str(tmp_path / "allData"), str(tmp_path / "perTower")
+    assert renderedTowers(allData) == towers
+    assert renderedTowers(perTower, outlierLimits="Per Tower") == towers
+    assert renderedTowers(allData) == []
+
+    # New cycles of one tower move the "All Data" limits of every tower, but only that tower's own limits
+    addCycles(processFrame, "SN1-P01")
+    assert renderedTowers(allData) == towers
+    assert renderedTowers(perTower, outlierLimits="Per Tower") == ["SN1-P01"]
+
+    with open(os.path.join(allData, reports.manifestName)) as file:
+        manifest = json.load(file)
+    limits = {json.dumps(entry["limits"]) for entry in manifest["towers"].values()}
+    assert len(limits) == 1 and os.path.exists(os.path.join(allData, "index.html"))
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from processData import queries, regimes
+from processData.derived import addDerivedColumns
+from processData.outliers import outlierMask, sdWidth
+
+
+valueColumns = ["CO2 Production (kg/hr)", "CO2 Production Purity-Corrected (kg/hr)"]
+towers = ["SN1-P01", "SN1-T02", "SN2-P01"]
+
+
+def assertSameCube(sqlCube, memoryCube):
+    assert sorted(sqlCube.index) == sorted(memoryCube.index)
+    memoryCube = memoryCube.reindex(sqlCube.index)
+    for col in valueColumns:
+        assert (sqlCube[(col, "count")] == memoryCube[(col, "count")]).all()
+        np.testing.assert_allclose(sqlCube[(col, "mean")], memoryCube[(col, "mean")], rtol=1e-9)
+        np.testing.assert_allclose(sqlCube[(col, "std")], memoryCube[(col, "std")], rtol=1e-6)
+
+
+def memoryRows(processFrame, keep=None):
+    frame = processFrame if keep is None else processFrame[keep]
+    return addDerivedColumns(frame[frame["DAC_TowerName"].isin(towers)].reset_index(drop=True), valueColumns)
+
+
+def test_regime_summary_query_matches_regime_cube(sqliteConn, processFrame):
+    towerSummary, sqlCube = queries.loadArraySummaries(sqliteConn, ["SN1", "SN2"], towers, valueColumns, "AirRelHumid_In", 5)
+
+    memoryCube = regimes.regimeCube(memoryRows(processFrame), valueColumns, "AirRelHumid_In", 5)
+    assertSameCube(sqlCube, memoryCube)
+
+    counts = processFrame[processFrame["DAC_TowerName"].isin(towers)].groupby("DAC_TowerName").size()
+    assert towerSummary.set_index("DAC_TowerName")["Total Cycles"].to_dict() == counts.to_dict()
+
+
+def test_summaries_drop_the_same_outliers_as_the_mask(sqliteConn, processFrame):
+    for groupBy in [None, "CustomerName", "DAC_TowerName"]:
+        limits = queries.loadSdLimits(sqliteConn, ["SN1", "SN2"], "CO2_Fox_g", sdWidth, groupBy)
+        _, sqlCube = queries.loadArraySummaries(sqliteConn, ["SN1", "SN2"], towers, valueColumns, "AirRelHumid_In", 5,
+                                                limitColumn="CO2_Fox_g", limits=limits, limitGroupBy=groupBy)
+
+        keep = outlierMask(processFrame, ["CO2_Fox_g"], "3 SD", groupBy)
+        memoryCube = regimes.regimeCube(memoryRows(processFrame, keep), valueColumns, "AirRelHumid_In", 5)
+        assertSameCube(sqlCube, memoryCube)
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from processData import queries, synthetic
+
+
+def test_frame_has_one_row_per_tower_cycle():
+    frame = synthetic.generateFrame(customers=2, towersPerCustomer=3, cyclesPerTower=200, extraColumns=4)
+
+    assert len(frame) == 2 * 3 * 200
+    assert set(queries.keyColumns) <= set(frame.columns)
+    assert [f"Sensor_{i:02d}" for i in range(1, 5)] == [col for col in frame.columns if col.startswith("Sensor_")]
+    assert sorted(frame["DAC_TowerName"].unique()) == sorted(synthetic.towerNames("SN1", 3) + synthetic.towerNames("SN2", 3))
+    assert (frame.groupby("DAC_TowerName").size() == 200).all()
+    assert frame["ProdTime"].str.fullmatch(r"\d\d:\d\d:\d\d").all()
+
+
+def test_same_seed_gives_the_same_frame():
+    first = synthetic.generateFrame(customers=1, towersPerCustomer=2, cyclesPerTower=300, extraColumns=2, seed=7)
+
+    pd.testing.assert_frame_equal(first, synthetic.generateFrame(customers=1, towersPerCustomer=2, cyclesPerTower=300, extraColumns=2, seed=7))
+    other = synthetic.generateFrame(customers=1, towersPerCustomer=2, cyclesPerTower=300, extraColumns=2, seed=8)
+    assert not np.array_equal(first["CO2_Fox_g"].to_numpy(), other["CO2_Fox_g"].to_numpy())